@@ -23,15 +23,20 @@ import logging
 
 from gettext import gettext as _
 
+from sttprofile import stt_profile_enable, stt_profile_phase, stt_profile_report
+
+# This must be known before anything heavy is imported. The option is also
+# registered below so that GApplication accepts it.
+if "--profile-startup" in sys.argv:
+    stt_profile_enable()
+
 import gi
 
 gi.require_version('Gst', '1.0')
 gi.require_version('IBus', '1.0')
-gi.require_version('Adw', '1')
 
 from gi.repository import IBus
 from gi.repository import GLib
-from gi.repository import Adw
 from gi.repository import Gio
 from gi.repository import GObject
 from gi.repository import Gst
@@ -39,10 +44,12 @@ from gi.repository import Gst
 from sttutils import *
 from sttenginefactory import STTEngineFactory
 from sttgstfactory import stt_gst_factory_default
+from sttusagehistory import stt_usage_history
 
 LOG_MSG=logging.getLogger()
 
-class IMApplication(Adw.Application):
+# Gtk and Adw are only needed for the About window, they are loaded then
+class IMApplication(Gio.Application):
     __gtype_name__ = 'IMApplication'
 
     def __init__(self, **kwargs):
@@ -76,6 +83,9 @@ class IMApplication(Adw.Application):
             options.remove("debug")
             LOG_MSG.setLevel(logging.DEBUG)
 
+        if options.contains("profile-startup") == True:
+            options.remove("profile-startup")
+
         # Let the default handler carry on
         return -1
 
@@ -121,28 +131,40 @@ class IMApplication(Adw.Application):
                 sys.exit()
 
         # Just call the function to initialize it and preload engine if need be
-        stt_gst_factory_default()
+        with stt_profile_phase("audio factory"):
+            stt_gst_factory_default()
 
         # Called only when we are the primary instance
-        IBus.init()
-        self.__bus = IBus.Bus()
-        self.__bus.connect("disconnected", self.__bus_disconnected_cb)
-
-        self.__factory = STTEngineFactory(self.__bus)
-        self.__factory.add_engine("stt", GObject.type_from_name("STTEngine"))
-
-        if self.__exec_by_ibus:
-            self.__bus.request_name("org.freedesktop.IBus.STT", 0)
-        else:
-            xml_path=stt_utils_ibus_component_description_path()
-            self.__component = IBus.Component.new_from_file(xml_path)
-            self.__bus.register_component (self.__component)
+        with stt_profile_phase("IBus connection"):
+            IBus.init()
+            self.__bus = IBus.Bus()
+            self.__bus.connect("disconnected", self.__bus_disconnected_cb)
+
+        with stt_profile_phase("engine factory"):
+            self.__factory = STTEngineFactory(self.__bus)
+            self.__factory.add_engine("stt", GObject.type_from_name("STTEngine"))
+
+        with stt_profile_phase("IBus registration"):
+            if self.__exec_by_ibus:
+                self.__bus.request_name("org.freedesktop.IBus.STT", 0)
+            else:
+                xml_path=stt_utils_ibus_component_description_path()
+                self.__component = IBus.Component.new_from_file(xml_path)
+                self.__bus.register_component (self.__component)
 
         # Start a loop
         self.hold()
 
+        GLib.idle_add(self.__report_startup)
+
+    def __report_startup(self):
+        stt_profile_report("main loop reached")
+        return False
+
     def __bus_disconnected_cb(self, bus):
         LOG_MSG.info("bus disconnect")
+        # Changes are saved after a delay, the loop will not run anymore
+        stt_usage_history().flush()
         self.release()
 
 if __name__ == "__main__":
@@ -162,8 +184,8 @@ if __name__ == "__main__":
     locale.bindtextdomain('ibus-stt', None)
     locale.textdomain('ibus-stt')
 
-    Gst.init(sys.argv)
-    Adw.init()
+    with stt_profile_phase("Gst.init"):
+        Gst.init(sys.argv)
 
     app = IMApplication(application_id=stt_utils_get_app_id(),
                         flags=Gio.ApplicationFlags.HANDLES_COMMAND_LINE|
@@ -194,5 +216,12 @@ if __name__ == "__main__":
                         _("Debug"),
                         None,
         )
+    app.add_main_option("profile-startup",
+                        0,
+                        GLib.OptionFlags.NONE,
+                        GLib.OptionArg.NONE,
+                        _("Print how long each step of the startup takes"),
+                        None,
+        )
     return_value=app.run(sys.argv)
     sys.exit(return_value)
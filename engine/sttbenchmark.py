@@ -0,0 +1,904 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Micro-benchmarks for the hot paths of the engine. This file is not installed,
+# it is copied to the engine directory of the build tree (so that sttutils.py
+# can be found). Run it from there, for example:
+#   python3 sttbenchmark.py decoder
+#   python3 sttbenchmark.py dictionary --sizes 1000 10000
+#   python3 sttbenchmark.py numbers --locales en_US fr_FR
+#   python3 sttbenchmark.py downloads --jobs 2 --bandwidth 1024
+#   python3 sttbenchmark.py chunks speech.wav
+#   python3 sttbenchmark.py sources
+#   python3 sttbenchmark.py dsp --file speech.wav
+
+import os
+import sys
+import json
+import time
+import timeit
+import random
+import argparse
+import tempfile
+
+_PARTIAL_PAYLOAD="{\n  \"partial\" : \"the quick brown fox jumps over the lazy dog\"\n}"
+
+_TEXT_PAYLOAD="{\n  \"text\" : \"the quick brown fox jumps over the lazy dog\"\n}"
+
+_ALTERNATIVES_PAYLOAD=json.dumps({"alternatives": [
+    {"confidence": 228.7, "text": " the quick brown fox jumps over the lazy dog"},
+    {"confidence": 226.1, "text": " the quick brown fox jumps over a lazy dog"},
+    {"confidence": 224.9, "text": " the quick brown fox jump over the lazy dog"},
+    {"confidence": 221.3, "text": " a quick brown fox jumps over the lazy dog"},
+    {"confidence": 220.0, "text": " the quick brown fox jumps over the lazy dogs"}]}, indent=2)
+
+def _reference_decode(json_text):
+    # This is how results were decoded before sttvoskresult
+    json_data = json.loads(json_text)
+
+    partial_text = json_data.get("partial")
+    if partial_text != None:
+        return partial_text
+
+    text = json_data.get("text")
+    if text != None:
+        return text
+
+    text_alternatives = []
+    for alternative_iter in json_data.get("alternatives"):
+        text = alternative_iter.get("text")
+        if text not in [None,""]:
+            text_alternatives.append(text.lstrip())
+
+    return text_alternatives
+
+def _print_timing(name, seconds, number):
+    print("%-40s %8.3f µs/call" % (name, seconds*1000000/number))
+
+def _print_duration(name, seconds):
+    print("%-40s %8.1f ms" % (name, seconds*1000))
+
+def _bench_decoder(args):
+    from sttvoskresult import stt_vosk_result_decode
+
+    payloads=[("partial", _PARTIAL_PAYLOAD),
+              ("text", _TEXT_PAYLOAD),
+              ("alternatives", _ALTERNATIVES_PAYLOAD)]
+
+    for name, payload in payloads:
+        # Make sure both give the same results before timing them
+        result=stt_vosk_result_decode(payload)
+        reference=_reference_decode(payload)
+        found=result.alternatives if name == "alternatives" else result.text
+        if found != reference:
+            print("decoder mismatch for %s payload" % name)
+            return 1
+
+        seconds=timeit.timeit(lambda: _reference_decode(payload), number=args.number)
+        _print_timing("json.loads (%s)" % name, seconds, args.number)
+
+        seconds=timeit.timeit(lambda: stt_vosk_result_decode(payload), number=args.number)
+        _print_timing("stt_vosk_result_decode (%s)" % name, seconds, args.number)
+
+    return 0
+
+def _generate_entries(num):
+    # Entries with one to four words out of a vocabulary of 5000 words
+    rand=random.Random(num)
+    vocabulary=["word%i" % word_i for word_i in range(5000)]
+
+    entries={}
+    while len(entries) < num:
+        utterance=" ".join(rand.sample(vocabulary, rand.randint(1, 4)))
+        entries[utterance]="Value %i" % len(entries)
+
+    return entries, vocabulary
+
+class _BenchmarkLocale():
+    # Stands for STTCurrentLocale
+    def __init__(self, formatting=None, locale_str="en_US"):
+        self.formatting=formatting
+        self.overriding=None
+        self.locale=locale_str
+
+    def connect(self, signal, callback):
+        return 0
+
+class _BenchmarkParser():
+    # Stands for STTSegmentProcess
+    def __init__(self):
+        from sttutterancetree import STTParseModes
+        self.mode=STTParseModes.DICTATION
+        self.matches=0
+
+    def add_words(self, words):
+        self.matches+=1
+        return True
+
+def _bench_dictionary(args):
+    from sttutterancetree import STTUtteranceTree
+    from sttcustomfile import stt_custom_file_read, stt_custom_file_write
+
+    for num in args.sizes:
+        entries, vocabulary=_generate_entries(num)
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path=os.path.join(tmp_dir, "custom.tsv")
+            stt_custom_file_write(path, ((value, [utterance], "") for utterance, value in entries.items()))
+
+            start=time.perf_counter()
+            items=stt_custom_file_read(path)
+            _print_duration("TSV import (%i entries)" % num, time.perf_counter()-start)
+
+        # Custom entries go to the phrase dictionary, punctuation to the tree
+        for section in ("custom", "punctuation"):
+            formatting={section: items}
+
+            start=time.perf_counter()
+            tree=STTUtteranceTree(current_locale=_BenchmarkLocale(formatting))
+            _print_duration("load as %s (%i entries)" % (section, num), time.perf_counter()-start)
+
+            words=random.Random(0).choices(vocabulary, k=10000)
+            parser=_BenchmarkParser()
+
+            start=time.perf_counter()
+            word_i=0
+            while word_i < len(words):
+                new_word_i=tree.parse(parser, words, word_i)
+                word_i=new_word_i if new_word_i != word_i else word_i+1
+
+            _print_timing("parse as %s (%i matches)" % (section, parser.matches),
+                          time.perf_counter()-start, len(words))
+
+    return 0
+
+# What STTWordsToDigits should make of these utterances (without the
+# formatting file), one list per shipped grammar. Words that are not part of a
+# number must be kept as they are. The first two are timed as long numeric
+# dictation.
+_NUMBERS_CORPUS={
+    "de_DE": [
+        ("null sechs eins zwei drei vier fünf sechs sieben acht",
+         "0 6 1 2 3 4 5 6 7 8"),
+        ("zwei millionen dreihundert",
+         "2000000 dreihundert"),
+        ("drei tausend vierhundert zwölf euro",
+         "3000 vierhundert 12 €"),
+        ("eins komma fünf",
+         "1,5"),
+        ("zwanzig drei",
+         "23"),
+        ("zehn zwei",
+         "10 2"),
+        ("null komma null fünf",
+         "0,05"),
+        ("eine milliarde und zwei",
+         "1000000000 und 2"),
+        ("erster märz",
+         "1. März"),
+        ("zwanzig prozent",
+         "20 %"),
+        ("drei uhr",
+         "3:00 Uhr"),
+        ("zwölfte",
+         "12."),
+        ("fünf euro und zehn cent",
+         "5,10 €"),
+        ("fünf euro und zwei komma fünf cent",
+         "5 € und 2,5 cent"),
+        ("drei uhr zehn",
+         "3:10 Uhr"),
+    ],
+    "en_US": [
+        ("zero six one two three four five six seven eight nine",
+         "0 6 1 2 3 4 5 6 7 8 9"),
+        ("one million two hundred and thirty four thousand five hundred and sixty seven",
+         "1234567"),
+        ("three point one four one five nine",
+         "3.14159"),
+        ("three point one zero five",
+         "3.105"),
+        ("twenty twenty two",
+         "20 22"),
+        ("ten two",
+         "10 2"),
+        ("a hundred and one dalmatians",
+         "101 dalmatians"),
+        ("zero point zero five percent",
+         "0.05%"),
+        ("five hundred and cats",
+         "500 and cats"),
+        ("one point",
+         "1 point"),
+        ("two thousand three thousand",
+         "2003 1000"),
+        ("twenty first of march at three thirty p m",
+         "March 21st at 3:30 PM"),
+        ("twelve thirty p m",
+         "12:30 PM"),
+        ("thirteen p m",
+         "13 p m"),
+        ("fifteen thirty p m",
+         "15 30 p m"),
+        ("twenty p m",
+         "20 p m"),
+        ("zero a m",
+         "0 a m"),
+        ("thirteen o'clock",
+         "13:00"),
+        ("one two three o'clock",
+         "1 2 3:00"),
+        ("three thirty o'clock",
+         "3 30 o'clock"),
+        ("twelve oh five p m",
+         "12:05 PM"),
+        ("three oh five",
+         "3 oh 5"),
+        ("march twenty first",
+         "March 21st"),
+        ("may first",
+         "May 1st"),
+        ("five dollars and twenty cents",
+         "$5.20"),
+        ("five dollars twenty cents",
+         "$5.20"),
+        ("five dollars and two point five cents",
+         "$5 and 2.5 cents"),
+        ("one hundred and twenty dollars",
+         "$120"),
+        ("fifty percent",
+         "50%"),
+        ("three point five percent",
+         "3.5%"),
+        ("ten o'clock",
+         "10:00"),
+        ("twelve fifteen a m",
+         "12:15 AM"),
+        ("seven pm",
+         "7:00 PM"),
+        ("the twenty first century",
+         "the 21st century"),
+        ("one hundredth",
+         "100th"),
+        ("one hundred and first",
+         "101st"),
+        ("third of may",
+         "May 3rd"),
+        ("three thirty",
+         "3 30"),
+        ("two thousand and twelfth",
+         "2012th"),
+        ("forty second street",
+         "42nd street"),
+        ("the second time",
+         "the second time"),
+        ("twenty fifth of december",
+         "December 25th"),
+    ],
+    "es_ES": [
+        ("cero seis uno dos tres cuatro cinco seis siete ocho",
+         "0 6 1 2 3 4 5 6 7 8"),
+        ("dos mil trescientos veintidós",
+         "2322"),
+        ("mil millones de euros",
+         "1000000000 de euros"),
+        ("tres coma catorce",
+         "3,14"),
+        ("dos cientos cincuenta",
+         "250"),
+        ("veinte uno",
+         "20 1"),
+        ("ciento un",
+         "101"),
+        ("cien mil",
+         "100000"),
+        ("primero de mayo",
+         "1º de mayo"),
+        ("dos de marzo",
+         "2 de marzo"),
+        ("cinco euros con veinte céntimos",
+         "5,20 €"),
+        ("diez por ciento",
+         "10 %"),
+        ("décimo",
+         "10º"),
+        ("segundo",
+         "segundo"),
+    ],
+    "fr_FR": [
+        ("zéro six un deux trois quatre cinq six sept huit",
+         "0 6 1 2 3 4 5 6 7 8"),
+        ("deux millions trois cent quarante mille",
+         "2340000"),
+        ("vingt et un ans",
+         "21 ans"),
+        ("soixante et onze euros",
+         "71 €"),
+        ("trois virgule zéro cinq",
+         "3,05"),
+        ("quatre-vingt-dix-neuf",
+         "99"),
+        ("dix deux",
+         "10 2"),
+        ("mille deux cents",
+         "1200"),
+        ("vingt et un mars",
+         "21 mars"),
+        ("premier mai",
+         "1er mai"),
+        ("le vingt et unième siècle",
+         "le 21e siècle"),
+        ("quinze heures trente",
+         "15 h 30"),
+        ("trois heures",
+         "3 h 00"),
+        ("trois heures quatre-vingt-dix",
+         "3 heures 90"),
+        ("quinze heures soixante-dix",
+         "15 heures 70"),
+        ("pendant trois heures",
+         "pendant 3 heures"),
+        ("dans deux heures trente",
+         "dans 2 heures 30"),
+        ("à trois heures cinq",
+         "à 3 h 05"),
+        ("cinquante pour cent",
+         "50 %"),
+        ("cinq euros et vingt centimes",
+         "5,20 €"),
+        ("cinq euros et deux virgule cinq centimes",
+         "5 € et 2,5 centimes"),
+        ("deux mars",
+         "2 mars"),
+        ("dix-septième",
+         "17e"),
+        ("second",
+         "second"),
+        ("trois virgule cinq pour cent",
+         "3,5 %"),
+        ("le premier",
+         "le premier"),
+    ],
+    "hi_IN": [
+        ("zero nine eight seven six five four three two one",
+         "0 9 8 7 6 5 4 3 2 1"),
+        ("two crore fifty lakh",
+         "25000000"),
+        ("three lac four thousand",
+         "304000"),
+        ("one point five",
+         "1.5"),
+        ("ninety nine hundred",
+         "99 100"),
+        ("twenty twenty",
+         "20 20"),
+        ("twenty first of march",
+         "21st March"),
+        ("five rupees and fifty paise",
+         "₹5.50"),
+        ("five p m",
+         "5:00 PM"),
+    ],
+    "pt_BR": [
+        ("zero seis um dois três quatro cinco seis sete oito",
+         "0 6 1 2 3 4 5 6 7 8"),
+        ("dois mil trezentos",
+         "2300"),
+        ("cem mil",
+         "100000"),
+        ("vinte três",
+         "23"),
+        ("um vírgula cinco",
+         "1,5"),
+        ("cento e vinte e cinco",
+         "125"),
+        ("duzentos e cinquenta",
+         "250"),
+        ("dois de março",
+         "2 de março"),
+        ("dez reais e cinquenta centavos",
+         "R$ 10,50"),
+        ("dez por cento",
+         "10%"),
+        ("décimo",
+         "10º"),
+    ],
+    "ru_RU": [
+        ("один два три четыре пять шесть семь восемь девять",
+         "1 2 3 4 5 6 7 8 9"),
+        ("две тысячи триста",
+         "2300"),
+        ("пять миллионов",
+         "5000000"),
+        ("три целых четырнадцать",
+         "3,14"),
+        ("двадцать два",
+         "22"),
+        ("сто двадцать три тысячи",
+         "123000"),
+        ("пять рублей двадцать копеек",
+         "5,20 ₽"),
+        ("пять рублей две целых пять копеек",
+         "5 ₽ 2,5 копеек"),
+        ("десять процентов",
+         "10 %"),
+        ("девятьсот двадцать",
+         "920"),
+        ("ноль семьсот семь",
+         "0 707"),
+    ],
+    "sk_SK": [
+        ("nula deväť jeden dva tri štyri päť šesť sedem osem",
+         "0 9 1 2 3 4 5 6 7 8"),
+        ("dva tisíc tristo",
+         "2300"),
+        ("jedna celych päť",
+         "1,5"),
+        ("dvadsať dva",
+         "22"),
+        ("sto tisíc",
+         "100000"),
+        ("desať dva",
+         "10 2"),
+        ("päť eur a dvadsať centov",
+         "5,20 €"),
+        ("desať percent",
+         "10 %"),
+    ],
+}
+
+class _BenchmarkWordsParser():
+    # Stands for STTSegmentProcess
+    def __init__(self):
+        self.words=[]
+
+    def add_words(self, words):
+        self.words.append(words)
+        return True
+
+def _numbers_convert(words_to_digits, words):
+    # Same loop as STTSegmentProcess when digits are on
+    parser=_BenchmarkWordsParser()
+    word_i=0
+    while word_i < len(words):
+        new_word_i=words_to_digits.parse(parser, words, word_i)
+        if new_word_i != word_i:
+            word_i=new_word_i
+            continue
+
+        parser.words.append(words[word_i])
+        word_i+=1
+
+    return parser.words
+
+def _bench_numbers(args):
+    from sttwordstodigits import STTWordsToDigits
+
+    for locale_str in args.locales:
+        words_to_digits=STTWordsToDigits(current_locale=_BenchmarkLocale(locale_str=locale_str),
+                                         data_path=args.data)
+        if words_to_digits.can_use_digits == False:
+            print("no number grammar for %s in %s" % (locale_str, args.data))
+            return 1
+
+        corpus=_NUMBERS_CORPUS.get(locale_str, [])
+        for utterance, expected in corpus:
+            found=" ".join(_numbers_convert(words_to_digits, utterance.split()))
+            if found != expected:
+                print("numbers mismatch for \"%s\" (%s): \"%s\" instead of \"%s\"" % (utterance, locale_str, found, expected))
+                return 1
+
+        if corpus == []:
+            continue
+
+        # Long numeric dictation: phone numbers and amounts. The whole corpus
+        # is also timed for ordinals, percentages, currencies, dates and times.
+        for name, utterance in (("phone numbers", corpus[0][0]),
+                                ("amounts", corpus[1][0]),
+                                ("corpus", " ".join(utterance for utterance, expected in corpus))):
+            words=utterance.split()*1000
+            seconds=timeit.timeit(lambda: _numbers_convert(words_to_digits, words), number=args.number)
+            _print_timing("%s (%s, per word)" % (name, locale_str), seconds/len(words), args.number)
+
+    return 0
+
+def _make_model_archive(directory, size):
+    import zipfile
+
+    data=os.urandom(size)
+    archive_path=os.path.join(directory, "model.zip")
+    with zipfile.ZipFile(archive_path, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr("vosk-model-benchmark/data.bin", data)
+
+    with open(archive_path, "rb") as archive_file:
+        return archive_file.read(), data
+
+def _start_download_server(payload, stats):
+    # Serves payload for any path, with range support like the server of the
+    # models. stats counts bytes sent and simultaneous connections.
+    import threading
+    import http.server
+
+    lock=threading.Lock()
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+
+        def do_GET(self):
+            offset=0
+            range_str=self.headers.get("Range")
+            if range_str is not None and range_str.startswith("bytes=") == True:
+                offset=int(range_str[6:].split("-")[0])
+                if offset >= len(payload):
+                    self.send_response(416)
+                    self.end_headers()
+                    return
+
+                self.send_response(206)
+                self.send_header("Content-Range", "bytes %i-%i/%i" % (offset, len(payload)-1, len(payload)))
+            else:
+                self.send_response(200)
+
+            self.send_header("Content-Length", str(len(payload)-offset))
+            self.end_headers()
+
+            with lock:
+                stats["connections"]+=1
+                stats["max_connections"]=max(stats["max_connections"], stats["connections"])
+
+            try:
+                for start in range(offset, len(payload), 16384):
+                    block=payload[start:start+16384]
+                    self.wfile.write(block)
+                    with lock:
+                        stats["sent"]+=len(block)
+            except OSError:
+                pass
+            finally:
+                with lock:
+                    stats["connections"]-=1
+
+    server=http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def _run_main_loop(condition, timeout):
+    from gi.repository import GLib
+
+    loop=GLib.MainLoop()
+    start=time.monotonic()
+
+    def _check():
+        if condition() == True or time.monotonic()-start > timeout:
+            loop.quit()
+            return False
+
+        return True
+
+    GLib.timeout_add(20, _check)
+    loop.run()
+    return condition()
+
+def _bench_downloads(args):
+    from pathlib import Path
+    from sttdownloadmanager import STTDownloadManager, STTDownloadState
+
+    stats={"sent": 0, "connections": 0, "max_connections": 0}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        payload, data=_make_model_archive(tmp_dir, args.size*1024)
+        server=_start_download_server(payload, stats)
+        url="http://127.0.0.1:%i/" % server.server_address[1]
+        queue_path=os.path.join(tmp_dir, "downloads.json")
+        partial_dir=os.path.join(tmp_dir, "partial")
+
+        # Queue: several models, a limited number at once
+        finished={}
+        manager=STTDownloadManager(queue_path, partial_dir, max_jobs=args.jobs, bandwidth=args.bandwidth)
+        manager.connect("finished", lambda manager, name, success: finished.setdefault(name, success))
+
+        start=time.monotonic()
+        for index in range(args.models):
+            name="model-%i" % index
+            manager.add(name, url + name + ".zip", Path(tmp_dir, "models", name))
+
+        if _run_main_loop(lambda: len(finished) == args.models, 600) == False or all(finished.values()) == False:
+            print("downloads did not complete (%s)" % finished)
+            return 1
+
+        seconds=time.monotonic()-start
+        for index in range(args.models):
+            if Path(tmp_dir, "models", "model-%i" % index, "data.bin").read_bytes() != data:
+                print("model-%i was not installed properly" % index)
+                return 1
+
+        if stats["max_connections"] > args.jobs:
+            print("%i downloads at once instead of %i" % (stats["max_connections"], args.jobs))
+            return 1
+
+        rate=len(payload)*args.models/seconds
+        _print_duration("queue (%i models, %i at once)" % (args.models, args.jobs), seconds)
+        print("%-40s %8.1f KiB/s" % ("transfer rate", rate/1024))
+        if args.bandwidth != 0 and rate > args.bandwidth*1024*1.1:
+            print("transfer rate is over the limit (%i KiB/s)" % args.bandwidth)
+            return 1
+
+        # Pause, "restart" the setup tool and resume: only what is missing is
+        # downloaded again
+        manager=STTDownloadManager(queue_path, partial_dir, max_jobs=1, bandwidth=max(args.size//4, 1))
+        manager.add("paused", url + "paused.zip", Path(tmp_dir, "models", "paused"))
+        partial_path=Path(partial_dir, "paused.part")
+        _run_main_loop(lambda: partial_path.exists() == True and partial_path.stat().st_size > len(payload)//4, 60)
+        manager.pause("paused")
+        _run_main_loop(lambda: manager.get_download("paused").cancellable is None, 10)
+
+        stats["sent"]=0
+        manager=STTDownloadManager(queue_path, partial_dir, max_jobs=1, bandwidth=0)
+        download=manager.get_download("paused")
+        if download is None or download.state != STTDownloadState.PAUSED:
+            print("paused download was not restored")
+            return 1
+
+        finished={}
+        manager.connect("finished", lambda manager, name, success: finished.setdefault(name, success))
+        manager.resume("paused")
+        if _run_main_loop(lambda: "paused" in finished, 60) == False or finished["paused"] == False:
+            print("resumed download did not complete")
+            return 1
+
+        if Path(tmp_dir, "models", "paused", "data.bin").read_bytes() != data:
+            print("resumed model was not installed properly")
+            return 1
+
+        if stats["sent"] >= len(payload):
+            print("download restarted from the beginning after being resumed")
+            return 1
+
+        print("%-40s %8.1f %%" % ("downloaded again after resuming", stats["sent"]*100/len(payload)))
+        server.shutdown()
+
+    return 0
+
+def _bench_chunks(args):
+    # Latency and processing time of partial results for several durations of
+    # audio buffers, with the model of the current locale
+    from stttranscriber import stt_transcriber_read_wav, vosk
+
+    if vosk is None:
+        print("the vosk python module is not available")
+        return 1
+
+    model_path=args.model
+    if model_path is None:
+        from sttcurrentlocale import stt_current_locale
+        from sttvoskmodel import STTVoskModel
+
+        model_path=STTVoskModel(locale_str=stt_current_locale().locale).get_path()
+        if model_path is None:
+            print("no model for the current locale")
+            return 1
+
+    samples, rate=stt_transcriber_read_wav(args.file)
+
+    # The recognizer wants little endian samples
+    if sys.byteorder == "big":
+        samples.byteswap()
+
+    data=samples.tobytes()
+
+    audio_duration=len(samples)/rate
+    vosk.SetLogLevel(-1)
+    model=vosk.Model(model_path)
+
+    print("%8s %16s %18s %18s" % ("buffer", "CPU (ms/s)", "decoding (ms)", "partial delay (ms)"))
+    for duration in args.durations:
+        recognizer=vosk.KaldiRecognizer(model, rate)
+        chunk_size=rate*2*duration//1000
+
+        # Like the vosk element with partial results: one after each buffer
+        decode_times=[]
+        cpu_start=time.process_time()
+        for chunk_start in range(0, len(data), chunk_size):
+            start=time.perf_counter()
+            if recognizer.AcceptWaveform(data[chunk_start:chunk_start+chunk_size]) == False:
+                recognizer.PartialResult()
+            else:
+                recognizer.Result()
+            decode_times.append(time.perf_counter()-start)
+
+        recognizer.FinalResult()
+        cpu_time=time.process_time()-cpu_start
+
+        # Words wait half a buffer on average to be sent and then for it to be
+        # decoded
+        decode_time=sum(decode_times)/len(decode_times)
+        print("%6i ms %16.1f %18.2f %18.1f" % (duration, cpu_time*1000/audio_duration,
+                                              decode_time*1000, duration/2+decode_time*1000))
+
+    return 0
+
+def _bench_sources(args):
+    # Replaces the source of a running pipeline with stand-ins for microphones
+    # and checks that audio goes on without the rest of the pipeline (the vosk
+    # element in the engine) going back to READY.
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+    from sttgstsource import STTGstSource
+
+    Gst.init(None)
+    pipeline=Gst.parse_launch("capsfilter name=AudioCaps caps=audio/x-raw,format=S16LE,rate=16000,channels=1 ! "
+                              "fakesink name=Sink sync=false")
+    sink=pipeline.get_by_name("Sink")
+    caps_filter=pipeline.get_by_name("AudioCaps")
+
+    source=STTGstSource(pipeline, caps_filter,
+                        device="gst:audiotestsrc is-live=true wave=sine",
+                        fallback_device="gst:audiotestsrc is-live=true wave=silence")
+    source.set_caps(caps_filter.get_property("caps"))
+    source.set_blocksize(3200)
+
+    buffer_times=[]
+    sink.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER,
+                                          lambda pad, info: buffer_times.append(time.monotonic()) or Gst.PadProbeReturn.OK)
+
+    sink_states=[]
+    def _bus_message(bus, message):
+        if message.type == Gst.MessageType.ERROR and source.owns(message.src) == True:
+            source.failover()
+        elif message.type == Gst.MessageType.CLOCK_LOST:
+            pipeline.set_state(Gst.State.PAUSED)
+            pipeline.set_state(Gst.State.PLAYING)
+        elif message.type == Gst.MessageType.STATE_CHANGED and message.src == sink:
+            sink_states.append(message.parse_state_changed()[1])
+
+    bus=pipeline.get_bus()
+    bus.add_signal_watch()
+    bus.connect("message", _bus_message)
+
+    pipeline.set_state(Gst.State.PLAYING)
+    if _run_main_loop(lambda: len(buffer_times) >= 10, 5) == False:
+        print("no audio from the first stand-in")
+        return 1
+
+    del sink_states[:]
+    devices=[("other device", "gst:audiotestsrc is-live=true wave=white-noise"),
+             ("failing device", "gst:filesrc location=/nonexistent ! wavparse")]
+    if args.file is not None:
+        # Last since it ends; played in real time like a microphone
+        devices.append(("file", "gst:filesrc location=%s ! wavparse ! audioconvert ! audioresample ! identity sync=true" % args.file))
+
+    for name, device in devices:
+        switch_time=time.monotonic()
+        source.set_device(device)
+        if _run_main_loop(lambda: len(buffer_times) > 0 and buffer_times[-1] > switch_time+0.5, 10) == False:
+            print("audio stopped after switching to %s" % name)
+            return 1
+
+        first_time=min(buffer_time for buffer_time in buffer_times if buffer_time > switch_time)
+        _print_duration("switch to %s (%s)" % (name, source.device[4:30]), first_time-switch_time)
+
+    pipeline.set_state(Gst.State.NULL)
+    source.destroy()
+    bus.remove_signal_watch()
+
+    if Gst.State.READY in sink_states or Gst.State.NULL in sink_states:
+        print("the rest of the pipeline was stopped while switching devices")
+        return 1
+
+    return 0
+
+def _bench_dsp(args):
+    # Processing time of the audio processing chains the settings allow, on a
+    # WAV file or generated noise
+    import gi
+    gi.require_version('Gst', '1.0')
+    from gi.repository import Gst
+    from sttgstdsp import stt_gst_dsp_new
+    from sttgstmonitor import STTGstStageProfiler
+
+    Gst.init(None)
+    if args.file is not None:
+        source="filesrc location=%s ! wavparse ! audioconvert ! audioresample" % args.file
+    else:
+        source="audiotestsrc wave=pink-noise samplesperbuffer=%i num-buffers=%i" % (args.rate//10, args.duration*10)
+
+    chains=[("high pass filter", "none", False, True),
+            ("gain control", "none", True, False)]
+    chains+=[("noise suppression (%s)" % level, level, False, False) for level in ("low", "moderate", "high", "very-high")]
+    chains+=[("default chain", "very-high", True, True)]
+
+    for name, noise_suppression, gain_control, high_pass_filter in chains:
+        pipeline=Gst.parse_launch("%s ! capsfilter name=AudioCaps caps=audio/x-raw,format=S16LE,rate=%i,channels=1 ! "
+                                  "fakesink name=Sink sync=false" % (source, args.rate))
+        caps_filter=pipeline.get_by_name("AudioCaps")
+        sink=pipeline.get_by_name("Sink")
+
+        dsp=stt_gst_dsp_new(noise_suppression, gain_control, high_pass_filter)
+        if dsp is None:
+            print("webrtcdsp is not available")
+            return 1
+
+        pipeline.add(dsp)
+        caps_filter.unlink(sink)
+        caps_filter.link(dsp)
+        dsp.link(sink)
+
+        profiler=STTGstStageProfiler()
+        profiler.add(dsp)
+
+        pipeline.set_state(Gst.State.PLAYING)
+        message=pipeline.get_bus().timed_pop_filtered(Gst.CLOCK_TIME_NONE, Gst.MessageType.EOS|Gst.MessageType.ERROR)
+        pipeline.set_state(Gst.State.NULL)
+        if message.type == Gst.MessageType.ERROR:
+            print("%s failed (%s)" % (name, message.parse_error()[0].message))
+            return 1
+
+        stage_name, processing_time, audio_duration=profiler.get_stats()[0]
+        profiler.destroy()
+        print("%-40s %8.2f ms/s of audio" % (name, processing_time*1000/audio_duration))
+
+    return 0
+
+def main():
+    parser=argparse.ArgumentParser(description="IBus STT micro-benchmarks")
+    subparsers=parser.add_subparsers(dest="benchmark", required=True)
+
+    decoder_parser=subparsers.add_parser("decoder", help="Vosk JSON result decoding")
+    decoder_parser.add_argument("--number", type=int, default=100000)
+    decoder_parser.set_defaults(func=_bench_decoder)
+
+    dictionary_parser=subparsers.add_parser("dictionary", help="Custom shortcuts import, loading and lookup")
+    dictionary_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    dictionary_parser.set_defaults(func=_bench_dictionary)
+
+    numbers_parser=subparsers.add_parser("numbers", help="Words to digits conversion (checked against a golden corpus)")
+    numbers_parser.add_argument("--locales", nargs="+", default=list(_NUMBERS_CORPUS))
+    numbers_parser.add_argument("--data", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, "data", "numbers"),
+                                help="directory with the number grammars (default: the one of the build tree)")
+    numbers_parser.add_argument("--number", type=int, default=10)
+    numbers_parser.set_defaults(func=_bench_numbers)
+
+    downloads_parser=subparsers.add_parser("downloads", help="Model download queue (against a local HTTP server)")
+    downloads_parser.add_argument("--models", type=int, default=3)
+    downloads_parser.add_argument("--jobs", type=int, default=1)
+    downloads_parser.add_argument("--size", type=int, default=4096, help="size of a model (in KiB)")
+    downloads_parser.add_argument("--bandwidth", type=int, default=0, help="limit (in KiB/s), 0 for none")
+    downloads_parser.set_defaults(func=_bench_downloads)
+
+    chunks_parser=subparsers.add_parser("chunks", help="Latency and processing time for durations of audio buffers")
+    chunks_parser.add_argument("file", help="WAV file (mono, 16 bits) with speech")
+    chunks_parser.add_argument("--model", help="path to the Vosk model (default: model of the current locale)")
+    chunks_parser.add_argument("--durations", type=int, nargs="+", default=[25, 50, 100, 200, 400])
+    chunks_parser.set_defaults(func=_bench_chunks)
+
+    sources_parser=subparsers.add_parser("sources", help="Switching audio devices while recording (with stand-ins)")
+    sources_parser.add_argument("--file", help="WAV file (longer than a second) to use as a device as well")
+    sources_parser.set_defaults(func=_bench_sources)
+
+    dsp_parser=subparsers.add_parser("dsp", help="Processing time of the audio processing chains")
+    dsp_parser.add_argument("--file", help="WAV file (default: generated noise)")
+    dsp_parser.add_argument("--duration", type=int, default=60, help="duration of generated noise (in seconds)")
+    dsp_parser.add_argument("--rate", type=int, default=16000, choices=[8000, 16000, 32000, 48000])
+    dsp_parser.set_defaults(func=_bench_dsp)
+
+    args=parser.parse_args()
+    return args.func(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -26,17 +26,26 @@ import gi
 gi.require_version('Gtk', '4.0')
 gi.require_version('Adw', '1')
 
+import csv
+
 from gi.repository import Gtk, Gio, Adw
 
 from sttutils import *
 from sttlocalerow import STTLocaleRow
+from sttlocaleitem import STTLocaleItem
+from sttmodelchooserdialog import STTModelChooserDialog
 from sttshortcutrow import STTShortcutRow
+from sttshortcutitem import STTShortcutItem
 from sttshortcutdialog import STTShortcutDialog
+from sttcustomfile import stt_custom_file_read, stt_custom_file_write
 
+from sttsettings import stt_settings
 from sttcurrentlocale import stt_current_locale
 from sttvoskmodelmanagers import stt_vosk_online_model_manager
+from sttdownloadmanager import stt_download_manager
 
-from sttgstvosk import STTGstVosk
+from sttvoskmodel import STTVoskModel
+from sttgstfactory import STTGstFactory
 
 LOG_MSG=logging.getLogger()
 
@@ -45,9 +54,11 @@ class STTConfigDialog (Adw.PreferencesWindow):
     __gtype_name__="STTConfigDialog"
 
     localelistbox=Gtk.Template.Child()
+    locale_list_view=Gtk.Template.Child()
 
     default_locale_switch=Gtk.Template.Child()
     preload_model_switch=Gtk.Template.Child()
+    predictive_preload_switch=Gtk.Template.Child()
     active_on_start_switch=Gtk.Template.Child()
 
     cancel_button=Gtk.Template.Child()
@@ -57,6 +68,8 @@ class STTConfigDialog (Adw.PreferencesWindow):
     diacriticslistbox=Gtk.Template.Child()
     punctuationlistbox=Gtk.Template.Child()
     customlistbox=Gtk.Template.Child()
+    custom_list_view=Gtk.Template.Child()
+    custom_search_entry=Gtk.Template.Child()
 
     commands_row=Gtk.Template.Child()
     case_row=Gtk.Template.Child()
@@ -78,32 +91,63 @@ class STTConfigDialog (Adw.PreferencesWindow):
         self._valid_formatting_file=False
         self._valid_override_file=False
 
-        self._settings=Gio.Settings.new("org.freedesktop.ibus.engine.stt")
+        self._settings=stt_settings().gsettings
         self._settings.bind("preload", self.preload_model_switch, "active", Gio.SettingsBindFlags.DEFAULT)
+        self._settings.bind("predictive-preload", self.predictive_preload_switch, "active", Gio.SettingsBindFlags.DEFAULT)
+        self._settings.bind("preload", self.predictive_preload_switch, "sensitive", Gio.SettingsBindFlags.GET|Gio.SettingsBindFlags.INVERT_BOOLEAN)
         self._settings.bind("active-on-start", self.active_on_start_switch, "active", Gio.SettingsBindFlags.DEFAULT)
 
         self._locales = {}
         self._values_dict={}
         self._utterances_dict={}
+
+        # Custom shortcuts are items in a list model. Only those that are
+        # visible get a row.
+        self._custom_store=Gio.ListStore.new(STTShortcutItem)
+        self._custom_items_pending=[]
+        self._custom_search_text=""
+        self._custom_filter=Gtk.CustomFilter.new(self._custom_filter_func)
+        self._custom_filter_model=Gtk.FilterListModel.new(self._custom_store, self._custom_filter)
+
+        factory=Gtk.SignalListItemFactory()
+        factory.connect("setup", self._custom_row_setup_cb)
+        factory.connect("bind", self._custom_row_bind_cb)
+        factory.connect("unbind", self._custom_row_unbind_cb)
+        self.custom_list_view.set_factory(factory)
+        self.custom_list_view.set_model(Gtk.NoSelection.new(self._custom_filter_model))
         self._no_model_toast=None
         self._unsupported_locale_toast=None
 
         # Make sure it is initialized before what follows
         stt_vosk_online_model_manager()
 
+        # Downloads queued before the setup tool was last closed go on
+        stt_download_manager()
+
         # Load current locale
         self._current_locale = stt_current_locale()
         self._locale_sig_id=self._current_locale.connect("changed", self._locale_changed_cb)
         self._override_file_changed_id=self._current_locale.connect("override-file-changed", self._override_file_changed_cb)
-        self._override_file_written=False
+
+        # Locales are items in a list model as well. Rows share a radio group
+        # whose (hidden) first button is not a row since rows are recycled.
+        self._locale_store=Gio.ListStore.new(STTLocaleItem)
+        self._locale_group=Gtk.CheckButton()
+
+        factory=Gtk.SignalListItemFactory()
+        factory.connect("setup", self._locale_row_setup_cb)
+        factory.connect("bind", self._locale_row_bind_cb)
+        factory.connect("unbind", self._locale_row_unbind_cb)
+        self.locale_list_view.set_factory(factory)
+        self.locale_list_view.set_model(Gtk.NoSelection.new(self._locale_store))
 
         # Add system locale first (even if it's not a supported locale).
         system_locale=locale.getlocale()[0]
-        self._add_locale_row(system_locale)
+        locales=[system_locale]
 
         # If current locale is not system locale, add it then.
         if system_locale != self._current_locale.locale:
-            self._add_locale_row(self._current_locale.locale)
+            locales.append(self._current_locale.locale)
 
         # Load all available locales
         supported_locales=stt_vosk_online_model_manager().supported_locales()
@@ -114,26 +158,33 @@ class STTConfigDialog (Adw.PreferencesWindow):
             if locale_str in [self._current_locale.locale, system_locale]:
                 continue
 
-            LOG_MSG.debug("loading %s", locale_str)
-            self._add_locale_row(locale_str)
+            locales.append(locale_str)
+
+        items=[]
+        for locale_str in locales:
+            self._locales[locale_str]=STTLocaleItem(locale_str)
+            items.append(self._locales[locale_str])
+
+        self._locale_store.splice(0, 0, items)
 
         # This updates _valid_formatting_file and _valid_override_file
         self._load_utterances()
 
-        # Force preloading for the recognition engine whatever the DCONF settings
-        self._engine=STTGstVosk(current_locale=self._current_locale)
-        self._engine.connect("model-changed", self._engine_model_changed_cb)
-        self._engine.preload()
+        # The recognition engine (and its model) is only loaded if alternative
+        # utterances are recognized in a STTShortcutDialog. Until then, only
+        # tell whether there is a model.
+        self._engine=STTGstFactory(preload=False).new_engine()
+
+        self._model=None
+        self._set_model()
 
-        LOG_MSG.debug("model exists %s", self._engine.has_model())
+        LOG_MSG.debug("model exists %s", self._model.available())
 
         # Update sensitivity and such
         if self.default_locale_switch.get_active() != self._current_locale.default_locale:
             self.default_locale_switch.set_active(self._current_locale.default_locale)
 
-        self._set_locale_rows_sensitivity()
-
-        if self._engine.has_model() == False:
+        if self._model.available() == False:
             self._engine_has_no_model()
 
         if self._valid_formatting_file == False:
@@ -145,27 +196,39 @@ class STTConfigDialog (Adw.PreferencesWindow):
         self.insert_action_group("toast", action_group)
         self._toast_action.connect("activate", self._manage_model_action_activated)
 
-    def _set_locale_rows_sensitivity(self):
-        for row in self._locales.values():
-            if row.check_button.get_active() == True:
-                row.set_sensitive(True)
-            else:
-                row.set_sensitive(not self._current_locale.default_locale)
-
-    def _add_locale_row(self, locale_str):
-        if len(self._locales) == 0:
-            row = STTLocaleRow(current_locale=self._current_locale, locale_str=locale_str, radio_group=None)
-        elif self._locales.get(locale_str, None) != None:
+    def _add_locale_item(self, locale_str):
+        if self._locales.get(locale_str, None) != None:
             LOG_MSG.error("the locale is already included (%s)", locale_str)
             return
-        else:
-            # Get first row of the group to associate it
-            # Note: we cannot rely on the fact there is at least one row
-            row = next(iter(self._locales.items()))[1]
-            row = STTLocaleRow(current_locale=self._current_locale, locale_str=locale_str, radio_group=row.check_button)
 
-        self.localelistbox.add(row)
-        self._locales[locale_str]=row
+        item=STTLocaleItem(locale_str)
+        self._locale_store.append(item)
+        self._locales[locale_str]=item
+
+    def _locale_row_setup_cb(self, factory, list_item):
+        row=STTLocaleRow(current_locale=self._current_locale, radio_group=self._locale_group)
+        row.connect("manage-model", self._locale_row_manage_model_cb)
+        list_item.set_child(row)
+
+    def _locale_row_bind_cb(self, factory, list_item):
+        list_item.get_child().set_item(list_item.get_item())
+
+    def _locale_row_unbind_cb(self, factory, list_item):
+        list_item.get_child().set_item(None)
+
+    @Gtk.Template.Callback()
+    def locale_list_view_activate_cb(self, list_view, position):
+        item=self._locale_store.get_item(position)
+        if item is not None and self._current_locale.default_locale == False:
+            self._current_locale.locale=item.locale
+
+    def _locale_row_manage_model_cb(self, row):
+        self._manage_model(row.locale)
+
+    def _manage_model(self, locale_str):
+        window=STTModelChooserDialog(model=STTVoskModel(locale_str=locale_str))
+        window.set_transient_for(self)
+        window.present()
 
     def _empty_shortcut_page(self):
         self._valid_formatting_file_path=False
@@ -173,9 +236,12 @@ class STTConfigDialog (Adw.PreferencesWindow):
         self._valid_override_file=False
 
         # Empty all utterances listboxes
-        for row in self._values_dict.values():
-            listbox=row.pref_group
-            listbox.remove(row)
+        for item in self._values_dict.values():
+            if item.row is not None:
+                item.pref_group.remove(item.row)
+
+        self._custom_store.remove_all()
+        self._custom_items_pending=[]
 
         self.commands_row.set_visible(False)
         self.case_row.set_visible(False)
@@ -187,16 +253,16 @@ class STTConfigDialog (Adw.PreferencesWindow):
 
     def _load_current_locale(self):
         # Make sure locale exists
-        row = self._locales.get(self._current_locale.locale, None)
-        if row == None:
+        item = self._locales.get(self._current_locale.locale, None)
+        if item == None:
             # Current locale is not in the list (and is probably not supported)
-            self._add_locale_row(self._current_locale.locale)
+            self._add_locale_item(self._current_locale.locale)
 
         self._empty_shortcut_page()
         self._load_utterances()
 
         # This toast has precedence over the next
-        if self._engine.has_model() == False:
+        if self._model.available() == False:
             self._engine_has_no_model()
             return
 
@@ -214,17 +280,21 @@ class STTConfigDialog (Adw.PreferencesWindow):
         if self.default_locale_switch.get_active() != self._current_locale.default_locale:
             self.default_locale_switch.set_active(self._current_locale.default_locale)
 
-        self._set_locale_rows_sensitivity()
+        self._set_model()
 
         # Try to load formatting file
         self._load_current_locale()
 
     def _override_file_changed_cb(self, current_locale, deleted):
-        if deleted == False and self._override_file_written == False:
+        # Don't reload what we have just written
+        if deleted == False and current_locale.own_override_write == False:
             LOG_MSG.debug("override file changed")
             self._load_current_locale()
 
-        self._override_file_written=False
+    def do_close_request(self):
+        # Make sure the last changes are written
+        self._current_locale.flush_overriding()
+        return Adw.PreferencesWindow.do_close_request(self)
 
     def _error_dialog_response_cb(self, dialog, response):
         dialog.destroy()
@@ -245,8 +315,6 @@ class STTConfigDialog (Adw.PreferencesWindow):
         else: # Set the current one
             self._current_locale.locale=self._current_locale.locale
 
-        self._set_locale_rows_sensitivity()
-
     @Gtk.Template.Callback()
     def new_formatting_file_button_clicked_cb(self, button):
         dialog=Gtk.FileChooserDialog(transient_for=self, title=_("Open Formatting File"), modal=True, action=Gtk.FileChooserAction.OPEN)
@@ -286,7 +354,6 @@ class STTConfigDialog (Adw.PreferencesWindow):
 
     def _apply_change(self):
         LOG_MSG.debug("override file being written")
-        self._override_file_written=True
 
         json_data={}
         command_values=[]
@@ -301,82 +368,237 @@ class STTConfigDialog (Adw.PreferencesWindow):
         json_data["custom"]=custom_values
 
         write_changes=False
-        for row in self._values_dict.values():
-            value=row.get_json_data()
+        for item in self._values_dict.values():
+            value=item.get_json_data()
             if value == None:
                 continue
 
             write_changes=True
-            if row.pref_group == self.commandslistbox:
+            if item.pref_group == self.commandslistbox:
                 command_values.append(value)
-            elif row.pref_group == self.caselistbox:
+            elif item.pref_group == self.caselistbox:
                 case_values.append(value)
-            elif row.pref_group == self.diacriticslistbox:
+            elif item.pref_group == self.diacriticslistbox:
                 diacritics_values.append(value)
-            elif row.pref_group == self.punctuationlistbox:
+            elif item.pref_group == self.punctuationlistbox:
                 punctuation_values.append(value)
-            elif row.pref_group == self.customlistbox:
+            elif item.pref_group == self.customlistbox:
                 custom_values.append(value)
 
         if write_changes == True:
             self._current_locale.overriding=json_data
 
+    def _add_shortcut_item(self, listbox, value, **kwargs):
+        # Custom shortcuts are added to the list model with
+        # _flush_custom_items(), the others get a row right away.
+        if listbox == self.customlistbox:
+            item=STTShortcutItem(value=value, pref_group=listbox, **kwargs)
+            self._custom_items_pending.append(item)
+        else:
+            row=STTShortcutRow(value=value, pref_group=listbox, **kwargs)
+            listbox.add(row)
+            row.connect("activated", self.shortcut_row_activated_cb)
+            row.connect("delete", self.shortcut_row_deleted_cb)
+            row.connect("reset", self.shortcut_row_reset_cb)
+            item=row.item
+
+        if isinstance(value, (list, tuple)):
+            self._values_dict[value[0]]=item
+        else:
+            self._values_dict[value]=item
+
+        return item
+
+    def _flush_custom_items(self):
+        # Adding all items at once is much faster
+        if self._custom_items_pending == []:
+            return
+
+        self._custom_store.splice(self._custom_store.get_n_items(), 0, self._custom_items_pending)
+        self._custom_items_pending=[]
+
+    def _remove_shortcut_item(self, item):
+        if item.row is not None:
+            item.pref_group.remove(item.row)
+            return
+
+        found, position=self._custom_store.find(item)
+        if found == True:
+            self._custom_store.remove(position)
+
+    def _custom_row_setup_cb(self, factory, list_item):
+        row=STTShortcutRow()
+        row.connect("delete", self.shortcut_row_deleted_cb)
+        row.connect("reset", self.shortcut_row_reset_cb)
+        list_item.set_child(row)
+
+    def _custom_row_bind_cb(self, factory, list_item):
+        list_item.get_child().set_item(list_item.get_item())
+
+    def _custom_row_unbind_cb(self, factory, list_item):
+        list_item.get_child().set_item(None)
+
+    def _custom_filter_func(self, item):
+        if self._custom_search_text == "":
+            return True
+
+        return item.matches(self._custom_search_text)
+
+    @Gtk.Template.Callback()
+    def custom_search_changed_cb(self, entry):
+        self._custom_search_text=entry.get_text().strip().lower()
+        self._custom_filter.changed(Gtk.FilterChange.DIFFERENT)
+
+    @Gtk.Template.Callback()
+    def custom_list_view_activate_cb(self, list_view, position):
+        item=self._custom_filter_model.get_item(position)
+        if item is not None:
+            self.present_shortcut_dialog(item)
+
     def shortcut_row_reset_cb(self, row):
         # After a row is reset remove extra utterances from global dictionary
-        for utterance in row._extra_utterances:
+        for utterance in row.item._extra_utterances:
             self._utterances_dict.pop(utterance)
 
         self._apply_change()
 
     def shortcut_row_deleted_cb(self, row):
-        self._values_dict.pop(row.value)
-        for utterance in row.utterances:
+        item=row.item
+        self._values_dict.pop(item.value)
+        for utterance in item.utterances:
             self._utterances_dict.pop(utterance)
-        for utterance in row._extra_utterances:
+        for utterance in item._extra_utterances:
             self._utterances_dict.pop(utterance)
 
-        parent = row.get_parent()
-        parent.remove(row)
-
+        self._remove_shortcut_item(item)
         self._apply_change()
 
     def shortcut_dialog_response_cb(self, dialog, response):
         if response == Gtk.ResponseType.APPLY:
             # Modification
-            (added_utterances, removed_utterances)=dialog.apply_to_row()
+            item=dialog.item
+            old_value=item.value
+            (added_utterances, removed_utterances)=dialog.apply_to_item()
             for utterance in added_utterances:
                 self._utterances_dict[utterance] = True
             for utterance in removed_utterances:
                 self._utterances_dict.pop(utterance)
 
+            # The value of custom shortcuts can be changed
+            if item.value != old_value:
+                self._values_dict.pop(old_value, None)
+                self._values_dict[item.value]=item
+
             self._apply_change()
         elif response == Gtk.ResponseType.OK:
             # Addition
-            row = dialog.get_new_row()
-            row.pref_group=self.customlistbox
-            self.customlistbox.add(row)
-            row.connect("activated", self.shortcut_row_activated_cb)
-            row.connect("delete", self.shortcut_row_deleted_cb)
-            row.connect("reset", self.shortcut_row_reset_cb)
+            item = dialog.get_new_item()
+            item.pref_group=self.customlistbox
+            self._custom_items_pending.append(item)
+            self._flush_custom_items()
 
             # It can't be a diacritic sign as the shortcut was created
-            self._values_dict[row.value]=row
+            self._values_dict[item.value]=item
 
             # Only _extra_utterances can be added
-            for utterance in row._extra_utterances:
+            for utterance in item._extra_utterances:
                 self._utterances_dict[utterance] = True
 
             self._apply_change()
 
         dialog.destroy()
 
-    def present_shortcut_dialog(self, row):
-        dialog = STTShortcutDialog(row=row, engine=self._engine, transient_for=self)
+    def present_shortcut_dialog(self, item):
+        dialog = STTShortcutDialog(item=item, engine=self._engine, transient_for=self)
         dialog.connect("response", self.shortcut_dialog_response_cb)
         dialog.present()
 
     def shortcut_row_activated_cb(self, row):
-        self.present_shortcut_dialog(row)
+        self.present_shortcut_dialog(row.item)
+
+    def _import_shortcuts(self, path):
+        try:
+            imported_items=stt_custom_file_read(path)
+        except (OSError, UnicodeDecodeError, csv.Error) as error:
+            LOG_MSG.error("could not import shortcuts (%s)", error)
+            self.add_toast(Adw.Toast(title=_("Shortcuts could not be imported")))
+            return
+
+        imported_num=0
+        for imported_item in imported_items:
+            # Each occurrence has to be unique
+            utterances=[utterance for utterance in imported_item["utterances"]
+                        if self._utterances_dict.get(utterance, False) == False]
+            if utterances == []:
+                continue
+
+            for utterance in utterances:
+                self._utterances_dict[utterance] = True
+
+            value=imported_item["value"]
+            description=imported_item.get("description", "")
+            item=self._values_dict.get(value, None)
+            if item is None:
+                self._add_shortcut_item(self.customlistbox,
+                                        value,
+                                        extra_utterances=utterances,
+                                        description=description,
+                                        editable=True)
+            else:
+                item.add_extra_utterances(utterances)
+
+            imported_num+=1
+
+        self._flush_custom_items()
+
+        LOG_MSG.info("%i shortcuts imported", imported_num)
+        self.add_toast(Adw.Toast(title=_("%i shortcuts imported") % imported_num))
+        if imported_num != 0:
+            self._apply_change()
+
+    def _export_shortcuts(self, path):
+        items=((item.value, item._get_all_unique_utterances(), item.description)
+               for item in self._custom_store)
+        try:
+            stt_custom_file_write(path, items)
+        except (OSError, csv.Error) as error:
+            LOG_MSG.error("could not export shortcuts (%s)", error)
+            self.add_toast(Adw.Toast(title=_("Shortcuts could not be exported")))
+
+    def _shortcuts_file_response_cb(self, dialog, response):
+        if response != Gtk.ResponseType.ACCEPT:
+            dialog.destroy()
+            return
+
+        path=dialog.get_file().get_path()
+        action=dialog.get_action()
+        dialog.destroy()
+
+        if action == Gtk.FileChooserAction.OPEN:
+            self._import_shortcuts(path)
+        else:
+            self._export_shortcuts(path)
+
+    def _present_shortcuts_file_dialog(self, title, action, button_label):
+        dialog=Gtk.FileChooserDialog(transient_for=self, title=title, modal=True, action=action)
+        dialog.add_buttons(_("Cancel"), Gtk.ResponseType.CANCEL, button_label, Gtk.ResponseType.ACCEPT)
+
+        file_filter=Gtk.FileFilter()
+        file_filter.set_name(_("CSV and TSV files"))
+        file_filter.add_suffix("csv")
+        file_filter.add_suffix("tsv")
+        dialog.add_filter(file_filter)
+
+        dialog.connect("response", self._shortcuts_file_response_cb)
+        dialog.present()
+
+    @Gtk.Template.Callback()
+    def import_shortcuts_clicked_cb(self, button):
+        self._present_shortcuts_file_dialog(_("Import Shortcuts"), Gtk.FileChooserAction.OPEN, _("Import"))
+
+    @Gtk.Template.Callback()
+    def export_shortcuts_clicked_cb(self, button):
+        self._present_shortcuts_file_dialog(_("Export Shortcuts"), Gtk.FileChooserAction.SAVE, _("Export"))
 
     @Gtk.Template.Callback()
     def new_shortcut_clicked_cb(self, button):
@@ -401,9 +623,11 @@ class STTConfigDialog (Adw.PreferencesWindow):
             utterances=item.get("utterances")
             description=item.get("description")
 
-            # In case there is only one
+            # In case there is only one. Note: documents are read-only.
             if isinstance(utterances,str):
                 utterances = [utterances]
+            else:
+                utterances = list(utterances)
 
             # Each occurrence has to be unique
             for utterance in utterances[:]:
@@ -415,31 +639,23 @@ class STTConfigDialog (Adw.PreferencesWindow):
 
                 self._utterances_dict[utterance] = True
 
-            if isinstance(value,list):
-                row=self._values_dict.get(value[0], None)
+            if isinstance(value, (list, tuple)):
+                shortcut_item=self._values_dict.get(value[0], None)
             else:
-                row=self._values_dict.get(value, None)
+                shortcut_item=self._values_dict.get(value, None)
 
-            if row == None:
+            if shortcut_item == None:
                 if utterances == []:
                     continue
 
-                row=STTShortcutRow(value=value,
-                                   utterances=utterances,
-                                   description=description,
-                                   editable=False,
-                                   pref_group=listbox)
-                listbox.add(row)
-                row.connect("activated", self.shortcut_row_activated_cb)
-                row.connect("reset", self.shortcut_row_reset_cb)
-
-                if isinstance(value, list):
-                    self._values_dict[value[0]]=row
-                else:
-                    self._values_dict[value]=row
+                self._add_shortcut_item(listbox,
+                                        value,
+                                        utterances=utterances,
+                                        description=description,
+                                        editable=False)
             else:
-                row.utterances=list(set(row.utterances)|set(utterances))
-                row.description=description
+                shortcut_item.utterances=list(set(shortcut_item.utterances)|set(utterances))
+                shortcut_item.description=description
 
     def _load_formatting_file(self):
         LOG_MSG.debug("loading formatting file")
@@ -471,9 +687,11 @@ class STTConfigDialog (Adw.PreferencesWindow):
             description=item.get("description")
 
             if utterances not in (None,[]):
-                # In case there is only one
+                # In case there is only one. Note: documents are read-only.
                 if isinstance(utterances, str):
                     utterances = [utterances]
+                else:
+                    utterances = list(utterances)
 
                 # Each occurrence has to be unique
                 for utterance in utterances[:]:
@@ -487,31 +705,23 @@ class STTConfigDialog (Adw.PreferencesWindow):
 
             # See if a row with same value already exists.
             # Check in all the listbox
-            if isinstance(value,list):
-                row=self._values_dict.get(value[0], None)
+            if isinstance(value, (list, tuple)):
+                shortcut_item=self._values_dict.get(value[0], None)
             else:
-                row=self._values_dict.get(value, None)
+                shortcut_item=self._values_dict.get(value, None)
 
-            if row != None:
+            if shortcut_item != None:
                 if description != None:
-                    row.description = description
+                    shortcut_item.description = description
 
                 if utterances not in (None,[]):
-                    row.add_extra_utterances(utterances)
+                    shortcut_item.add_extra_utterances(utterances)
             elif utterances not in (None,[]):
-                row=STTShortcutRow(value=value,
-                                   extra_utterances=utterances,
-                                   description=description,
-                                   editable=True,
-                                   pref_group=listbox)
-                listbox.add(row)
-                row.connect("delete", self.shortcut_row_deleted_cb)
-                row.connect("reset", self.shortcut_row_reset_cb)
-                row.connect("activated", self.shortcut_row_activated_cb)
-                if isinstance(value, list):
-                    self._values_dict[value[0]]=row
-                else:
-                    self._values_dict[value]=row
+                self._add_shortcut_item(listbox,
+                                        value,
+                                        extra_utterances=utterances,
+                                        description=description,
+                                        editable=True)
 
     def _load_overriding_file(self):
         # Load custom formatting file as well. Note: it overrides existing keys
@@ -535,11 +745,10 @@ class STTConfigDialog (Adw.PreferencesWindow):
             self._empty_shortcut_page()
 
         self._load_overriding_file()
+        self._flush_custom_items()
 
     def _manage_model_action_activated(self, action, param):
-        # Get row for current locale
-        row = self._locales.get(self._current_locale.locale, None)
-        row.manage_model()
+        self._manage_model(self._current_locale.locale)
 
     def _toast_dismissed(self, toast):
         if toast == self._no_model_toast:
@@ -579,8 +788,18 @@ class STTConfigDialog (Adw.PreferencesWindow):
         self._no_model_toast.connect("dismissed", self._toast_dismissed)
         self.add_toast(self._no_model_toast)
 
-    def _engine_model_changed_cb(self, engine):
-        if engine.has_model() == False:
+    def _set_model(self):
+        if self._model is not None:
+            if self._model.get_locale() == self._current_locale.locale:
+                return
+
+            self._model.disconnect_by_func(self._model_changed_cb)
+
+        self._model=STTVoskModel(locale_str=self._current_locale.locale)
+        self._model.connect("changed", self._model_changed_cb)
+
+    def _model_changed_cb(self, model):
+        if model.available() == False:
             self._engine_has_no_model()
         elif self._no_model_toast != None:
             self._no_model_toast.dismiss()
@@ -16,21 +16,91 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import os
 import json
+import stat
 import locale
 import logging
+import tempfile
+import threading
 
 from pathlib import Path
+from types import MappingProxyType
 
-from gi.repository import Gio, GObject
+from gi.repository import Gio, GLib, GObject
 
 from sttutils import stt_utils_get_local_config_path, stt_utils_get_system_data_path
+from sttsettings import stt_settings
 
 LOG_MSG=logging.getLogger()
 
 def stt_current_locale_helper_get_override_path(locale_str):
     return str(Path(stt_utils_get_local_config_path(), "overrides-" + locale_str + ".json"))
 
+# Parsed JSON files, shared by all users: path -> (mtime, size, data)
+_JSON_CACHE={}
+
+def _helper_freeze_json(json_data):
+    # Documents are shared so make sure nobody modifies them
+    if isinstance(json_data, dict):
+        return MappingProxyType({key: _helper_freeze_json(value) for key, value in json_data.items()})
+
+    if isinstance(json_data, list):
+        return tuple(_helper_freeze_json(value) for value in json_data)
+
+    return json_data
+
+def _helper_invalidate_json_file(json_path):
+    _JSON_CACHE.pop(str(json_path), None)
+
+# Changes of the overriding file made within this delay (in ms) are written at once
+_OVERRIDE_WRITE_DELAY = 500
+
+def _helper_new_file_mode():
+    # Permissions open() gives to new files, the umask can only be read by
+    # changing it (this is called at import time, before any thread starts)
+    umask=os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+_NEW_FILE_MODE=_helper_new_file_mode()
+
+def _helper_write_file_atomic(path, content):
+    # Returns False if there was no need to write the file. Readers (the file
+    # monitor, other processes) never see a partially written file.
+    try:
+        if path.read_text() == content:
+            return False
+    except OSError:
+        pass
+
+    # Ensure the path to our directory has been created
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    try:
+        mode=stat.S_IMODE(path.stat().st_mode)
+    except OSError:
+        mode=_NEW_FILE_MODE
+
+    fd, tmp_path=tempfile.mkstemp(dir=str(path.parent), prefix="." + path.name, suffix=".tmp")
+    try:
+        # mkstemp() creates files that only the user can read
+        os.chmod(tmp_path, mode)
+        with os.fdopen(fd, "w") as tmp_file:
+            tmp_file.write(content)
+            tmp_file.flush()
+            os.fsync(tmp_file.fileno())
+
+        os.replace(tmp_path, str(path))
+    except OSError:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    return True
+
 class STTCurrentLocale(GObject.Object):
     __gtype_name__="STTCurrentLocale"
 
@@ -45,12 +115,19 @@ class STTCurrentLocale(GObject.Object):
         self._locale=""
         self._formatting_file_path=""
 
-        self._settings=Gio.Settings.new("org.freedesktop.ibus.engine.stt")
+        self._settings=stt_settings().gsettings
         self._locale_changed_id=self._settings.connect("changed::locale", self._locale_changed)
-        self._locale_paths_changed_id=self._settings.connect("changed::locale-paths", self._locale_paths_changed)
+        stt_settings().connect("locale-path-changed", self._locale_paths_changed)
 
         self._monitor = None
 
+        # Pending write of the overriding file: (path, JSON data)
+        self._pending_override=None
+        self._override_write_id=0
+        self._override_thread=None
+        self._own_override_writes=0
+        self.own_override_write=False
+
         locale_str=self._settings.get_string("locale")
         locale_str=self._check_default_locale(locale_str)
         self._set_locale(locale_str)
@@ -60,7 +137,15 @@ class STTCurrentLocale(GObject.Object):
                               Gio.FileMonitorEvent.DELETED):
             return
 
+        _helper_invalidate_json_file(file.get_path())
+
+        # Let listeners know whether it is one of our own writes
+        if event_type != Gio.FileMonitorEvent.DELETED and self._own_override_writes > 0:
+            self._own_override_writes-=1
+            self.own_override_write=True
+
         self.emit("override-file-changed", bool(event_type == Gio.FileMonitorEvent.DELETED))
+        self.own_override_write=False
 
     def _set_formatting_file_path(self, path):
         if path == self._formatting_file_path:
@@ -72,39 +157,55 @@ class STTCurrentLocale(GObject.Object):
         self.emit("changed")
 
     def _get_formatting_file_from_settings(self):
-        paths_json_string = self._settings.get_string("locale-paths")
-        if paths_json_string in (None,"None",""):
-            return None
-
-        paths_dict=json.loads(paths_json_string)
-        return paths_dict.get(self._locale, None)
+        return stt_settings().get_locale_path(self._locale)
 
     def _get_formatting_file(self):
         path=self._get_formatting_file_from_settings()
         return path
 
-    def _locale_paths_changed(self, settings, key):
+    def _locale_paths_changed(self, settings, locale_str):
+        if locale_str != self._locale:
+            return
+
         LOG_MSG.debug("settings formatting file paths changed")
         path=self._get_formatting_file()
         self._set_formatting_file_path(path)
 
     def _load_json_file(self, json_path):
-        LOG_MSG.debug("loading JSON file (%s)", str(json_path))
-        if not json_path.is_file():
-            LOG_MSG.info("wrong or missing filename (%s)", str(json_path))
+        # Returns a read-only view of the document (dictionaries are
+        # MappingProxyType and lists are tuples) that can be shared.
+        path_str=str(json_path)
+        try:
+            file_stat=os.stat(path_str)
+        except OSError:
+            file_stat=None
+
+        if file_stat is None or not json_path.is_file():
+            LOG_MSG.info("wrong or missing filename (%s)", path_str)
+            _helper_invalidate_json_file(path_str)
             return None
 
+        cached=_JSON_CACHE.get(path_str)
+        if cached is not None and \
+           cached[0] == file_stat.st_mtime_ns and cached[1] == file_stat.st_size:
+            LOG_MSG.debug("JSON file already loaded (%s)", path_str)
+            return cached[2]
+
+        LOG_MSG.debug("loading JSON file (%s)", path_str)
         with json_path.open() as json_file:
             try:
                 # Catch ill-formatted files
                 json_data = json.load(json_file)
                 if json_data in [None, {}]:
-                    LOG_MSG.debug("empty file (%s)", str(json_path))
+                    LOG_MSG.debug("empty file (%s)", path_str)
 
             except json.JSONDecodeError:
-                LOG_MSG.warning("the JSON format of the file is wrong (%s)", str(json_data))
+                LOG_MSG.warning("the JSON format of the file is wrong (%s)", path_str)
+                _helper_invalidate_json_file(path_str)
                 return None
 
+        json_data=_helper_freeze_json(json_data)
+        _JSON_CACHE[path_str]=(file_stat.st_mtime_ns, file_stat.st_size, json_data)
         return json_data
 
     @property
@@ -128,19 +229,7 @@ class STTCurrentLocale(GObject.Object):
         LOG_MSG.debug("set formatting file path from %s to %s",
                       self._formatting_file_path, formatting_file_path)
 
-        paths_json_string = self._settings.get_string("locale-paths")
-        if paths_json_string in (None,"None",""):
-            paths_dict={}
-        else:
-            paths_dict=json.loads(paths_json_string)
-
-        paths_dict[self._locale]=formatting_file_path
-        paths_json_string=json.dumps(paths_dict)
-
-        self._settings.disconnect(self._locale_paths_changed_id)
-        self._settings.set_string("locale-paths", paths_json_string)
-        self._locale_paths_changed_id=self._settings.connect("changed::locale-paths", self._locale_paths_changed)
-
+        stt_settings().set_locale_path(self._locale, formatting_file_path)
         self._set_formatting_file_path(formatting_file_path)
 
     def _default_overriding_file_path(self):
@@ -148,23 +237,80 @@ class STTCurrentLocale(GObject.Object):
 
     @property
     def overriding(self):
+        # Changes not written yet win
+        if self._pending_override is not None:
+            return _helper_freeze_json(self._pending_override[1])
+
         # Note: there is no defaulting to locale prefix if locale does not exist
         json_path=self._default_overriding_file_path()
         return self._load_json_file(json_path)
 
     @overriding.setter
     def overriding(self, json_data):
-        json_path=self._default_overriding_file_path()
-
-        # Ensure the path to our directory has been created
-        json_path.parent.mkdir(parents=True, exist_ok=True)
-
-        with json_path.open("w") as json_file:
-            json.dump(json_data, json_file)
+        # The file is written once there has been no change for a short while
+        self._pending_override=(self._default_overriding_file_path(), json_data)
+        if self._override_write_id != 0:
+            GLib.source_remove(self._override_write_id)
+
+        self._override_write_id=GLib.timeout_add(_OVERRIDE_WRITE_DELAY, self._write_overriding_timeout)
+
+    def _overriding_written(self, json_path, written):
+        # Called in the main loop once the write is over
+        _helper_invalidate_json_file(json_path)
+        if written == False:
+            self._own_override_writes=max(self._own_override_writes-1, 0)
+
+        return False
+
+    def _write_overriding_thread(self, previous_thread, json_path, content):
+        # Writes must happen in order
+        if previous_thread is not None:
+            previous_thread.join()
+
+        try:
+            written=_helper_write_file_atomic(json_path, content)
+        except OSError as error:
+            LOG_MSG.error("could not write overriding file (%s)", error)
+            written=False
+
+        LOG_MSG.debug("overriding file written (%s) (%s)", json_path, written)
+        GLib.idle_add(self._overriding_written, json_path, written)
+
+    def _write_overriding(self, wait):
+        if self._override_write_id != 0:
+            GLib.source_remove(self._override_write_id)
+            self._override_write_id=0
+
+        if self._pending_override is not None:
+            json_path, json_data=self._pending_override
+            self._pending_override=None
+
+            self._own_override_writes+=1
+            self._override_thread=threading.Thread(target=self._write_overriding_thread,
+                                                   args=(self._override_thread, json_path, json.dumps(json_data)),
+                                                   daemon=True)
+            self._override_thread.start()
+
+        if wait == True and self._override_thread is not None:
+            self._override_thread.join()
+
+    def _write_overriding_timeout(self):
+        self._override_write_id=0
+        self._write_overriding(False)
+        return False
+
+    def flush_overriding(self):
+        # Write pending changes now and wait until it is done. This blocks so
+        # it is only meant for when the application is about to quit.
+        self._write_overriding(True)
 
     def _set_locale(self, locale_str):
         LOG_MSG.debug("setting object locale (from %s to %s)", self._locale, locale_str)
         if locale_str != self._locale:
+            # Pending changes belong to the previous locale, write them now
+            # (the path of the file is already known)
+            self._write_overriding(False)
+
             self._locale = locale_str
             self._formatting_file_path=""
 
@@ -0,0 +1,94 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import csv
+import logging
+
+from pathlib import Path
+
+LOG_MSG=logging.getLogger()
+
+# Custom shortcuts can be imported from and exported to CSV or TSV files with
+# one line per utterance:
+#   utterance,value[,description]
+# Lines with the same value are merged into one shortcut. The first line is
+# skipped if it is a header (that is if it starts with "utterance").
+
+_HEADER=("utterance", "value", "description")
+
+def _helper_dialect(path, sample):
+    suffix=Path(path).suffix.lower()
+    if suffix == ".tsv":
+        return csv.excel_tab
+
+    if suffix == ".csv":
+        return csv.excel
+
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        return csv.excel
+
+def stt_custom_file_read(path):
+    # Returns a list of {"value": ..., "utterances": [...], "description": ...}
+    # in the order of the file. Raises OSError or csv.Error.
+    items={}
+    with open(path, newline="", encoding="utf-8") as csv_file:
+        dialect=_helper_dialect(path, csv_file.read(4096))
+        csv_file.seek(0)
+
+        for line_num, fields in enumerate(csv.reader(csv_file, dialect)):
+            if len(fields) < 2:
+                if fields != []:
+                    LOG_MSG.warning("line %i has no value (%s)", line_num+1, path)
+                continue
+
+            if line_num == 0 and fields[0].strip().lower() == _HEADER[0]:
+                continue
+
+            utterance=" ".join(fields[0].lower().split())
+            value=fields[1]
+            if utterance == "" or value == "":
+                LOG_MSG.warning("line %i is incomplete (%s)", line_num+1, path)
+                continue
+
+            item=items.get(value)
+            if item is None:
+                item={"value": value, "utterances": []}
+                items[value]=item
+
+            if len(fields) > 2 and fields[2] != "":
+                item["description"]=fields[2]
+
+            if utterance not in item["utterances"]:
+                item["utterances"].append(utterance)
+
+    LOG_MSG.debug("%i custom shortcuts read (%s)", len(items), path)
+    return list(items.values())
+
+def stt_custom_file_write(path, items):
+    # items is an iterable of (value, utterances, description). Raises OSError
+    # or csv.Error.
+    dialect=csv.excel_tab if Path(path).suffix.lower() == ".tsv" else csv.excel
+    with open(path, "w", newline="", encoding="utf-8") as csv_file:
+        writer=csv.writer(csv_file, dialect)
+        writer.writerow(_HEADER)
+
+        for value, utterances, description in items:
+            for utterance in utterances:
+                writer.writerow((utterance, value, description if description is not None else ""))
@@ -0,0 +1,467 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import uuid
+import shutil
+import logging
+import tempfile
+import threading
+
+from enum import Enum
+from pathlib import Path
+
+from gi.repository import GLib, GObject, Gio
+
+from sttutils import stt_utils_get_local_config_path
+from sttprogresschannel import STTProgressChannel, STTDownloadPhase
+
+LOG_MSG=logging.getLogger()
+
+# Models are downloaded one after the other (or a few at once, see the
+# download-max-jobs setting) in the order of a queue that the user can change.
+# Downloads can be paused: what was downloaded is kept in a partial file and
+# the download goes on from there with an HTTP range request. The queue is
+# saved so that downloads go on when the setup tool is restarted.
+
+DOWNLOADED_MODEL_SUFFIX = ".downloaded_model_tmp"
+
+_QUEUE_FILE_NAME = "downloads.json"
+_PARTIAL_SUFFIX = ".part"
+
+# Progress is rate limited by the channel so blocks can be small
+_BLOCK_SIZE = 65536
+
+# Longest sleep (in seconds) when throttling, so that cancellation is quick
+_MAX_THROTTLE_SLEEP = 0.2
+
+class STTDownloadState(Enum):
+    QUEUED = "queued"
+    RUNNING = "running"
+    PAUSED = "paused"
+
+class _STTDownloadResult(Enum):
+    DONE = 0
+    CANCELLED = 1
+    FAILED = 2
+
+class STTDownload():
+    __slots__=("name", "url", "destination", "state", "cancellable")
+
+    def __init__(self, name, url, destination, state=STTDownloadState.QUEUED):
+        self.name=name
+        self.url=url
+        self.destination=Path(destination)
+        self.state=state
+        self.cancellable=None
+
+def _helper_download(url, partial_path, cancellable, channel, get_rate_limit):
+    # Downloads url to partial_path, going on from what it already contains.
+    # Returns False if cancelled. Raises OSError.
+
+    # Not imported with the module, it is slow to load (ssl, http...) and
+    # the engine never downloads anything
+    import urllib.request
+    import urllib.error
+
+    try:
+        offset=partial_path.stat().st_size
+    except FileNotFoundError:
+        offset=0
+
+    request=urllib.request.Request(url)
+    if offset != 0:
+        request.add_header("Range", "bytes=%i-" % offset)
+
+    try:
+        response=urllib.request.urlopen(request)
+    except urllib.error.HTTPError as error:
+        # The partial file is already complete
+        if offset != 0 and error.code == 416:
+            return True
+        raise
+
+    with response:
+        if offset != 0 and response.status != 206:
+            LOG_MSG.info("server does not support ranges, restarting download (%s)", url)
+            offset=0
+
+        length_str=response.getheader("content-length")
+        total=offset+int(length_str) if length_str else 0
+
+        size=offset
+        channel.post(STTDownloadPhase.DOWNLOADING, size, total)
+
+        rate_limit=0
+        with partial_path.open("ab" if offset != 0 else "wb") as partial_file:
+            while True:
+                if cancellable.is_cancelled() == True:
+                    return False
+
+                buffer=response.read(_BLOCK_SIZE)
+                if buffer in (None, b""):
+                    break
+
+                partial_file.write(buffer)
+                size+=len(buffer)
+                channel.post(STTDownloadPhase.DOWNLOADING, size, total)
+
+                # Stay below the limit on average since it was last changed
+                if get_rate_limit() != rate_limit:
+                    rate_limit=get_rate_limit()
+                    limit_start=time.monotonic()
+                    limit_size=size
+
+                if rate_limit == 0:
+                    continue
+
+                while cancellable.is_cancelled() == False:
+                    delay=(size-limit_size)/rate_limit-(time.monotonic()-limit_start)
+                    if delay <= 0:
+                        break
+
+                    time.sleep(min(delay, _MAX_THROTTLE_SLEEP))
+
+    return True
+
+def _helper_install_model(archive_path, destination, cancellable):
+    # Unpacks the model and moves it to destination. Returns False if cancelled.
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        LOG_MSG.debug("unpacking model %s in, %s", archive_path, tmp_dir)
+        shutil.unpack_archive(str(archive_path), tmp_dir, "zip")
+
+        if cancellable.is_cancelled() == True:
+            return False
+
+        model_names=os.listdir(tmp_dir)
+        if len(model_names) != 1:
+            # This is an error
+            LOG_MSG.error("model is composed of more than one file")
+
+        model_src=os.path.join(tmp_dir, model_names[0])
+
+        # Make sure parent path exists
+        destination.parent.mkdir(parents=True, exist_ok=True)
+
+        # Move the unzipped model directory to directory as a temp file
+        tmp_dst=Path(str(destination) + str(uuid.uuid4()) + DOWNLOADED_MODEL_SUFFIX)
+        LOG_MSG.debug("tmp model dest %s", tmp_dst)
+        shutil.move(model_src, tmp_dst)
+
+        if cancellable.is_cancelled() == True:
+            shutil.rmtree(tmp_dst)
+            return False
+
+        # Do an atomic rename so that when monitoring triggers a file change
+        # we are sure that directory has been properly moved since it's an
+        # atomic operation.
+        os.rename(tmp_dst, destination)
+
+    return True
+
+class STTDownloadManager(GObject.Object):
+    __gtype_name__="STTDownloadManager"
+
+    __gsignals__={
+        # Emitted with the name of a download that was added, removed, moved
+        # or whose state changed
+        "changed": (GObject.SIGNAL_RUN_FIRST, None, (str,)),
+        # Emitted with the name of the model and whether it is installed
+        "finished": (GObject.SIGNAL_RUN_FIRST, None, (str, bool,)),
+    }
+
+    def __init__(self, queue_path=None, partial_dir=None, max_jobs=None, bandwidth=None):
+        # max_jobs and bandwidth (in KiB/s) override the settings
+        super().__init__()
+
+        if queue_path is None:
+            queue_path=Path(stt_utils_get_local_config_path(), _QUEUE_FILE_NAME)
+
+        if partial_dir is None:
+            partial_dir=Path(GLib.get_user_cache_dir(), "ibus-stt", "downloads")
+
+        self._queue_path=Path(queue_path)
+        self._partial_dir=Path(partial_dir)
+
+        self._downloads=[]
+        self._channels={}
+
+        # Names of the models whose download thread has not ended yet, even
+        # if they were cancelled since: their partial file is still in use.
+        self._busy_names=set()
+
+        self._settings=None
+        if max_jobs is None or bandwidth is None:
+            from sttsettings import stt_settings
+
+            self._settings=stt_settings().gsettings
+            self._settings.connect("changed::download-max-jobs", self._settings_changed)
+            self._settings.connect("changed::download-bandwidth", self._settings_changed)
+
+        self._max_jobs_override=max_jobs
+        self._bandwidth_override=bandwidth
+        self._update_limits()
+
+        self._load()
+        self._schedule()
+
+    def _update_limits(self):
+        if self._max_jobs_override is not None:
+            self._max_jobs=self._max_jobs_override
+        else:
+            self._max_jobs=self._settings.get_uint("download-max-jobs")
+
+        if self._bandwidth_override is not None:
+            bandwidth=self._bandwidth_override
+        else:
+            bandwidth=self._settings.get_uint("download-bandwidth")
+
+        # Read by download threads
+        self._bandwidth=bandwidth*1024
+
+    def _settings_changed(self, settings, key):
+        self._update_limits()
+        self._schedule()
+
+    def _load(self):
+        try:
+            with self._queue_path.open() as queue_file:
+                queue=json.load(queue_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as error:
+            LOG_MSG.warning("could not read download queue (%s)", error)
+            return
+
+        for download_data in queue.get("downloads", []):
+            try:
+                state=STTDownloadState(download_data["state"])
+                if state == STTDownloadState.RUNNING:
+                    state=STTDownloadState.QUEUED
+
+                self._downloads.append(STTDownload(download_data["name"],
+                                                   download_data["url"],
+                                                   download_data["destination"],
+                                                   state))
+            except (KeyError, TypeError, ValueError):
+                LOG_MSG.warning("wrong download in queue (%s)", download_data)
+
+        LOG_MSG.debug("%i downloads in queue", len(self._downloads))
+
+    def _save(self):
+        # Running downloads are saved as queued, they restart with the setup
+        # tool.
+        queue={"downloads": [{"name": download.name,
+                              "url": download.url,
+                              "destination": str(download.destination),
+                              "state": (STTDownloadState.QUEUED if download.state == STTDownloadState.RUNNING else download.state).value}
+                             for download in self._downloads]}
+        tmp_path=None
+        try:
+            self._queue_path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path=tempfile.mkstemp(dir=str(self._queue_path.parent), prefix="." + self._queue_path.name, suffix=".tmp")
+            with os.fdopen(fd, "w") as tmp_file:
+                json.dump(queue, tmp_file)
+
+            os.replace(tmp_path, str(self._queue_path))
+        except OSError as error:
+            LOG_MSG.warning("could not write download queue (%s)", error)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _get_partial_path(self, name):
+        return Path(self._partial_dir, name + _PARTIAL_SUFFIX)
+
+    def _remove_partial(self, name):
+        try:
+            self._get_partial_path(name).unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            LOG_MSG.warning("could not remove partial download (%s)", error)
+
+    def _changed(self, download):
+        self._save()
+        self.emit("changed", download.name)
+
+    def _get_rate_limit(self):
+        # Called by download threads: running downloads share the bandwidth
+        if self._bandwidth == 0:
+            return 0
+
+        running_num=sum(1 for download in self._downloads if download.state == STTDownloadState.RUNNING)
+        return self._bandwidth//max(running_num, 1)
+
+    def _download_thread(self, download, cancellable):
+        channel=self.get_channel(download.name)
+        partial_path=self._get_partial_path(download.name)
+        result=_STTDownloadResult.FAILED
+        try:
+            partial_path.parent.mkdir(parents=True, exist_ok=True)
+            if _helper_download(download.url, partial_path, cancellable, channel, self._get_rate_limit) == False:
+                result=_STTDownloadResult.CANCELLED
+            else:
+                channel.post(STTDownloadPhase.UNPACKING)
+                if _helper_install_model(partial_path, download.destination, cancellable) == False:
+                    result=_STTDownloadResult.CANCELLED
+                else:
+                    result=_STTDownloadResult.DONE
+        except shutil.ReadError as error:
+            # Resuming would not download anything else, start again
+            LOG_MSG.error("failed to unpack model %s (%s)", download.name, error)
+            partial_path.unlink(missing_ok=True)
+        except (OSError, ValueError) as error:
+            LOG_MSG.error("failed to download model %s (%s)", download.name, error)
+        finally:
+            channel.post(STTDownloadPhase.STOPPED)
+            GLib.idle_add(self._download_done, download, result)
+
+    def _download_done(self, download, result):
+        download.cancellable=None
+        self._busy_names.discard(download.name)
+        LOG_MSG.debug("download of %s ended (%s)", download.name, result)
+
+        if download not in self._downloads:
+            # Cancelled: a new download of the same model waited for this
+            # thread to end before using the partial file
+            self._remove_partial(download.name)
+        elif result == _STTDownloadResult.DONE:
+            self._remove_partial(download.name)
+            self._downloads.remove(download)
+            self._changed(download)
+            self.emit("finished", download.name, True)
+        elif download.state == STTDownloadState.RUNNING:
+            # Failed: it can be resumed later from where it stopped
+            download.state=STTDownloadState.PAUSED
+            self._changed(download)
+            self.emit("finished", download.name, False)
+
+        self._schedule()
+        return False
+
+    def _start(self, download):
+        LOG_MSG.debug("start downloading model (%s)", download.url)
+        download.state=STTDownloadState.RUNNING
+        download.cancellable=Gio.Cancellable()
+        self._busy_names.add(download.name)
+
+        download_thread=threading.Thread(target=self._download_thread, args=(download, download.cancellable), daemon=True)
+        download_thread.start()
+
+        self._changed(download)
+
+    def _schedule(self):
+        # Threads of cancelled or paused downloads count until they end and
+        # a model is not downloaded again before its previous thread ended.
+        running_num=len(self._busy_names)
+        for download in self._downloads:
+            if running_num >= max(self._max_jobs, 1):
+                return
+
+            if download.state == STTDownloadState.QUEUED and download.name not in self._busy_names:
+                self._start(download)
+                running_num+=1
+
+    def get_channel(self, name):
+        # Can be called from any thread
+        channel=self._channels.get(name)
+        if channel is None:
+            channel=self._channels.setdefault(name, STTProgressChannel())
+
+        return channel
+
+    def get_download(self, name):
+        for download in self._downloads:
+            if download.name == name:
+                return download
+
+        return None
+
+    def get_downloads(self):
+        return list(self._downloads)
+
+    def add(self, name, url, destination):
+        download=self.get_download(name)
+        if download is not None:
+            self.resume(name)
+            return
+
+        download=STTDownload(name, url, destination)
+        self._downloads.append(download)
+        self._changed(download)
+        self._schedule()
+
+    def cancel(self, name):
+        download=self.get_download(name)
+        if download is None:
+            return
+
+        self._downloads.remove(download)
+        if download.cancellable is not None:
+            # The partial file is removed once the thread is done
+            download.cancellable.cancel()
+        elif name not in self._busy_names:
+            self._remove_partial(name)
+            self.get_channel(name).post(STTDownloadPhase.STOPPED)
+
+        self._changed(download)
+        self._schedule()
+
+    def pause(self, name):
+        download=self.get_download(name)
+        if download is None or download.state == STTDownloadState.PAUSED:
+            return
+
+        if download.cancellable is not None:
+            download.cancellable.cancel()
+
+        download.state=STTDownloadState.PAUSED
+        self._changed(download)
+        self._schedule()
+
+    def resume(self, name):
+        download=self.get_download(name)
+        if download is None or download.state != STTDownloadState.PAUSED:
+            return
+
+        download.state=STTDownloadState.QUEUED
+        self._changed(download)
+        self._schedule()
+
+    def move(self, name, position):
+        # Running downloads are not stopped for the ones moved before them
+        download=self.get_download(name)
+        if download is None:
+            return
+
+        self._downloads.remove(download)
+        self._downloads.insert(position, download)
+        self._changed(download)
+        self._schedule()
+
+_DOWNLOAD_MANAGER = None
+
+def stt_download_manager():
+    global _DOWNLOAD_MANAGER
+
+    if _DOWNLOAD_MANAGER == None:
+        _DOWNLOAD_MANAGER = STTDownloadManager()
+
+    return _DOWNLOAD_MANAGER
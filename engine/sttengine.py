@@ -26,15 +26,14 @@ import gi
 
 gi.require_version('IBus', '1.0')
 gi.require_version('Pango', '1.0')
-gi.require_version('Gtk', '4.0')
 
 from gi.repository import IBus
-from gi.repository import Gtk, Adw
-from gi.repository import Gio
 
 from sttutils import *
+from sttsettings import stt_settings
 from sttgstfactory import stt_gst_factory_default
 from sttsegmentprocess import STTSegmentProcess, STTParseModes
+from sttvoskresult import UNCERTAIN_CONFIDENCE
 
 
 __all__ = (
@@ -75,7 +74,7 @@ class STTEngine(IBus.Engine):
 
         self._preediting=False
 
-        self._settings=Gio.Settings.new("org.freedesktop.ibus.engine.stt")
+        self._settings=stt_settings().gsettings
         self._settings.connect("changed::stop-on-keypress", self._stop_on_key_pressed_changed)
         self._stop_on_key_pressed=False
         self._update_stop_on_key_pressed()
@@ -123,6 +122,15 @@ class STTEngine(IBus.Engine):
                                               sensitive=False,
                                               tooltip=_("Toggle the use of digits")))
 
+        self.__prop_list.append(IBus.Property(key="model-warning",
+                                              label=_("Recognition too slow"),
+                                              icon="dialog-warning-symbolic",
+                                              type=IBus.PropType.NORMAL,
+                                              visible=False,
+                                              sensitive=True,
+                                              tooltip=_("Configure IBus STT")))
+        self._model_warning=None
+
         self.__prop_list.append(IBus.Property(key="configuration",
                                               label=_("Settings"),
                                               type=IBus.PropType.NORMAL,
@@ -134,6 +142,7 @@ class STTEngine(IBus.Engine):
                                               sensitive=True,
                                               tooltip=_("Learn more about IBus STT")))
 
+        self._client=""
         self._engine_connected=False
         self._engine=stt_gst_factory_default().new_engine()
         if self._engine.has_model() == False:
@@ -149,6 +158,7 @@ class STTEngine(IBus.Engine):
 
         LOG_MSG.info("disconnect from engine %s", self)
         self._engine.disconnect_by_func(self._model_changed)
+        self._engine.disconnect_by_func(self._model_downgraded)
         self._engine.disconnect_by_func(self._state_changed)
         self._engine.disconnect_by_func(self._got_text)
         self._engine.disconnect_by_func(self._got_partial_text)
@@ -162,6 +172,7 @@ class STTEngine(IBus.Engine):
 
         LOG_MSG.debug("connect to engine %s", self)
         self._engine.connect("model-changed", self._model_changed)
+        self._engine.connect("model-downgraded", self._model_downgraded)
         self._engine.connect("state-changed", self._state_changed)
         self._engine.connect("text", self._got_text)
         self._engine.connect("partial-text", self._got_partial_text)
@@ -172,7 +183,10 @@ class STTEngine(IBus.Engine):
         # This method is inherited from IBusObject
         LOG_MSG.info("STTEngine destruction %s", self)
 
+        # Settings are shared by the whole process
         self._settings.disconnect_by_func(self._stop_on_key_pressed_changed)
+        self._settings.disconnect_by_func(self._on_preedit_text_changed)
+        self._settings.disconnect_by_func(self._on_format_preedit_changed)
         self._settings=None
 
         self._text_processor.disconnect_by_func(self._mode_changed)
@@ -253,6 +267,15 @@ class STTEngine(IBus.Engine):
                            tooltip=_("Toggle spelling mode"))
         self.update_property(prop)
 
+        prop=IBus.Property(key="model-warning",
+                           label=self._model_warning if self._model_warning is not None else "",
+                           icon="dialog-warning-symbolic",
+                           type=IBus.PropType.NORMAL,
+                           visible=bool(self._model_warning is not None),
+                           sensitive=True,
+                           tooltip=_("Configure IBus STT"))
+        self.update_property(prop)
+
         use_digits = self._text_processor.use_digits
         prop=IBus.Property(key="digit-mode",
                            label=_("Use digits"),
@@ -271,6 +294,12 @@ class STTEngine(IBus.Engine):
         if self._engine.has_model() == False:
             LOG_MSG.error("engine has no model")
 
+        # If we switched to a smaller model, we'll be told afterwards
+        self._model_warning=None
+        self._update_state()
+
+    def _model_downgraded(self, engine, model_name):
+        self._model_warning=_("Recognition too slow: switched to %s") % model_name
         self._update_state()
 
     def _mode_changed(self, text_processor):
@@ -297,9 +326,13 @@ class STTEngine(IBus.Engine):
         active_on_start = self._settings.get_boolean("active-on-start")
         LOG_MSG.info("engine enabled %s (active_on_start=%s)", self, active_on_start)
         if active_on_start == True:
-            self._engine.run()
+            self._run_engine()
             self._update_state()
 
+    def _run_engine(self):
+        stt_gst_factory_default().recording_started(self._client)
+        self._engine.run()
+
     def do_disable(self):
         LOG_MSG.info('disable %s', self)
         self._engine.stop()
@@ -316,6 +349,10 @@ class STTEngine(IBus.Engine):
         self.register_properties(self.__prop_list)
         self._update_state()
 
+        # Get the engine ready if the user often dictates in this application
+        self._client=client
+        stt_gst_factory_default().focus_in(client)
+
         # Shortcut depends on the client, only IBus gtk2/gtk3 clients allow it
         if client.startswith("gtk3-im:") or client.startswith("gtk2-im:"):
             self._text_processor.supports_shortcuts=True
@@ -347,7 +384,7 @@ class STTEngine(IBus.Engine):
         if prop_name == 'toggle-recording':
             # State will be updated by the engine
             if bool(state) == True:
-                self._engine.run()
+                self._run_engine()
             else:
                 self._engine.stop()
         elif prop_name == 'dictation-mode':
@@ -361,9 +398,15 @@ class STTEngine(IBus.Engine):
                 self._text_processor.mode = STTParseModes.LITERAL
         elif prop_name == 'digit-mode':
             self._text_processor.use_digits = bool(state)
-        elif prop_name == 'configuration':
+        elif prop_name in ['configuration', 'model-warning']:
             subprocess.Popen([os.path.join(stt_utils_get_libexec(), "ibus-setup-stt")])
         elif prop_name == 'about':
+            # Loading Gtk and Adw takes time, only do it when needed
+            gi.require_version('Gtk', '4.0')
+            gi.require_version('Adw', '1')
+            from gi.repository import Gtk, Adw
+
+            Adw.init()
             dialog = Adw.AboutWindow(application_name=_("IBus Speech To Text"),
                             title=_("About IBus Speech To Text"),
                             application_icon="user-available-symbolic",
@@ -403,17 +446,26 @@ class STTEngine(IBus.Engine):
 
         self.forward_key_event(keyval, 0, modifiers)
 
-    def _add_preedit_text(self, utterance):
+    def _add_preedit_text(self, utterance, uncertain_pos=-1):
         # Note: we accept "" (in case we need to remove previous partial text)
         ibus_text=IBus.Text.new_from_string(utterance)
+
+        # Words the recognizer is not sure about yet are underlined
+        if uncertain_pos not in [-1, len(utterance)]:
+            attributes=IBus.AttrList()
+            attributes.append(IBus.attr_underline_new(IBus.AttrUnderline.ERROR,
+                                                      uncertain_pos,
+                                                      len(utterance)))
+            ibus_text.set_attributes(attributes)
+
         self.update_preedit_text_with_mode(ibus_text,
                                            0,
                                            True,
                                            IBus.PreeditFocusMode.CLEAR)
         self._preediting=True
 
-    def _partial_formatted_text(self, text_process, utterance):
-        self._add_preedit_text(utterance)
+    def _partial_formatted_text(self, text_process, utterance, uncertain_pos):
+        self._add_preedit_text(utterance, uncertain_pos)
 
     def _final_formatted_text(self, text_process, utterance):
         if self._preediting == True:
@@ -432,17 +484,31 @@ class STTEngine(IBus.Engine):
             self._left_text_reset=False
             LOG_MSG.debug("current left text (after commit) (%s)", self._left_text)
 
-    def _got_partial_text(self, engine, utterance):
+    def _got_partial_text(self, engine, utterance, words):
         if (self.client_capabilities & IBus.Capabilite.PREEDIT_TEXT) == 0:
             LOG_MSG.debug("client has no Preedit capability")
             return
 
         if self._format_preedit == True:
-            self._text_processor.utterance_process_begin(utterance, self._left_text)
-        else:
-            self._add_preedit_text(utterance)
+            self._text_processor.utterance_process_begin(utterance, self._left_text, words)
+            return
+
+        uncertain_pos=-1
+        if words is not None:
+            utterance_words=utterance.split()
+            uncertain_i=words.uncertain_tail(UNCERTAIN_CONFIDENCE)
+            if len(words) == len(utterance_words) and uncertain_i != len(words):
+                uncertain_pos=len(" ".join(utterance_words[:uncertain_i]))
+                if uncertain_i != 0:
+                    # Include the white space before
+                    uncertain_pos+=1
+
+                utterance=" ".join(utterance_words)
+
+        self._add_preedit_text(utterance, uncertain_pos)
 
-    def _got_text(self, engine, utterance):
+    def _got_text(self, engine, utterance, _words):
+        # Final text is committed at once, there is no uncertain tail to show
         self._text_processor.utterance_process_end(utterance, self._left_text)
 
     def _reset(self):
@@ -24,6 +24,7 @@ gi.require_version('IBus', '1.0')
 from gi.repository import IBus
 
 from sttengine import STTEngine
+from sttprofile import stt_profile_phase, stt_profile_report
 
 LOG_MSG=logging.getLogger()
 
@@ -42,9 +43,16 @@ class STTEngineFactory(IBus.Factory):
         if engine_name != "stt":
             return super().do_create_engine(engine_name)
 
-        engine=STTEngine(self._bus, "/org/freedesktop/IBus/STT")
+        first_engine=bool(self._current_engine is None)
+        with stt_profile_phase("engine creation"):
+            engine=STTEngine(self._bus, "/org/freedesktop/IBus/STT")
+
         self._current_engine=engine
         LOG_MSG.debug("Creating new engine")
+
+        if first_engine == True:
+            stt_profile_report("first engine created")
+
         return engine
 
     def do_destroy(self):
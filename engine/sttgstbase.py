@@ -37,8 +37,9 @@ class STTGstBase (GObject.Object):
     __gtype_name__='STTGstBase'
 
     __gsignals__ = {
-        'text': (GObject.SIGNAL_RUN_FIRST, None, (str,)),
-        'partial-text': (GObject.SIGNAL_RUN_FIRST, None, (str,)),
+        # The second argument holds the STTVoskWords of the text (or None)
+        'text': (GObject.SIGNAL_RUN_FIRST, None, (str, object,)),
+        'partial-text': (GObject.SIGNAL_RUN_FIRST, None, (str, object,)),
         'alternatives': (GObject.SIGNAL_RUN_FIRST, None, (object,)),
         'model-changed': (GObject.SIGNAL_RUN_FIRST, None, ()),
         'state-changed': (GObject.SIGNAL_RUN_FIRST, None, ()),
@@ -57,6 +58,7 @@ class STTGstBase (GObject.Object):
         self._bus_error_id = self._bus.connect("message::error", self._handle_error_message)
         self._bus_warning_id = self._bus.connect("message::warning", self._handle_warning_message)
         self._bus_state_changed_id = self.bus.connect("message::state-changed", self._handle_state_changed_message)
+        self._bus_clock_lost_id = self._bus.connect("message::clock-lost", self._handle_clock_lost_message)
 
         self._target=STTEngineState.UNKNOWN
 
@@ -67,9 +69,11 @@ class STTGstBase (GObject.Object):
         self._bus.disconnect(self._bus_error_id)
         self._bus.disconnect(self._bus_warning_id)
         self._bus.disconnect(self._bus_state_changed_id)
+        self._bus.disconnect(self._bus_clock_lost_id)
         self._bus_error_id = 0
         self._bus_warning_id = 0
         self._bus_state_changed_id = 0
+        self._bus_clock_lost_id = 0
 
         self._bus.remove_signal_watch()
         self._bus=None
@@ -103,6 +107,16 @@ class STTGstBase (GObject.Object):
         warning, debug = message.parse_warning()
         LOG_MSG.warning("message (%s), %s", warning.message, debug)
 
+    def _handle_clock_lost_message (self, bus, message):
+        # The element providing the clock (the audio source) was removed or
+        # replaced. A new clock is selected when going to PLAYING again.
+        if self._target != STTEngineState.RUNNING:
+            return
+
+        LOG_MSG.debug("clock lost, selecting a new one")
+        self._pipeline.set_state(Gst.State.PAUSED)
+        self._pipeline.set_state(Gst.State.PLAYING)
+
     def _handle_state_changed_message (self, bus, message):
         (old_state, new_state, pending) = message.parse_state_changed ()
         LOG_MSG.debug("state changed from %s to %s (%s)", old_state, new_state, message.src)
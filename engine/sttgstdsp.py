@@ -0,0 +1,56 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+from gi.repository import Gst
+
+LOG_MSG=logging.getLogger()
+
+# Values of the noise-suppression setting, which are also the nicks of the
+# noise-suppression-level property of webrtcdsp (except "none")
+NOISE_SUPPRESSION_LEVELS = ("none", "low", "moderate", "high", "very-high")
+
+def stt_gst_dsp_new(noise_suppression="very-high", gain_control=True, high_pass_filter=True):
+    # Returns the element cleaning up audio before recognition or None if
+    # there is nothing to do (or webrtcdsp is not installed). The more it
+    # does, the more CPU it needs (see the dsp benchmark).
+    if noise_suppression == "none" and gain_control == False and high_pass_filter == False:
+        return None
+
+    dsp=Gst.ElementFactory.make("webrtcdsp", "AudioDSP")
+    if dsp is None:
+        LOG_MSG.info("webrtcdsp is not available, audio is not processed")
+        return None
+
+    # There is no playback to cancel echo from
+    dsp.set_property("echo-cancel", False)
+    dsp.set_property("gain-control", gain_control)
+    dsp.set_property("high-pass-filter", high_pass_filter)
+    dsp.set_property("noise-suppression", noise_suppression != "none")
+    if noise_suppression != "none":
+        Gst.util_set_object_arg(dsp, "noise-suppression-level", noise_suppression)
+
+    LOG_MSG.debug("audio processing: noise suppression=%s, gain control=%i, high pass filter=%i",
+                  noise_suppression, gain_control, high_pass_filter)
+    return dsp
+
+def stt_gst_dsp_new_from_settings(settings):
+    return stt_gst_dsp_new(settings.get_string("noise-suppression"),
+                           settings.get_boolean("gain-control"),
+                           settings.get_boolean("high-pass-filter"))
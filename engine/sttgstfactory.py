@@ -16,50 +16,325 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import time
 import logging
 import weakref
 
 from gi.repository import GObject
-from gi.repository import Gio
+from gi.repository import GLib
 
 from sttutils import *
 
 from sttgstvosk import STTGstVosk
+from sttcurrentlocale import stt_current_locale
+from sttvoskmodel import stt_vosk_model_installed, stt_vosk_model_prefetch
+from sttsettings import stt_settings
+from sttusagehistory import stt_usage_history
+from sttprofile import stt_profile_phase, stt_profile_report, stt_profile_record
 
 LOG_MSG=logging.getLogger()
 
+class STTGstLazyEngine(GObject.Object):
+    # Stands for a STTGstVosk until recording starts (run() or preload()).
+    # Building the pipeline and loading the model takes time and memory, which
+    # is wasted for users who enable the input method but never dictate. Until
+    # then, has_model() is answered from the settings and the signals of the
+    # real engine are forwarded once it is created. The real engine is let go
+    # again once it has been idle for preload-idle-timeout seconds (if set,
+    # it is kept by default).
+    __gtype_name__ = "STTGstLazyEngine"
+
+    __gsignals__ = {
+        'text': (GObject.SIGNAL_RUN_FIRST, None, (str, object,)),
+        'partial-text': (GObject.SIGNAL_RUN_FIRST, None, (str, object,)),
+        'alternatives': (GObject.SIGNAL_RUN_FIRST, None, (object,)),
+        'model-changed': (GObject.SIGNAL_RUN_FIRST, None, ()),
+        'model-downgraded': (GObject.SIGNAL_RUN_FIRST, None, (str,)),
+        'state-changed': (GObject.SIGNAL_RUN_FIRST, None, ()),
+    }
+
+    _forwarded_signals = ("text", "partial-text", "alternatives", "model-changed", "model-downgraded", "state-changed")
+
+    def __init__(self, factory):
+        super().__init__()
+
+        self._factory=factory
+        self._users_num=1
+        self._use_partial_results=None
+        self._alternatives_num=None
+
+        self._engine=None
+        self._engine_ids=[]
+        self._idle_id=0
+
+        # When run() was last called, until the first result
+        self._run_time=None
+
+        self._current_locale=None
+
+        # No need to wait if another user already created it
+        engine=factory.get_current_engine()
+        if engine is not None:
+            self._set_engine(engine)
+            return
+
+        self._connect_configuration()
+
+    def _connect_configuration(self):
+        stt_settings().connect("model-changed", self._model_setting_changed)
+        self._current_locale=stt_current_locale()
+        self._current_locale.connect("changed", self._locale_changed)
+
+    def _model_setting_changed(self, settings, locale_str):
+        if locale_str == self._current_locale.locale:
+            self.emit("model-changed")
+
+    def _locale_changed(self, current_locale):
+        self.emit("model-changed")
+
+    def _disconnect_configuration(self):
+        if self._current_locale is None:
+            return
+
+        stt_settings().disconnect_by_func(self._model_setting_changed)
+        self._current_locale.disconnect_by_func(self._locale_changed)
+        self._current_locale=None
+
+    def _forward_signal(self, engine, *args):
+        signal_name=args[-1]
+        if self._run_time is not None and signal_name in ("partial-text", "text"):
+            delay=time.monotonic()-self._run_time
+            self._run_time=None
+
+            LOG_MSG.info("first result %.1f ms after recording started", delay*1000)
+            stt_profile_record("first result after recording started", delay)
+            stt_profile_report("first result")
+
+        self.emit(signal_name, *args[:-1])
+
+    def _set_engine(self, engine):
+        self._engine=engine
+        for signal_name in self._forwarded_signals:
+            self._engine_ids.append(engine.connect(signal_name, self._forward_signal, signal_name))
+
+        if self._use_partial_results is not None:
+            engine.set_use_partial_results(self._use_partial_results)
+
+        if self._alternatives_num is not None:
+            engine.set_alternatives_num(self._alternatives_num)
+
+        self._start_idle_timeout()
+
+    def _unset_engine(self):
+        self._stop_idle_timeout()
+
+        for handler_id in self._engine_ids:
+            self._engine.disconnect(handler_id)
+        self._engine_ids=[]
+
+        self._engine.release()
+        self._engine=None
+
+    def _get_engine(self):
+        self._stop_idle_timeout()
+        if self._engine is None:
+            # Model files are read while the pipeline is created
+            stt_vosk_model_prefetch(self._current_locale.locale)
+            self._disconnect_configuration()
+            self._set_engine(self._factory.get_engine())
+            self._stop_idle_timeout()
+
+        return self._engine
+
+    def _idle_timeout(self):
+        self._idle_id=0
+        if self._engine.is_running() == True:
+            return False
+
+        LOG_MSG.info("engine idle, unloading it")
+        self._unset_engine()
+        self._connect_configuration()
+        return False
+
+    def _start_idle_timeout(self):
+        self._stop_idle_timeout()
+
+        idle_timeout=self._factory.idle_timeout
+        if idle_timeout != 0:
+            self._idle_id=GLib.timeout_add_seconds(idle_timeout, self._idle_timeout)
+
+    def _stop_idle_timeout(self):
+        if self._idle_id != 0:
+            GLib.source_remove(self._idle_id)
+            self._idle_id=0
+
+    def hold(self):
+        self._users_num += 1
+
+    def release(self):
+        self._users_num -= 1
+        if self._users_num != 0:
+            return
+
+        self._disconnect_configuration()
+        if self._engine is not None:
+            self._unset_engine()
+
+    def preload(self):
+        engine=self._get_engine()
+        self._start_idle_timeout()
+        return engine.preload()
+
+    def run(self):
+        self._run_time=time.monotonic()
+        return self._get_engine().run()
+
+    def stop(self):
+        self._run_time=None
+        if self._engine is None:
+            return True
+
+        self._start_idle_timeout()
+        return self._engine.stop()
+
+    def is_running(self):
+        if self._engine is None:
+            return False
+
+        return self._engine.is_running()
+
+    def has_model(self):
+        if self._engine is None:
+            return stt_vosk_model_installed(self._current_locale.locale)
+
+        return self._engine.has_model()
+
+    def get_results(self):
+        if self._engine is not None:
+            self._engine.get_results()
+
+    def get_final_results(self):
+        if self._engine is not None:
+            self._engine.get_final_results()
+
+    def set_use_partial_results(self, active):
+        self._use_partial_results=active
+        if self._engine is not None:
+            self._engine.set_use_partial_results(active)
+
+    def set_alternatives_num(self, num):
+        self._alternatives_num=num
+        if self._engine is not None:
+            self._engine.set_alternatives_num(num)
+
 class STTGstFactory(GObject.GObject):
     __gtype_name__ = "STTGstFactory"
 
-    def __init__(self):
+    def __init__(self, preload=True):
         super().__init__()
 
         self._current_engine=None
         self._preload=None
 
-        self.__settings=Gio.Settings.new("org.freedesktop.ibus.engine.stt")
+        # Engine preloaded because recognition is likely to start soon
+        self._predicted=None
+        self._predicted_id=0
+
+        self.__settings=stt_settings().gsettings
+
+        # Only the IBus engine preloads, not the setup tool
+        if preload == False:
+            return
+
         self.__settings.connect("changed::preload", self.__preload_changed)
+        self.__settings.connect("changed::predictive-preload", self.__predictive_preload_changed)
         self.__update_preloaded_engine()
 
-    def new_engine(self):
+    def get_current_engine(self):
+        # Returns the engine with a new reference if one already exists
         engine=None if self._current_engine is None else self._current_engine()
+        if engine is None or engine.pipeline is None:
+            # Destroyed but not collected yet
+            return None
+
+        engine.hold()
+        return engine
+
+    def get_engine(self):
+        engine=self.get_current_engine()
         if engine is None:
             LOG_MSG.debug("new engine")
-            engine=STTGstVosk()
+            with stt_profile_phase("Vosk engine creation"):
+                engine=STTGstVosk()
             self._current_engine=weakref.ref(engine)
-        else:
-            engine.hold()
+            stt_profile_report("Vosk engine created")
 
         return engine
 
+    def new_engine(self):
+        # The actual engine is only created when it is needed
+        return STTGstLazyEngine(self)
+
+    @property
+    def idle_timeout(self):
+        return self.__settings.get_uint("preload-idle-timeout")
+
+    def __release_predicted_engine(self):
+        if self._predicted_id != 0:
+            GLib.source_remove(self._predicted_id)
+            self._predicted_id=0
+
+        if self._predicted is not None:
+            LOG_MSG.info("unloading predictively preloaded engine")
+            self._predicted.release()
+            self._predicted=None
+
+    def __predicted_timeout(self):
+        self._predicted_id=0
+        self.__release_predicted_engine()
+        return False
+
+    def focus_in(self, client):
+        # Preloads the engine if recognition is likely to start in this client
+        history=stt_usage_history()
+        history.add_focus(client)
+
+        if self._preload is not None or \
+           self.__settings.get_boolean("predictive-preload") == False:
+            return
+
+        if history.is_use_likely(client, stt_current_locale().locale) == False:
+            return
+
+        if self._predicted is None:
+            LOG_MSG.info("recognition likely in %s, preloading engine", client)
+            if self._current_engine is None or self._current_engine() is None:
+                stt_vosk_model_prefetch(stt_current_locale().locale)
+
+            self._predicted=self.get_engine()
+            self._predicted.preload()
+        elif self._predicted_id != 0:
+            GLib.source_remove(self._predicted_id)
+            self._predicted_id=0
+
+        idle_timeout=self.idle_timeout
+        if idle_timeout != 0:
+            self._predicted_id=GLib.timeout_add_seconds(idle_timeout, self.__predicted_timeout)
+
+    def recording_started(self, client):
+        stt_usage_history().add_start(client, stt_current_locale().locale)
+
     def __update_preloaded_engine(self):
         preload=self.__settings.get_boolean("preload")
         if preload == (self._preload is not None):
             return
 
         if preload is True:
+            # No need to guess any more
+            self.__release_predicted_engine()
+
             # This adds a reference if it exists
-            self._preload=self.new_engine()
+            self._preload=self.get_engine()
 
             LOG_MSG.info("preloading engine")
             self._preload.preload()
@@ -71,6 +346,10 @@ class STTGstFactory(GObject.GObject):
     def __preload_changed(self, settings, key):
         self.__update_preloaded_engine()
 
+    def __predictive_preload_changed(self, settings, key):
+        if settings.get_boolean("predictive-preload") == False:
+            self.__release_predicted_engine()
+
 _GLOBAL_FACTORY = None
 
 def stt_gst_factory_default() :
@@ -0,0 +1,253 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import logging
+import threading
+
+from collections import deque
+
+from gi.repository import GLib
+from gi.repository import GObject
+from gi.repository import Gst
+
+LOG_MSG=logging.getLogger()
+
+# Weight of the last buffer in the running real time factor
+_RTF_SMOOTHING = 0.05
+
+class STTGstMonitor(GObject.Object):
+    __gtype_name__="STTGstMonitor"
+
+    __gsignals__={
+        # Emitted (in the main loop) when the real time factor stayed above
+        # the threshold for longer than the delay.
+        "overloaded": (GObject.SIGNAL_RUN_FIRST, None, ()),
+    }
+
+    def __init__(self, capture_pad, processed_pad, audio_queue=None):
+        super().__init__()
+
+        # STTGstQueue between the two pads whose drops are reported
+        self._audio_queue=audio_queue
+
+        # Buffers are timestamped when they leave the audio source and when
+        # they leave the recognizer (that is once they have been decoded). The
+        # two probes can run in different streaming threads.
+        self._lock=threading.Lock()
+        self._pending=deque()
+
+        self.threshold=1.0
+        self.delay=10.0
+
+        self._reset()
+
+        self._capture_pad=capture_pad
+        self._processed_pad=processed_pad
+
+        # Without a recognizer (processed_pad is None), nothing is measured
+        self._capture_probe_id=0
+        self._processed_probe_id=0
+        if processed_pad is None:
+            return
+
+        self._capture_probe_id=capture_pad.add_probe(Gst.PadProbeType.BUFFER,
+                                                      self._capture_probe_cb)
+        self._processed_probe_id=processed_pad.add_probe(Gst.PadProbeType.BUFFER,
+                                                          self._processed_probe_cb)
+
+    def destroy(self):
+        if self._processed_pad is not None:
+            self._capture_pad.remove_probe(self._capture_probe_id)
+            self._processed_pad.remove_probe(self._processed_probe_id)
+
+        self._capture_pad=None
+        self._processed_pad=None
+        self._audio_queue=None
+
+    def _reset(self):
+        self._pending.clear()
+        self._last_processed_time=0.0
+        self._overloaded_since=None
+        self._overloaded_signalled=False
+
+        self.real_time_factor=0.0
+        self.latency=0.0
+
+        # Running time spent decoding a buffer (in seconds)
+        self.decode_time=0.0
+        self.processed_num=0
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    @property
+    def queue_depth(self):
+        # Number of buffers captured but not decoded yet
+        return len(self._pending)
+
+    @property
+    def dropped_buffers(self):
+        # Buffers the audio queue dropped instead of passing them on
+        if self._audio_queue is None:
+            return 0
+
+        return self._audio_queue.dropped_buffers
+
+    @property
+    def dropped_time(self):
+        # In milliseconds (only known for silence)
+        if self._audio_queue is None:
+            return 0.0
+
+        return self._audio_queue.dropped_time
+
+    def _capture_probe_cb(self, pad, info):
+        buffer=info.get_buffer()
+        if buffer.pts == Gst.CLOCK_TIME_NONE:
+            return Gst.PadProbeReturn.OK
+
+        with self._lock:
+            self._pending.append((buffer.pts, time.monotonic()))
+
+        return Gst.PadProbeReturn.OK
+
+    def _emit_overloaded(self):
+        LOG_MSG.debug("recognition is too slow (real time factor=%f, dropped buffers=%i)",
+                      self.real_time_factor, self.dropped_buffers)
+        self.emit("overloaded")
+        return False
+
+    def _processed_probe_cb(self, pad, info):
+        buffer=info.get_buffer()
+        if buffer.pts == Gst.CLOCK_TIME_NONE or \
+           buffer.duration in [Gst.CLOCK_TIME_NONE, 0]:
+            return Gst.PadProbeReturn.OK
+
+        now=time.monotonic()
+        with self._lock:
+            capture_time=None
+            while self._pending and self._pending[0][0] <= buffer.pts:
+                pts, capture_time=self._pending.popleft()
+
+            if capture_time is None:
+                return Gst.PadProbeReturn.OK
+
+            # The recognizer could only start working on this buffer once it
+            # was captured and once it was done with the previous one.
+            processing_time=now-max(capture_time, self._last_processed_time)
+            self._last_processed_time=now
+
+            rtf=processing_time*Gst.SECOND/buffer.duration
+            self.real_time_factor+=(rtf-self.real_time_factor)*_RTF_SMOOTHING
+            self.decode_time+=(processing_time-self.decode_time)*_RTF_SMOOTHING
+            self.processed_num+=1
+            self.latency=now-capture_time
+
+            if self.real_time_factor <= self.threshold:
+                self._overloaded_since=None
+                self._overloaded_signalled=False
+            elif self._overloaded_since is None:
+                self._overloaded_since=now
+            elif now-self._overloaded_since >= self.delay and \
+                 self._overloaded_signalled == False:
+                self._overloaded_signalled=True
+                GLib.idle_add(self._emit_overloaded)
+
+        return Gst.PadProbeReturn.OK
+
+class STTGstStageProfiler():
+    # Measures the time elements of a pipeline (stages) spend processing audio,
+    # from the moment a buffer enters an element to the moment the last buffer
+    # it produced from it leaves. This only works for elements that push
+    # buffers from their chain function (filters, vosk), not queues.
+
+    def __init__(self):
+        self._lock=threading.Lock()
+        self._local=threading.local()
+
+        # Element name -> [element, sink probe, src probe, processing time, audio duration]
+        self._stages={}
+
+    def add(self, element):
+        name=element.get_name()
+        stage=[element, 0, 0, 0.0, 0]
+        stage[1]=element.get_static_pad("sink").add_probe(Gst.PadProbeType.BUFFER,
+                                                          self._sink_probe_cb, name)
+        stage[2]=element.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER,
+                                                         self._src_probe_cb, name)
+        with self._lock:
+            self._stages[name]=stage
+
+    def remove(self, element):
+        with self._lock:
+            stage=self._stages.pop(element.get_name(), None)
+
+        if stage is not None:
+            element.get_static_pad("sink").remove_probe(stage[1])
+            element.get_static_pad("src").remove_probe(stage[2])
+
+    def destroy(self):
+        for stage in list(self._stages.values()):
+            self.remove(stage[0])
+
+    def reset(self):
+        with self._lock:
+            for stage in self._stages.values():
+                stage[3]=0.0
+                stage[4]=0
+
+    def _sink_probe_cb(self, pad, info, name):
+        buffer=info.get_buffer()
+        with self._lock:
+            stage=self._stages.get(name)
+            if stage is not None and buffer.duration != Gst.CLOCK_TIME_NONE:
+                stage[4]+=buffer.duration
+
+        # Streaming threads only deal with one buffer at a time
+        setattr(self._local, name, time.perf_counter())
+        return Gst.PadProbeReturn.OK
+
+    def _src_probe_cb(self, pad, info, name):
+        start=getattr(self._local, name, None)
+        if start is None:
+            return Gst.PadProbeReturn.OK
+
+        now=time.perf_counter()
+        with self._lock:
+            stage=self._stages.get(name)
+            if stage is not None:
+                stage[3]+=now-start
+
+        # Next buffers made from the same input only add what came after
+        setattr(self._local, name, now)
+        return Gst.PadProbeReturn.OK
+
+    def get_stats(self):
+        # List of (name, processing time in seconds, audio duration in seconds)
+        with self._lock:
+            return [(name, stage[3], stage[4]/Gst.SECOND) for name, stage in self._stages.items()]
+
+    def log_stats(self):
+        for name, processing_time, audio_duration in self.get_stats():
+            if audio_duration == 0:
+                continue
+
+            LOG_MSG.info("%s: %.1f ms of processing per second of audio",
+                         name, processing_time*1000/audio_duration)
@@ -0,0 +1,187 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import logging
+import threading
+
+from array import array
+from enum import Enum
+
+from gi.repository import GObject
+from gi.repository import Gst
+
+from sttsettings import stt_settings
+
+LOG_MSG=logging.getLogger()
+
+class STTQueuePolicy(Enum):
+    # Wait for the recognizer; audio is lost in the source when it overruns
+    BLOCK = "block"
+    # Drop the oldest audio to make room for the new one
+    DROP_OLDEST = "drop-oldest"
+    # Only drop silent audio
+    DROP_SILENCE = "drop-silence"
+
+# Values of the leaky property of the queue element
+_LEAKY_NO = 0
+_LEAKY_DOWNSTREAM = 2
+
+# Peak amplitude of S16 samples below which a buffer is silent (about -40 dBFS)
+_SILENCE_PEAK = 328
+
+def _helper_is_silent(buffer):
+    success, map_info = buffer.map(Gst.MapFlags.READ)
+    if success == False:
+        return False
+
+    try:
+        samples=array("h", map_info.data)
+    finally:
+        buffer.unmap(map_info)
+
+    if len(samples) == 0:
+        return True
+
+    if sys.byteorder == "big":
+        samples.byteswap()
+
+    return bool(max(samples) < _SILENCE_PEAK and min(samples) > -_SILENCE_PEAK)
+
+class STTGstQueue(GObject.Object):
+    __gtype_name__="STTGstQueue"
+
+    def __init__(self, queue):
+        super().__init__()
+
+        self._queue=queue
+
+        # Counters are updated from streaming threads
+        self._lock=threading.Lock()
+        self._reset()
+
+        self._settings=stt_settings().gsettings
+        self._settings.connect("changed::audio-queue-size", self._settings_changed)
+        self._settings.connect("changed::audio-queue-policy", self._settings_changed)
+        self._apply_settings()
+
+        self._overrun_id=self._queue.connect("overrun", self._overrun_cb)
+
+        self._sink_pad=self._queue.get_static_pad("sink")
+        self._probe_id=self._sink_pad.add_probe(Gst.PadProbeType.BUFFER,
+                                                self._sink_probe_cb)
+
+    def destroy(self):
+        self._sink_pad.remove_probe(self._probe_id)
+        self._sink_pad=None
+
+        self._queue.disconnect(self._overrun_id)
+        self._queue=None
+
+        self._settings.disconnect_by_func(self._settings_changed)
+        self._settings=None
+
+    def _reset(self):
+        self._overruns=0
+        self._dropped_buffers=0
+        self._dropped_time=0
+        self._max_level=0
+
+    def reset(self):
+        with self._lock:
+            self._reset()
+
+    def _apply_settings(self):
+        try:
+            self._policy=STTQueuePolicy(self._settings.get_string("audio-queue-policy"))
+        except ValueError:
+            self._policy=STTQueuePolicy.BLOCK
+
+        self._max_size_time=self._settings.get_uint("audio-queue-size")*Gst.MSECOND
+        LOG_MSG.debug("audio queue policy=%s, size=%i ms", self._policy, self._max_size_time/Gst.MSECOND)
+
+        # Only time matters, let's not be limited by anything else
+        self._queue.set_property("max-size-buffers", 0)
+        self._queue.set_property("max-size-bytes", 0)
+        self._queue.set_property("max-size-time", self._max_size_time)
+        self._queue.set_property("leaky", _LEAKY_DOWNSTREAM if self._policy == STTQueuePolicy.DROP_OLDEST else _LEAKY_NO)
+
+    def _settings_changed(self, settings, key):
+        self._apply_settings()
+
+    def _overrun_cb(self, queue):
+        # When leaky, the queue drops the oldest buffer after emitting this
+        with self._lock:
+            self._overruns+=1
+            if self._policy == STTQueuePolicy.DROP_OLDEST:
+                self._dropped_buffers+=1
+
+    def _sink_probe_cb(self, pad, info):
+        level=self._queue.get_property("current-level-time")
+
+        with self._lock:
+            self._max_level=max(self._max_level, level)
+
+        # Only drop silence when the queue is getting full so that the
+        # recognizer still gets the pauses between words in normal operation.
+        if self._policy != STTQueuePolicy.DROP_SILENCE or \
+           level < self._max_size_time/2:
+            return Gst.PadProbeReturn.OK
+
+        buffer=info.get_buffer()
+        if _helper_is_silent(buffer) == False:
+            return Gst.PadProbeReturn.OK
+
+        with self._lock:
+            self._dropped_buffers+=1
+            if buffer.duration != Gst.CLOCK_TIME_NONE:
+                self._dropped_time+=buffer.duration
+
+        return Gst.PadProbeReturn.DROP
+
+    @property
+    def policy(self):
+        return self._policy
+
+    @property
+    def fill_level(self):
+        # In milliseconds
+        return self._queue.get_property("current-level-time")/Gst.MSECOND
+
+    @property
+    def max_fill_level(self):
+        # Highest fill level (in milliseconds) since the last reset
+        return self._max_level/Gst.MSECOND
+
+    @property
+    def overruns(self):
+        return self._overruns
+
+    @property
+    def dropped_buffers(self):
+        return self._dropped_buffers
+
+    @property
+    def dropped_time(self):
+        # In milliseconds (only known for silence)
+        return self._dropped_time/Gst.MSECOND
+
+    def log_stats(self):
+        LOG_MSG.info("audio queue (policy=%s): level=%.0f ms, max level=%.0f ms, overruns=%i, dropped buffers=%i",
+                     self._policy.value, self.fill_level, self.max_fill_level,
+                     self._overruns, self._dropped_buffers)
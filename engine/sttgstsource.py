@@ -0,0 +1,285 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import logging
+
+from gi.repository import GLib
+from gi.repository import GObject
+from gi.repository import Gst
+
+LOG_MSG=logging.getLogger()
+
+# Devices (audio-device setting) are PulseAudio source names. "" is the
+# default source. Devices starting with this prefix are GStreamer descriptions
+# (like "gst:audiotestsrc is-live=true") to stand in for a microphone.
+_DESCRIPTION_PREFIX = "gst:"
+
+# Delay (in seconds) before trying again a source that failed
+_RETRY_DELAY = 2
+
+# Attempts with the default source before giving up
+_MAX_RETRIES = 5
+
+def _helper_device_name(device):
+    # The name of the PulseAudio source (as in the audio-device setting)
+    if device.find_property("internal-name") is not None:
+        return device.get_property("internal-name")
+
+    properties=device.get_properties()
+    if properties is not None:
+        return properties.get_string("node.name")
+
+    return None
+
+class STTGstSource(GObject.Object):
+    # Records audio for a pipeline. It is a bin whose source element can be
+    # replaced (when the user chooses another device or when the device fails)
+    # while the rest of the pipeline, and especially the model loaded by vosk,
+    # stays as it is.
+    __gtype_name__="STTGstSource"
+
+    def __init__(self, pipeline, caps_filter, device=None, fallback_device=""):
+        # If device is None, the audio-device setting is followed
+        super().__init__()
+
+        self._pipeline=pipeline
+        self._caps_filter=caps_filter
+        self._fallback_device=fallback_device
+
+        self._bin=Gst.Bin.new("AudioSourceBin")
+        self._pad=Gst.GhostPad.new_no_target("src", Gst.PadDirection.SRC)
+        self._bin.add_pad(self._pad)
+        self._pipeline.add(self._bin)
+        self._bin.link(self._caps_filter)
+
+        self._element=None
+        self._resample=None
+        self._caps=None
+        self._blocksize=0
+
+        self._device=None
+        self._retries=0
+        self._retry_id=0
+
+        self._device_monitor=None
+
+        self._settings=None
+        if device is None:
+            from sttsettings import stt_settings
+
+            self._settings=stt_settings().gsettings
+            self._settings.connect("changed::audio-device", self._device_setting_changed)
+            device=self._settings.get_string("audio-device")
+
+        self._wanted_device=device
+        self._update_device_monitor()
+        self.set_device(device)
+
+    def destroy(self):
+        if self._settings is not None:
+            self._settings.disconnect_by_func(self._device_setting_changed)
+            self._settings=None
+
+        self._stop_retry()
+        self._stop_device_monitor()
+
+        self._element=None
+        self._resample=None
+        self._pad=None
+        self._bin=None
+
+    @property
+    def pad(self):
+        # Probes stay on this pad when the source element is replaced
+        return self._pad
+
+    @property
+    def device(self):
+        return self._device
+
+    def owns(self, element):
+        while element is not None:
+            if element == self._bin:
+                return True
+
+            element=element.get_parent()
+
+        return False
+
+    def _create_element(self, device):
+        if device.startswith(_DESCRIPTION_PREFIX) == True:
+            try:
+                return Gst.parse_bin_from_description(device[len(_DESCRIPTION_PREFIX):], True)
+            except GLib.Error as error:
+                LOG_MSG.error("wrong source description %s (%s)", device, error.message)
+                return None
+
+        element=Gst.ElementFactory.make("pulsesrc", None)
+        if element is not None and device != "":
+            element.set_property("device", device)
+
+        return element
+
+    def _link(self):
+        # Resampling is only needed if the source cannot record at our rate.
+        # Sound servers can record at any rate.
+        src_pad=self._element.get_static_pad("src")
+        need_resample=bool(self._caps is not None and \
+                           src_pad.query_caps(None).can_intersect(self._caps) == False)
+
+        self._pad.set_target(None)
+        if src_pad.is_linked() == True:
+            src_pad.unlink(src_pad.get_peer())
+
+        if need_resample == True and self._resample is None:
+            LOG_MSG.debug("source cannot record with %s, resampling", self._caps.to_string())
+            self._resample=Gst.ElementFactory.make("audioresample", "AudioResample")
+            self._bin.add(self._resample)
+            self._resample.sync_state_with_parent()
+        elif need_resample == False and self._resample is not None:
+            self._resample.set_state(Gst.State.NULL)
+            self._bin.remove(self._resample)
+            self._resample=None
+
+        if self._resample is not None:
+            self._element.link(self._resample)
+            self._pad.set_target(self._resample.get_static_pad("src"))
+        else:
+            self._pad.set_target(src_pad)
+
+    def _apply_blocksize(self):
+        if self._blocksize != 0 and self._element.find_property("blocksize") is not None:
+            self._element.set_property("blocksize", self._blocksize)
+
+    def set_device(self, device):
+        # Can be called while recording: only the source element changes
+        element=self._create_element(device)
+        if element is None:
+            LOG_MSG.error("no source for device \"%s\"", device)
+            return False
+
+        LOG_MSG.info("recording from device \"%s\"", device)
+        old_element=self._element
+        if old_element is not None:
+            # Stops its streaming thread
+            old_element.set_state(Gst.State.NULL)
+            self._bin.remove(old_element)
+
+        self._element=element
+        self._device=device
+        self._bin.add(element)
+        self._apply_blocksize()
+        self._link()
+        element.sync_state_with_parent()
+        return True
+
+    def set_caps(self, caps):
+        self._caps=caps
+        if self._element is not None:
+            self._link()
+
+    def set_blocksize(self, blocksize):
+        self._blocksize=blocksize
+        if self._element is not None:
+            self._apply_blocksize()
+
+    def _stop_retry(self):
+        if self._retry_id != 0:
+            GLib.source_remove(self._retry_id)
+            self._retry_id=0
+
+    def _retry(self):
+        self._retry_id=0
+        self.set_device(self._device)
+        return False
+
+    def failover(self):
+        # Called when the source posted an error
+        if self._retry_id != 0:
+            return
+
+        if self._device != self._fallback_device:
+            LOG_MSG.warning("device \"%s\" failed, using \"%s\"", self._device, self._fallback_device)
+            self.set_device(self._fallback_device)
+            return
+
+        self._retries+=1
+        if self._retries > _MAX_RETRIES:
+            LOG_MSG.error("device \"%s\" keeps failing, giving up", self._device)
+            return
+
+        LOG_MSG.warning("device \"%s\" failed, trying again in %i seconds", self._device, _RETRY_DELAY)
+        self._retry_id=GLib.timeout_add_seconds(_RETRY_DELAY, self._retry)
+
+    def state_changed(self, element, state):
+        # Called when an element of the source changed state: a source that
+        # records again gets all its attempts back the next time it fails
+        if element == self._element and state == Gst.State.PLAYING and self._retries != 0:
+            LOG_MSG.debug("device \"%s\" is recording again", self._device)
+            self._retries=0
+
+    def _device_setting_changed(self, settings, key):
+        self._wanted_device=settings.get_string(key)
+        self._stop_retry()
+        self._retries=0
+        self._update_device_monitor()
+        self.set_device(self._wanted_device)
+
+    def _device_monitor_cb(self, bus, message):
+        # Go back to the device the user chose when it is plugged again and
+        # leave it when it is unplugged.
+        if message.type == Gst.MessageType.DEVICE_ADDED:
+            if self._device != self._wanted_device and \
+               _helper_device_name(message.parse_device_added()) == self._wanted_device:
+                LOG_MSG.info("device \"%s\" is back", self._wanted_device)
+                self._stop_retry()
+                self._retries=0
+                self.set_device(self._wanted_device)
+        elif message.type == Gst.MessageType.DEVICE_REMOVED:
+            if self._device == self._wanted_device and \
+               _helper_device_name(message.parse_device_removed()) == self._wanted_device:
+                LOG_MSG.info("device \"%s\" was removed", self._wanted_device)
+                self.set_device(self._fallback_device)
+
+        return True
+
+    def _stop_device_monitor(self):
+        if self._device_monitor is None:
+            return
+
+        self._device_monitor.get_bus().remove_watch()
+        self._device_monitor.stop()
+        self._device_monitor=None
+
+    def _update_device_monitor(self):
+        # Only needed to follow a device the user chose
+        if self._wanted_device in ("", self._fallback_device) or \
+           self._wanted_device.startswith(_DESCRIPTION_PREFIX) == True:
+            self._stop_device_monitor()
+            return
+
+        if self._device_monitor is not None:
+            return
+
+        self._device_monitor=Gst.DeviceMonitor.new()
+        self._device_monitor.add_filter("Audio/Source", None)
+        self._device_monitor.get_bus().add_watch(GLib.PRIORITY_DEFAULT, self._device_monitor_cb)
+        if self._device_monitor.start() == False:
+            LOG_MSG.warning("cannot monitor audio devices")
+            self._device_monitor.get_bus().remove_watch()
+            self._device_monitor=None
@@ -16,45 +16,73 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import json
 import logging
 
+from pathlib import Path
+
+from gi.repository import GObject
 from gi.repository import Gst
 
 from sttutils import *
 from sttgstbase import STTGstBase
+from sttgstmonitor import STTGstMonitor, STTGstStageProfiler
+from sttgstdsp import stt_gst_dsp_new_from_settings
+from sttgstqueue import STTGstQueue
+from sttgstsource import STTGstSource
 
+from sttsettings import stt_settings
 from sttcurrentlocale import stt_current_locale
-from sttvoskmodel import STTVoskModel
+from sttvoskmodel import STTVoskModel, DEFAULT_SAMPLE_RATE
+from sttvoskresult import STTVoskResultType, stt_vosk_result_decode
 
 LOG_MSG=logging.getLogger()
 
+# Samples are 16 bits mono
+_BYTES_PER_SAMPLE = 2
+
+# Durations of buffers (in milliseconds) the automatic mode (chunk-duration
+# set to 0) chooses from. Shorter buffers give partial results sooner but the
+# recognizer spends more time per second of audio. Shorter ones than 100 ms can
+# still be set with chunk-duration.
+_AUTO_CHUNK_DURATIONS = (100, 200, 400)
+
+# Shortest automatic durations with and without partial results
+_PARTIAL_CHUNK_DURATION = 100
+_NO_PARTIAL_CHUNK_DURATION = 200
+
+# Buffers must be longer when decoding takes more than this share of their
+# duration and can be shorter below the other one.
+_MAX_DECODE_RATIO = 0.5
+_MIN_DECODE_RATIO = 0.2
+
+# Buffers to decode before trusting the time decoding takes
+_MIN_MEASURED_BUFFERS = 50
+
 class STTGstVosk(STTGstBase):
     __gtype_name__ = 'STTGstVosk'
 
+    __gsignals__ = {
+        # Emitted when a smaller model is used since recognition was too slow
+        'model-downgraded': (GObject.SIGNAL_RUN_FIRST, None, (str,)),
+    }
+
     #"removesilence remove=true minimum-silence-time=3000000000 squash=true silent=false ! " \
     #"removesilence remove=true minimum-silence-time=1000000000 threshold=-40 squash=true silent=false ! " \
     #slave-method=3 /                   "queue max-size-bytes=4294967295 ! " \
     #"queue2 max-size-bytes=4294967294 name=Buffer max-size-time=0 max-size-buffers=0 ! " \
-    _pipeline_def="pulsesrc blocksize=3200 buffer-time=9223372036854775807 ! " \
-                  "audio/x-raw,format=S16LE,rate=16000,channels=1 ! " \
-                  "webrtcdsp noise-suppression-level=3 echo-cancel=false ! " \
+    # The queue bounds the latency when the recognizer falls behind (see
+    # STTGstQueue for its size and what happens when it is full).
+    # The caps (and the block size of the source) are changed to follow the
+    # sample rate of the model, see _update_audio_format(). The source is
+    # added before the caps by STTGstSource and audio processing (webrtcdsp)
+    # after them, see _set_dsp().
+    _pipeline_def="capsfilter name=AudioCaps caps=audio/x-raw,format=S16LE,rate=16000,channels=1 ! " \
+                  "queue name=AudioQueue ! " \
                   "vosk name=VoskMain ! " \
                   "fakesink"
 
-    _pipeline_def_alt="pulsesrc blocksize=3200 buffer-time=9223372036854775807 ! " \
-                      "audio/x-raw,format=S16LE,rate=16000,channels=1 ! " \
-                      "vosk name=VoskMain ! " \
-                      "fakesink"
-
     def __init__(self, current_locale=None):
-        plugin=Gst.Registry.get().find_plugin("webrtcdsp")
-        if plugin is not None:
-            super().__init__(pipeline_definition=STTGstVosk._pipeline_def)
-            LOG_MSG.debug("using Webrtcdsp plugin")
-        else:
-            super().__init__(pipeline_definition=STTGstVosk._pipeline_def_alt)
-            LOG_MSG.debug("not using Webrtcdsp plugin")
+        super().__init__(pipeline_definition=STTGstVosk._pipeline_def)
 
         if self.pipeline is None:
             LOG_MSG.error("pipeline was not created")
@@ -66,6 +94,51 @@ class STTGstVosk(STTGstBase):
 
         self._bus_id = self.bus.connect("message::element", self.__handle_vosk_message)
 
+        # Ask for word results (timestamps and confidences) if the version of
+        # the element supports it.
+        for property_name in ("words", "partial-words"):
+            if self._vosk is not None and \
+               hasattr(self._vosk.props, property_name.replace("-", "_")):
+                self._vosk.set_property(property_name, True)
+
+        self._queue_element=self.pipeline.get_by_name("AudioQueue")
+        self._queue=STTGstQueue(self._queue_element)
+
+        # Check that recognition keeps up with real time
+        self._settings=stt_settings().gsettings
+        self._settings.connect("changed::downgrade-threshold", self._monitor_settings_changed)
+        self._settings.connect("changed::downgrade-delay", self._monitor_settings_changed)
+
+        # Format of the audio given to vosk
+        self._caps_filter=self.pipeline.get_by_name("AudioCaps")
+        self._source=STTGstSource(self.pipeline, self._caps_filter)
+        self._source.set_caps(self._caps_filter.get_property("caps"))
+        self._sample_rate=DEFAULT_SAMPLE_RATE
+        self._source_error_id=self.bus.connect("message::error", self._source_error_cb)
+        self._source_state_changed_id=self.bus.connect("message::state-changed", self._source_state_changed_cb)
+
+        self._use_partial_results=True
+        self._auto_chunk_duration=_PARTIAL_CHUNK_DURATION
+        self._settings.connect("changed::chunk-duration", self._chunk_duration_changed)
+        self._update_block_size()
+
+        self._monitor=STTGstMonitor(self._source.pad,
+                                    self._vosk.get_static_pad("src") if self._vosk is not None else None,
+                                    self._queue)
+        self._monitor_id=self._monitor.connect("overloaded", self._monitor_overloaded_cb)
+        self._update_monitor_settings()
+
+        # Time spent by each stage, logged after recording
+        self._profiler=STTGstStageProfiler()
+        if self._vosk is not None:
+            self._profiler.add(self._vosk)
+
+        self._dsp=None
+        self._dsp_changed=False
+        for key in ("noise-suppression", "gain-control", "high-pass-filter"):
+            self._settings.connect("changed::"+key, self._dsp_settings_changed)
+        self._set_dsp()
+
         if current_locale is None:
             self._current_locale = stt_current_locale()
         else:
@@ -75,6 +148,7 @@ class STTGstVosk(STTGstBase):
 
         self._model_id = 0
         self._model = None
+        self._looking_for_model=False
         self._set_model()
 
     def __del__(self):
@@ -89,10 +163,36 @@ class STTGstVosk(STTGstBase):
             self._model.disconnect(self._model_id)
             self._model_id = 0
 
+        self._model = None
+
         self.bus.disconnect(self._bus_id)
         self._bus_id = 0
+        self.bus.disconnect(self._source_error_id)
+        self._source_error_id = 0
+        self.bus.disconnect(self._source_state_changed_id)
+        self._source_state_changed_id = 0
+
+        self._settings.disconnect_by_func(self._monitor_settings_changed)
+        self._settings.disconnect_by_func(self._chunk_duration_changed)
+        self._settings.disconnect_by_func(self._dsp_settings_changed)
+        self._settings=None
+
+        self._monitor.disconnect(self._monitor_id)
+        self._monitor_id = 0
+        self._monitor.destroy()
+        self._monitor=None
+
+        self._profiler.destroy()
+        self._profiler=None
+        self._dsp=None
+
+        self._queue.destroy()
+        self._queue=None
 
         self._vosk = None
+        self._source.destroy()
+        self._source = None
+        self._caps_filter = None
 
         LOG_MSG.info("Vosk.destroy() called")
         super().destroy()
@@ -120,6 +220,8 @@ class STTGstVosk(STTGstBase):
 
         # Model can only be changed when in READY state
         self._vosk.set_property ("speech-model", new_model_path)
+        self._update_audio_format()
+        self._monitor.reset()
 
         if state >= Gst.State.READY:
             self.pipeline.set_state(state)
@@ -127,6 +229,109 @@ class STTGstVosk(STTGstBase):
         # Warn of our state change
         self.emit("model-changed")
 
+    def _set_dsp(self):
+        # The pipeline must not be recording
+        self._dsp_changed=False
+        if self._dsp is not None:
+            self._profiler.remove(self._dsp)
+            self._caps_filter.unlink(self._dsp)
+            self._dsp.unlink(self._queue_element)
+            self._dsp.set_state(Gst.State.NULL)
+            self.pipeline.remove(self._dsp)
+            self._dsp=None
+        else:
+            self._caps_filter.unlink(self._queue_element)
+
+        self._dsp=stt_gst_dsp_new_from_settings(self._settings)
+        if self._dsp is None:
+            self._caps_filter.link(self._queue_element)
+            return
+
+        self.pipeline.add(self._dsp)
+        self._caps_filter.link(self._dsp)
+        self._dsp.link(self._queue_element)
+        self._dsp.sync_state_with_parent()
+        self._profiler.add(self._dsp)
+
+    def _dsp_settings_changed(self, settings, key):
+        # Applied when recording starts again if needed
+        if self.is_running() == True:
+            self._dsp_changed=True
+            return
+
+        self._set_dsp()
+
+        # Processing may not support the rate of the model (or may have been
+        # what prevented from using it)
+        self._update_audio_format()
+
+    def _update_audio_format(self):
+        # Record at the rate the model expects so that vosk does not resample.
+        # Narrowband models (8 kHz) need half of the audio data of others.
+        sample_rate=self._model.get_sample_rate() if self._model is not None else DEFAULT_SAMPLE_RATE
+        caps=Gst.Caps.from_string("audio/x-raw,format=S16LE,rate=%i,channels=1" % sample_rate)
+
+        # Elements after the caps (webrtcdsp) may only accept some rates
+        if sample_rate != DEFAULT_SAMPLE_RATE and \
+           self._caps_filter.get_static_pad("src").peer_query_caps(None).can_intersect(caps) == False:
+            LOG_MSG.info("pipeline does not accept %i Hz, using %i Hz", sample_rate, DEFAULT_SAMPLE_RATE)
+            sample_rate=DEFAULT_SAMPLE_RATE
+            caps=Gst.Caps.from_string("audio/x-raw,format=S16LE,rate=%i,channels=1" % sample_rate)
+
+        if sample_rate == self._sample_rate:
+            return
+
+        LOG_MSG.debug("recording at %i Hz", sample_rate)
+        self._sample_rate=sample_rate
+        self._caps_filter.set_property("caps", caps)
+        self._source.set_caps(caps)
+        self._update_block_size()
+
+    def _update_block_size(self):
+        chunk_duration=self._settings.get_uint("chunk-duration")
+        if chunk_duration == 0:
+            chunk_duration=self._auto_chunk_duration
+
+        LOG_MSG.debug("audio buffers of %i ms", chunk_duration)
+        self._source.set_blocksize(self._sample_rate*_BYTES_PER_SAMPLE*chunk_duration//1000)
+
+    def _chunk_duration_changed(self, settings, key):
+        self._update_block_size()
+
+    def _tune_chunk_duration(self):
+        # Automatic mode: use the shortest buffers the recognizer keeps up with,
+        # from what was measured while recording. It applies to the next
+        # recording.
+        if self._settings.get_uint("chunk-duration") != 0 or \
+           self._monitor.processed_num < _MIN_MEASURED_BUFFERS:
+            return
+
+        decode_ratio=self._monitor.decode_time*1000/self._auto_chunk_duration
+        min_duration=_PARTIAL_CHUNK_DURATION if self._use_partial_results == True else _NO_PARTIAL_CHUNK_DURATION
+        index=_AUTO_CHUNK_DURATIONS.index(self._auto_chunk_duration)
+        if decode_ratio > _MAX_DECODE_RATIO and index < len(_AUTO_CHUNK_DURATIONS)-1:
+            index+=1
+        elif decode_ratio < _MIN_DECODE_RATIO and _AUTO_CHUNK_DURATIONS[index] > min_duration:
+            index-=1
+        else:
+            return
+
+        LOG_MSG.info("decoding takes %.0f%% of buffer duration, using buffers of %i ms",
+                     decode_ratio*100, _AUTO_CHUNK_DURATIONS[index])
+        self._auto_chunk_duration=_AUTO_CHUNK_DURATIONS[index]
+        self._update_block_size()
+
+    def _source_error_cb(self, bus, message):
+        # Switching devices does not touch the rest of the pipeline, so the
+        # model does not need to be loaded again
+        if self._source.owns(message.src) == True:
+            self._source.failover()
+
+    def _source_state_changed_cb(self, bus, message):
+        if self._source.owns(message.src) == True:
+            old_state, new_state, pending=message.parse_state_changed()
+            self._source.state_changed(message.src, new_state)
+
     def _model_changed(self, model):
         self._set_model_path()
 
@@ -149,54 +354,87 @@ class STTGstVosk(STTGstBase):
     def _locale_changed(self, locale):
         self._set_model()
 
-    def _parse_json (self, json_text):
-        if json_text in [None,""]:
-            LOG_MSG.debug("empty json answer")
-            return
+    def _update_monitor_settings(self):
+        self._monitor.threshold=self._settings.get_double("downgrade-threshold")
+        self._monitor.delay=self._settings.get_uint("downgrade-delay")
+
+    def _monitor_settings_changed(self, settings, key):
+        self._update_monitor_settings()
 
-        LOG_MSG.debug("JSON string %s", json_text)
-        try:
-            # Catch ill-formatted files
-            json_data = json.loads(json_text)
+    def _monitor_overloaded_cb(self, monitor):
+        LOG_MSG.info("recognition too slow (real time factor=%f, queue depth=%i, latency=%f, dropped buffers=%i, dropped silence=%.0f ms)",
+                     monitor.real_time_factor, monitor.queue_depth, monitor.latency,
+                     monitor.dropped_buffers, monitor.dropped_time)
+        self._queue.log_stats()
 
-        except json.JSONDecodeError:
-            LOG_MSG.error("the format of the JSON string is not correct")
+        if self._settings.get_boolean("auto-downgrade") == False:
             return
 
-        partial_text = json_data.get("partial")
-        if partial_text != None:
-            if partial_text != "":
-                self.emit("partial-text", partial_text)
+        # Walking the model directories would make things worse here
+        if self._looking_for_model == True:
             return
 
-        text = json_data.get("text")
-        if text != None:
-            if text != "":
-                self.emit("text", text)
+        self._looking_for_model=True
+        self._model.find_smaller_model(self._smaller_model_found)
+
+    def _smaller_model_found(self, model, model_name):
+        self._looking_for_model=False
+
+        # The locale (or the engine) may have changed in the meantime
+        if model is not self._model:
+            return False
+
+        if model_name is None:
+            LOG_MSG.info("no smaller model available")
+            return False
+
+        LOG_MSG.info("switching to smaller model (%s)", model_name)
+
+        # This will trigger a model change
+        self._model.use_model(model_name)
+        self.emit("model-downgraded", Path(model_name).name)
+        return False
+
+    @property
+    def audio_queue(self):
+        return self._queue
+
+    def _run_real(self):
+        if self._dsp_changed == True:
+            self._set_dsp()
+            self._update_audio_format()
+
+        self._monitor.reset()
+        self._queue.reset()
+        self._profiler.reset()
+        return super()._run_real()
+
+    def _stop_real(self):
+        self._queue.log_stats()
+        self._profiler.log_stats()
+        self._tune_chunk_duration()
+        return super()._stop_real()
+
+    def _emit_result(self, result):
+        if result is None:
             return
 
-        json_alternatives = json_data.get("alternatives")
-        if json_alternatives != None:
-            text_alternatives = []
-            for alternative_iter in json_alternatives:
-                text = alternative_iter.get("text")
-                if text not in [None,""]:
-                    # There are sometimes starting white spaces, remove
-                    text_alternatives.append(text.lstrip())
-
-            # Apparently this is pythonic to check if list is empty or not
-            if text_alternatives:
-                self.emit("alternatives", text_alternatives)
-        else:
-            LOG_MSG.error("unreadable json answer")
+        if result.type == STTVoskResultType.PARTIAL:
+            if result.text != "":
+                self.emit("partial-text", result.text, result.words)
+        elif result.type == STTVoskResultType.TEXT:
+            if result.text != "":
+                self.emit("text", result.text, result.words)
+        elif result.alternatives:
+            self.emit("alternatives", result.alternatives)
 
     def get_final_results(self):
         # There is no final results when not playing or paused
-        self._parse_json(self._vosk.get_property("current-final-results"))
+        self._emit_result(stt_vosk_result_decode(self._vosk.get_property("current-final-results")))
 
     def get_results(self):
         # There is no results when not playing or paused
-        self._parse_json(self._vosk.get_property("current-results"))
+        self._emit_result(stt_vosk_result_decode(self._vosk.get_property("current-results")))
 
     def __handle_vosk_message (self, bus, message):
         msg_struct = message.get_structure ()
@@ -204,7 +442,7 @@ class STTGstVosk(STTGstBase):
         if struct_name is None or struct_name != "vosk":
             return
 
-        self._parse_json(msg_struct.get_string ("current-result"))
+        self._emit_result(stt_vosk_result_decode(msg_struct.get_string ("current-result")))
 
     def set_use_partial_results(self, active):
         if active is False:
@@ -212,6 +450,12 @@ class STTGstVosk(STTGstBase):
         else:
             self._vosk.set_property("partial-results-interval", 0)
 
+        # Without partial results, nothing is gained with short buffers
+        if self._use_partial_results != active:
+            self._use_partial_results=active
+            self._auto_chunk_duration=_PARTIAL_CHUNK_DURATION if active == True else _NO_PARTIAL_CHUNK_DURATION
+            self._update_block_size()
+
     def set_alternatives_num(self, num):
         self._vosk.set_property("alternatives", num)
 
@@ -0,0 +1,112 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import locale
+
+from gettext import gettext as _
+
+from gi.repository import GObject
+
+from sttvoskmodel import stt_vosk_model_snapshot
+from sttvoskmodelmanagers import stt_vosk_online_model_manager
+
+# Display names of locales: (locale, display locale) -> name
+_DISPLAY_NAMES={}
+
+def _helper_display_name(locale_str, display_locale_str):
+    name=_DISPLAY_NAMES.get((locale_str, display_locale_str))
+    if name is not None:
+        return name
+
+    try:
+        from babel import Locale, UnknownLocaleError
+
+        try:
+            name=Locale.parse(locale_str).get_display_name(display_locale_str)
+        except (UnknownLocaleError, ValueError):
+            name=None
+    except ImportError:
+        name=None
+
+    if name in (None, ""):
+        name=locale_str
+
+    _DISPLAY_NAMES[(locale_str, display_locale_str)]=name
+    return name
+
+class STTLocaleItem(GObject.Object):
+    # A locale (and the state of its model) as shown by a STTLocaleRow. There
+    # is an item for every supported locale but rows are only created for the
+    # visible ones.
+    __gtype_name__="STTLocaleItem"
+
+    __gsignals__= {
+        "changed": (GObject.SIGNAL_RUN_FIRST, None, ()),
+    }
+
+    def __init__(self, locale_str):
+        super().__init__()
+
+        self._locale=locale_str
+
+        # Looked up (with Babel) when a row shows the item for the first time
+        self._title=None
+
+        stt_vosk_model_snapshot().connect("changed", self._snapshot_changed)
+
+    def _snapshot_changed(self, snapshot):
+        self.emit("changed")
+
+    @property
+    def locale(self):
+        return self._locale
+
+    @property
+    def title(self):
+        if self._title is None:
+            system_locale_str=locale.getlocale()[0]
+            self._title=_helper_display_name(self._locale, system_locale_str)
+            if system_locale_str == self._locale:
+                self._title = _("%s : system locale") % self._title
+
+        return self._title
+
+    @property
+    def subtitle(self):
+        snapshot=stt_vosk_model_snapshot()
+        if snapshot.available(self._locale) == False:
+            return _("No model downloaded yet")
+
+        model_name=snapshot.get_name(self._locale)
+        if model_name in [None, ""]:
+            return _("Custom model installed manually in a non-standard directory")
+
+        model=stt_vosk_online_model_manager().get_model_description(model_name)
+        if model is None:
+            return _("No description available for the current model (name not found in online database)")
+
+        if model.is_obsolete == True:
+            return _("This model is obsolete - %s") % model.size
+
+        if model.type is not None:
+            if model.type.startswith("big") == True:
+                return _("Large model that may be more accurate than smaller ones - %s") % model.size
+
+            return _("Lightweight model for Android and RPi - %s") % model.size
+
+        return _("No description available for the current model (name not found in online database)")
@@ -28,7 +28,8 @@ from gi.repository import Gtk, Adw, GLib
 
 from sttutils import *
 
-from sttvoskmodelmanagers import STTDownloadState
+from sttprogresschannel import STTDownloadPhase
+from sttdownloadmanager import stt_download_manager, STTDownloadState
 
 LOG_MSG=logging.getLogger()
 
@@ -40,6 +41,8 @@ class STTModelRow(Adw.ActionRow):
     check_button = Gtk.Template.Child()
     model_button = Gtk.Template.Child()
     progress_bar = Gtk.Template.Child()
+    pause_button = Gtk.Template.Child()
+    first_button = Gtk.Template.Child()
 
     def __init__(self, desc=None, model=None, row=None):
         super().__init__()
@@ -50,65 +53,93 @@ class STTModelRow(Adw.ActionRow):
 
         self.update_description()
 
-        # This is used in case a model is being downloaded when row is created
-        if self._desc.download_progress!=STTDownloadState.STOPPED:
-            self.model_button.set_icon_name("process-stop-symbolic")
-            self.progress_bar.set_text(_("Downloading model"))
-            self.progress_bar.set_visible(True)
-            self._update_progress_bar()
-
-            self._update_spinner_id=GLib.timeout_add(250, self._update_spinner)
-        # No "else" here as we leave it to the spinner function to deal with end
-        else:
-            self._update_spinner_id=0
+        # Only listen to progress while shown
+        self._progress_id=0
+        self._manager_id=0
+        self.connect("realize", self._realize_cb)
+        self.connect("unrealize", self._unrealize_cb)
 
         if row is not None:
             self.check_button.set_group(row. check_button)
         else:
             self.check_button.set_group(None)
 
-    def _update_progress_bar(self):
-        if self._desc.download_progress >= STTDownloadState.ONGOING:
-            self.progress_bar.set_fraction(self._desc.download_progress)
-            return True
+    def _realize_cb(self, row):
+        self._progress_id=self._desc.progress.connect("progress", self._progress_cb)
+        self._manager_id=stt_download_manager().connect("changed", self._download_changed_cb)
 
-        if self._desc.download_progress == STTDownloadState.STOPPED:
-            self.progress_bar.set_fraction(0.0)
-            return False
+        # In case a model is being downloaded when the row is shown
+        self._update_download_state()
 
-        self.progress_bar.pulse()
-        if self._desc.download_progress == STTDownloadState.UNPACKING:
-            self.progress_bar.set_text(_("Unpacking model"))
+    def _unrealize_cb(self, row):
+        if self._progress_id != 0:
+            self._desc.progress.disconnect(self._progress_id)
+            self._progress_id=0
 
-        return True
+        if self._manager_id != 0:
+            stt_download_manager().disconnect(self._manager_id)
+            self._manager_id=0
 
-    def _update_spinner(self):
-        if self._update_progress_bar() == False:
-            LOG_MSG.debug("download end")
-            self._update_spinner_id=0
+    def _update_download_state(self):
+        download=stt_download_manager().get_download(self._desc.name)
+        if download is None:
             self.progress_bar.set_visible(False)
-            return False
+            self.progress_bar.set_fraction(0.0)
+            self.pause_button.set_visible(False)
+            self.first_button.set_visible(False)
+            self.update_description()
+            return
 
-        return True
+        self.model_button.set_icon_name("process-stop-symbolic")
+        self.progress_bar.set_visible(True)
+        self.pause_button.set_visible(True)
+        self.first_button.set_visible(download.state == STTDownloadState.QUEUED)
 
-    def _stop_downloading(self):
-        self._desc.stop_downloading()
+        if download.state == STTDownloadState.PAUSED:
+            self.pause_button.set_icon_name("media-playback-start-symbolic")
+            self.pause_button.set_tooltip_text(_("Resume download"))
+            self.progress_bar.set_text(_("Download paused"))
+            return
 
-        self.progress_bar.set_visible(False)
-        self.progress_bar.set_fraction(0.0)
-        self.model_button.set_icon_name("folder-download-symbolic")
+        self.pause_button.set_icon_name("media-playback-pause-symbolic")
+        self.pause_button.set_tooltip_text(_("Pause download"))
 
-        if self._update_spinner_id != 0:
-            GLib.Source.remove(self._update_spinner_id)
-            self._update_spinner_id=0
+        if download.state == STTDownloadState.QUEUED:
+            self.progress_bar.set_text(_("Waiting for other downloads"))
+            self.progress_bar.set_fraction(0.0)
+            return
 
-    def _start_downloading(self):
-        self.model_button.set_icon_name("process-stop-symbolic")
-        self.progress_bar.set_text(_("Downloading model"))
-        self.progress_bar.set_visible(True)
+        self._update_progress_bar(self._desc.progress.progress)
 
-        self._update_spinner_id=GLib.timeout_add(250, self._update_spinner)
-        self._desc.start_downloading()
+    def _update_progress_bar(self, progress):
+        if progress.phase == STTDownloadPhase.UNPACKING:
+            self.progress_bar.set_text(_("Unpacking model"))
+            self.progress_bar.pulse()
+            return
+
+        if progress.rate > 0:
+            self.progress_bar.set_text(_("Downloading model - %s/s") % GLib.format_size(int(progress.rate)))
+        else:
+            self.progress_bar.set_text(_("Downloading model"))
+
+        fraction=progress.fraction
+        if fraction is None:
+            self.progress_bar.pulse()
+        else:
+            self.progress_bar.set_fraction(fraction)
+
+    def _progress_cb(self, channel, progress):
+        # The end of downloads is handled through the manager
+        download=stt_download_manager().get_download(self._desc.name)
+        if download is None or download.state != STTDownloadState.RUNNING:
+            return
+
+        if progress.phase != STTDownloadPhase.STOPPED:
+            self._update_progress_bar(progress)
+
+    def _download_changed_cb(self, manager, name):
+        if name == self._desc.name:
+            self._update_download_state()
 
     def _delete_model(self):
         self._desc.delete_paths()
@@ -116,11 +147,26 @@ class STTModelRow(Adw.ActionRow):
     def _download_model(self):
         if self._desc.paths not in [None, []]:
             self._delete_model()
-        elif self._desc.download_progress==STTDownloadState.STOPPED:
-            self._start_downloading()
+        elif self._desc.downloading == False:
+            self._desc.start_downloading()
         else:
             LOG_MSG.info("cancelling downloading")
-            self._stop_downloading()
+            self._desc.stop_downloading()
+
+    @Gtk.Template.Callback()
+    def pause_button_clicked_cb(self, button):
+        download=stt_download_manager().get_download(self._desc.name)
+        if download is None:
+            return
+
+        if download.state == STTDownloadState.PAUSED:
+            stt_download_manager().resume(self._desc.name)
+        else:
+            stt_download_manager().pause(self._desc.name)
+
+    @Gtk.Template.Callback()
+    def first_button_clicked_cb(self, button):
+        stt_download_manager().move(self._desc.name, 0)
 
     @Gtk.Template.Callback()
     def _download_model_button_clicked_cb(self, button):
@@ -141,7 +187,10 @@ class STTModelRow(Adw.ActionRow):
         # if there no path there has to be a URL
         if self._desc.paths in [None,[]]:
             title=_("%s - available for download") % self._desc.name
-            self.model_button.set_property("icon_name", "folder-download-symbolic")
+            if self._desc.downloading == True:
+                self.model_button.set_property("icon_name", "process-stop-symbolic")
+            else:
+                self.model_button.set_property("icon_name", "folder-download-symbolic")
         else:
             title=_("%s - available on this computer") % self._desc.name
             self.model_button.set_property("icon_name", "edit-delete-symbolic")
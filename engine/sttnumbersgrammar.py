@@ -0,0 +1,182 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import json
+import logging
+
+from pathlib import Path
+
+LOG_MSG=logging.getLogger()
+
+# The grammars used to turn words into digits (data/numbers/config_<lang>.properties)
+# are compiled at build time into numbers_<lang>.json along with the decimal
+# symbols (from CLDR through Babel) of all the locales of the language. So
+# loading a grammar is a single json.load() and Babel is not needed unless
+# there is no compiled file (when running from the source tree for example).
+
+def _helper_parse_properties(path):
+    grammar={"numbers": {},
+             "replace": [],
+             "measures": {},
+             "ignore": {},
+             "point": None,
+             "ordinals": {},
+             "ordinal-suffixes": {},
+             "percent": {},
+             "currencies": {},
+             "subunits": {},
+             "currency-and": None,
+             "months": {},
+             "date-format": None,
+             "date-of": None,
+             "date-cardinal-day": False,
+             "time": {},
+             "time-12h": [],
+             "time-zero": [],
+             "duration-words": [],
+             "hours": {}}
+
+    with open(path, encoding="utf-8") as properties_file:
+        for line in properties_file:
+            if line.strip() == "" or line.startswith("#") == True:
+                continue
+
+            (key, value)=line.split("=")
+            value=value.strip()
+            if key.startswith("replace:"):
+                key=key[len("replace:"):]
+                grammar["replace"].append((key, value))
+            elif key.startswith("measure:"):
+                key=key[len("measure"):]
+                grammar["measures"][str(int(value))]=key
+            elif key.startswith("ignore:"):
+                key=key[len("ignore:"):]
+                grammar["ignore"][key]=list(value.split(","))
+            elif key.startswith("point"):
+                grammar["point"]=value
+            elif key.startswith("ordinal:"):
+                grammar["ordinals"][key[len("ordinal:"):]]=int(value)
+            elif key.startswith("ordinal-suffix"):
+                # ordinal-suffix:1 is only for 1, ordinal-suffix:*1 for all
+                # numbers ending with 1 and ordinal-suffix for the others
+                grammar["ordinal-suffixes"][key[len("ordinal-suffix:"):]]=value
+            elif key.startswith("percent:"):
+                grammar["percent"][key[len("percent:"):]]=value
+            elif key.startswith("currency:"):
+                grammar["currencies"][key[len("currency:"):]]=value
+            elif key.startswith("subunit:"):
+                grammar["subunits"][key[len("subunit:"):]]=int(value)
+            elif key.startswith("currency-and"):
+                grammar["currency-and"]=value
+            elif key.startswith("month:"):
+                grammar["months"][key[len("month:"):]]=value
+            elif key.startswith("date-format"):
+                grammar["date-format"]=value
+            elif key.startswith("date-of"):
+                grammar["date-of"]=value
+            elif key.startswith("date-cardinal-day"):
+                grammar["date-cardinal-day"]=bool(value == "true")
+            elif key.startswith("time-12h"):
+                # Time words that follow hours between 1 and 12
+                grammar["time-12h"]=list(value.split(","))
+            elif key.startswith("time-zero"):
+                # Words for 0 before minutes ("oh" in "twelve oh five")
+                grammar["time-zero"]=list(value.split(","))
+            elif key.startswith("duration-words"):
+                # Words after which a number of hours is a duration
+                grammar["duration-words"]=list(value.split(","))
+            elif key.startswith("time:"):
+                grammar["time"][key[len("time:"):]]=value
+            elif key.startswith("hours:"):
+                grammar["hours"][key[len("hours:"):]]=value
+            else:
+                grammar["numbers"][key]=int(value)
+
+    return grammar
+
+def _helper_decimal_symbols(lang):
+    # Returns the decimal symbol of the language and the locales of this
+    # language that use another one.
+    from babel import Locale, localedata
+
+    default_symbol=Locale(lang).number_symbols["decimal"]
+    symbols={}
+    for identifier in localedata.locale_identifiers():
+        if identifier.split("_")[0] != lang:
+            continue
+
+        symbol=Locale.parse(identifier).number_symbols["decimal"]
+        if symbol != default_symbol:
+            symbols[identifier]=symbol
+
+    return default_symbol, symbols
+
+def stt_numbers_grammar_compile(properties_path, lang):
+    grammar=_helper_parse_properties(properties_path)
+
+    try:
+        grammar["decimal"], grammar["decimal-locales"]=_helper_decimal_symbols(lang)
+    except ImportError:
+        # It will be looked up at runtime
+        LOG_MSG.warning("Babel is not available, decimal symbols are not compiled")
+
+    return grammar
+
+def _helper_decimal_symbol(grammar, locale_str):
+    symbol=grammar.get("decimal-locales", {}).get(locale_str)
+    if symbol is not None:
+        return symbol
+
+    symbol=grammar.get("decimal")
+    if symbol is not None:
+        return symbol
+
+    # Not compiled, ask Babel
+    from babel import Locale
+    return Locale.parse(locale_str).number_symbols["decimal"]
+
+def stt_numbers_grammar_load(data_path, locale_str):
+    # Returns the grammar (a dictionary) with the decimal symbol of the locale
+    # or None. Raises OSError or ValueError.
+    lang=locale_str[:2]
+    json_path=Path(data_path, "numbers_"+lang+".json")
+    try:
+        with json_path.open(encoding="utf-8") as json_file:
+            grammar=json.load(json_file)
+
+    except FileNotFoundError:
+        LOG_MSG.debug("no compiled grammar for %s, parsing properties", lang)
+        grammar=_helper_parse_properties(Path(data_path, "config_"+lang+".properties"))
+
+    grammar["decimal"]=_helper_decimal_symbol(grammar, locale_str)
+    return grammar
+
+def main():
+    # Used at build time: sttnumbersgrammar.py config_<lang>.properties numbers_<lang>.json
+    properties_path=Path(sys.argv[1])
+    lang=properties_path.stem[len("config_"):]
+
+    grammar=stt_numbers_grammar_compile(properties_path, lang)
+    with open(sys.argv[2], "w", encoding="utf-8") as json_file:
+        json.dump(grammar, json_file, ensure_ascii=False, sort_keys=True)
+
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,122 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import sys
+import time
+import builtins
+
+from contextlib import contextmanager
+
+# Records how long imports and initialisation phases take when the engine
+# starts (ibus-engine-stt --profile-startup). This module must not import
+# anything heavy since it is imported first.
+
+# Imports shorter than this (in seconds) are not reported
+_MIN_IMPORT_DURATION = 0.001
+
+class _STTProfile():
+    def __init__(self):
+        self.start=time.perf_counter()
+
+        # Lists of [label, depth, duration, is_import] in the order phases start
+        self.entries=[]
+        self.reported=0
+        self.depth=0
+
+        self.builtin_import=builtins.__import__
+        builtins.__import__=self._import
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level != 0:
+            return self.builtin_import(name, globals, locals, fromlist, level)
+
+        # gi.repository modules are only loaded through fromlist
+        if name == "gi.repository" and fromlist:
+            new_names=[name+"."+item for item in fromlist if name+"."+item not in sys.modules]
+        elif name not in sys.modules:
+            new_names=[name]
+        else:
+            new_names=[]
+
+        if new_names == []:
+            return self.builtin_import(name, globals, locals, fromlist, level)
+
+        with self.phase("import "+", ".join(new_names), True):
+            return self.builtin_import(name, globals, locals, fromlist, level)
+
+    @contextmanager
+    def phase(self, label, is_import=False):
+        entry=[label, self.depth, None, is_import]
+        self.entries.append(entry)
+        self.depth+=1
+        start=time.perf_counter()
+        try:
+            yield
+        finally:
+            entry[2]=time.perf_counter()-start
+            self.depth-=1
+
+    def report(self, title):
+        print("Startup profile: %s (%.1f ms since start)" % (title, (time.perf_counter()-self.start)*1000),
+              file=sys.stderr)
+
+        for label, depth, duration, is_import in self.entries[self.reported:]:
+            if duration is None:
+                # Not finished yet
+                continue
+
+            if is_import == True and duration < _MIN_IMPORT_DURATION:
+                continue
+
+            print("%9.1f ms %s%s" % (duration*1000, "  "*depth, label), file=sys.stderr)
+
+        self.reported=len(self.entries)
+
+_PROFILE=None
+
+def stt_profile_enable():
+    global _PROFILE
+
+    if _PROFILE == None:
+        _PROFILE=_STTProfile()
+
+def stt_profile_enabled():
+    return bool(_PROFILE is not None)
+
+@contextmanager
+def stt_profile_phase(label):
+    if _PROFILE is None:
+        yield
+        return
+
+    with _PROFILE.phase(label):
+        yield
+
+def stt_profile_record(label, duration):
+    # Adds a duration (in seconds) measured by the caller to the next report
+    if _PROFILE is None:
+        return
+
+    _PROFILE.entries.append([label, _PROFILE.depth, duration, False])
+
+def stt_profile_report(title):
+    # Prints what was recorded since the last report
+    if _PROFILE is None:
+        return
+
+    _PROFILE.report(title)
@@ -0,0 +1,126 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+import threading
+
+from enum import Enum
+
+from gi.repository import GLib, GObject
+
+# Subscribers are not told more often than this (in seconds)
+_MIN_INTERVAL = 0.25
+
+# The transfer rate is measured over this duration (in seconds)
+_RATE_INTERVAL = 1.0
+
+class STTDownloadPhase(Enum):
+    STOPPED = "stopped"
+    DOWNLOADING = "downloading"
+    UNPACKING = "unpacking"
+
+class STTDownloadProgress():
+    # The state of a download at some point. It is never modified so it can be
+    # handed from a thread to another.
+    __slots__=("phase", "bytes", "total", "rate")
+
+    def __init__(self, phase=STTDownloadPhase.STOPPED, bytes=0, total=0, rate=0.0):
+        self.phase=phase
+        self.bytes=bytes
+        # 0 if unknown
+        self.total=total
+        # Bytes per second
+        self.rate=rate
+
+    @property
+    def fraction(self):
+        # None if the total size is unknown
+        if self.total <= 0:
+            return None
+
+        return min(self.bytes/self.total, 1.0)
+
+class STTProgressChannel(GObject.Object):
+    # Carries the progress of a download from the thread doing it to the main
+    # loop. post() can be called from any thread and as often as needed: the
+    # "progress" signal is emitted from the main loop with the latest progress,
+    # at most once every _MIN_INTERVAL. No source exists when nothing changes.
+    __gtype_name__="STTProgressChannel"
+
+    __gsignals__={
+        "progress": (GObject.SIGNAL_RUN_FIRST, None, (object,)),
+    }
+
+    def __init__(self):
+        super().__init__()
+
+        self._progress=STTDownloadProgress()
+
+        # Protected by the lock
+        self._lock=threading.Lock()
+        self._pending=None
+        self._scheduled=False
+        self._last_dispatch=0.0
+        self._phase=STTDownloadPhase.STOPPED
+        self._rate=0.0
+        self._rate_start=0.0
+        self._rate_bytes=0
+
+    @property
+    def progress(self):
+        # The last progress sent to subscribers
+        return self._progress
+
+    def post(self, phase, bytes=0, total=0):
+        now=time.monotonic()
+        with self._lock:
+            if phase != self._phase or bytes < self._rate_bytes:
+                self._phase=phase
+                self._rate=0.0
+                self._rate_start=now
+                self._rate_bytes=bytes
+            elif now-self._rate_start >= _RATE_INTERVAL:
+                self._rate=(bytes-self._rate_bytes)/(now-self._rate_start)
+                self._rate_start=now
+                self._rate_bytes=bytes
+
+            self._pending=STTDownloadProgress(phase, bytes, total, self._rate)
+            if self._scheduled == True:
+                return
+
+            self._scheduled=True
+            delay=max(0.0, _MIN_INTERVAL-(now-self._last_dispatch))
+
+        # Both are safe to call from any thread
+        if delay == 0.0:
+            GLib.idle_add(self._dispatch)
+        else:
+            GLib.timeout_add(int(delay*1000), self._dispatch)
+
+    def _dispatch(self):
+        with self._lock:
+            progress=self._pending
+            self._pending=None
+            self._scheduled=False
+            self._last_dispatch=time.monotonic()
+
+        if progress is not None:
+            self._progress=progress
+            self.emit("progress", progress)
+
+        return False
@@ -25,6 +25,7 @@ from sttutils import *
 
 from sttutterancetree import STTUtteranceTree, STTParserInterface, STTParseModes, STTCase
 from sttwordstodigits import STTWordsToDigits
+from sttvoskresult import UNCERTAIN_CONFIDENCE
 
 LOG_MSG=logging.getLogger()
 
@@ -93,7 +94,8 @@ class STTSegmentProcess(GObject.GObject, STTParserInterface):
         "need-results" : (GObject.SIGNAL_RUN_FIRST, None, ()),
         "cancel": (GObject.SIGNAL_RUN_FIRST, None, (int,)),
         "shortcut": (GObject.SIGNAL_RUN_FIRST, None, (int, int,)),
-        "partial-text": (GObject.SIGNAL_RUN_FIRST, None, (str,)),
+        # The integer is the position of the first uncertain character
+        "partial-text": (GObject.SIGNAL_RUN_FIRST, None, (str, int,)),
         "final-text": (GObject.SIGNAL_RUN_FIRST, None, (str,)),
     }
 
@@ -318,7 +320,7 @@ class STTSegmentProcess(GObject.GObject, STTParserInterface):
         for word in words:
             self._append_word(word)
 
-    def _utterance_process(self, utterance, text_left):
+    def _utterance_process(self, words, text_left):
         self._context = STTProcessContext(self._context)
         self._segment = STTSegment(self._last_segment)
 
@@ -330,7 +332,6 @@ class STTSegmentProcess(GObject.GObject, STTParserInterface):
             self._text_left = self._last_segment._last_word
 
         LOG_MSG.debug("left text (%s)", self._text_left)
-        words = utterance.split()
         max_words = len(words)
         word_i = 0
 
@@ -355,12 +356,31 @@ class STTSegmentProcess(GObject.GObject, STTParserInterface):
         if self._context.changed() == True:
             self.emit("mode-changed")
 
-    def utterance_process_begin(self, utterance, text_left):
-        self._utterance_process(utterance, text_left)
+    def utterance_process_begin(self, utterance, text_left, vosk_words=None):
+        words = utterance.split()
+
+        # Don't bother formatting the words at the end that the recognizer is
+        # not sure about: they are likely to change with the next result.
+        uncertain_words = []
+        if vosk_words is not None and len(vosk_words) == len(words):
+            uncertain_i = vosk_words.uncertain_tail(UNCERTAIN_CONFIDENCE)
+            uncertain_words = words[uncertain_i:]
+            words = words[:uncertain_i]
+
+        self._utterance_process(words, text_left)
 
         if self._segment._diacritic is not None:
              self._segment._utterance =+ self._segment._diacritic[0]
 
+        text = self._segment._utterance
+        uncertain_pos = len(text)
+        if uncertain_words:
+            if text != "" or text_left != "":
+                text += " "
+                uncertain_pos += 1
+
+            text += " ".join(uncertain_words)
+
         # If pending_cancel_size is not 0, then it means we need to delete text
         # on the left which is not possible while handling partial results.
         # We cannot perform any such deletion while we are in the middle of the
@@ -376,10 +396,10 @@ class STTSegmentProcess(GObject.GObject, STTParserInterface):
             self._pending_cancel_size=0
             self.emit("need-results")
         else:
-            self.emit("partial-text", self._segment._utterance)
+            self.emit("partial-text", text, uncertain_pos)
 
     def utterance_process_end(self, utterance, text_left):
-        self._utterance_process(utterance, text_left)
+        self._utterance_process(utterance.split(), text_left)
         text = self._segment._utterance
 
         if self._pending_cancel_size != 0:
@@ -0,0 +1,144 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+
+from types import MappingProxyType
+
+from gi.repository import GObject, Gio
+
+LOG_MSG=logging.getLogger()
+
+def _helper_parse_json_dict(json_string):
+    if json_string in (None,"None",""):
+        return MappingProxyType({})
+
+    try:
+        json_dict=json.loads(json_string)
+    except json.JSONDecodeError:
+        LOG_MSG.warning("the JSON format of the setting is wrong (%s)", json_string)
+        return MappingProxyType({})
+
+    if isinstance(json_dict, dict) == False:
+        return MappingProxyType({})
+
+    return MappingProxyType(json_dict)
+
+def _helper_changed_keys(old_dict, new_dict):
+    return [key for key in set(old_dict)|set(new_dict) if old_dict.get(key) != new_dict.get(key)]
+
+class STTSettings(GObject.Object):
+    # The settings of the process. The JSON values (vosk-models and
+    # locale-paths) are parsed once when they change and are available as
+    # read-only dictionaries. Other keys are read through gsettings.
+    __gtype_name__="STTSettings"
+
+    __gsignals__={
+        # Emitted with the locale whose model changed
+        "model-changed": (GObject.SIGNAL_RUN_FIRST, None, (str,)),
+        # Emitted with the locale whose formatting file changed
+        "locale-path-changed": (GObject.SIGNAL_RUN_FIRST, None, (str,)),
+    }
+
+    def __init__(self):
+        super().__init__()
+
+        self._settings=Gio.Settings.new("org.freedesktop.ibus.engine.stt")
+        self._settings.connect("changed::vosk-models", self._vosk_models_changed)
+        self._settings.connect("changed::locale-paths", self._locale_paths_changed)
+
+        self._vosk_models=_helper_parse_json_dict(self._settings.get_string("vosk-models"))
+        self._locale_paths=_helper_parse_json_dict(self._settings.get_string("locale-paths"))
+
+    @property
+    def gsettings(self):
+        return self._settings
+
+    @property
+    def vosk_models(self):
+        # Locale -> model name or path of a custom model
+        return self._vosk_models
+
+    @property
+    def locale_paths(self):
+        # Locale -> path of a custom formatting file
+        return self._locale_paths
+
+    def _vosk_models_changed(self, settings, key):
+        vosk_models=_helper_parse_json_dict(settings.get_string(key))
+        changed_locales=_helper_changed_keys(self._vosk_models, vosk_models)
+        self._vosk_models=vosk_models
+
+        for locale_str in changed_locales:
+            LOG_MSG.debug("model setting changed for %s", locale_str)
+            self.emit("model-changed", locale_str)
+
+    def _locale_paths_changed(self, settings, key):
+        locale_paths=_helper_parse_json_dict(settings.get_string(key))
+        changed_locales=_helper_changed_keys(self._locale_paths, locale_paths)
+        self._locale_paths=locale_paths
+
+        for locale_str in changed_locales:
+            LOG_MSG.debug("formatting file setting changed for %s", locale_str)
+            self.emit("locale-path-changed", locale_str)
+
+    def get_model(self, locale_str):
+        model=self._vosk_models.get(locale_str, None)
+        if model in (None, ""):
+            return None
+
+        return model.rstrip("/")
+
+    def get_locale_path(self, locale_str):
+        return self._locale_paths.get(locale_str, None)
+
+    def set_model(self, locale_str, model):
+        # Signals are emitted before the change is saved
+        vosk_models=dict(self._vosk_models)
+        vosk_models[locale_str]=model
+        vosk_models=MappingProxyType(vosk_models)
+
+        changed_locales=_helper_changed_keys(self._vosk_models, vosk_models)
+        self._vosk_models=vosk_models
+        for changed_locale_str in changed_locales:
+            self.emit("model-changed", changed_locale_str)
+
+        self._settings.set_string("vosk-models", json.dumps(dict(vosk_models)))
+
+    def set_locale_path(self, locale_str, path):
+        locale_paths=dict(self._locale_paths)
+        locale_paths[locale_str]=path
+        locale_paths=MappingProxyType(locale_paths)
+
+        changed_locales=_helper_changed_keys(self._locale_paths, locale_paths)
+        self._locale_paths=locale_paths
+        for changed_locale_str in changed_locales:
+            self.emit("locale-path-changed", changed_locale_str)
+
+        self._settings.set_string("locale-paths", json.dumps(dict(locale_paths)))
+
+_SETTINGS = None
+
+def stt_settings():
+    global _SETTINGS
+
+    if _SETTINGS == None:
+        _SETTINGS = STTSettings()
+
+    return _SETTINGS
@@ -26,7 +26,7 @@ gi.require_version('Adw', '1')
 from gi.repository import GLib, Gtk, Adw
 
 from sttutterancerow import STTUtteranceRow
-from sttshortcutrow import STTShortcutRow
+from sttshortcutitem import STTShortcutItem
 
 LOG_MSG=logging.getLogger()
 
@@ -53,10 +53,10 @@ class STTShortcutDialog(Gtk.Dialog):
 
     scrolled_window=Gtk.Template.Child()
 
-    def __init__(self, row=None, engine=None, **kwargs):
+    def __init__(self, item=None, engine=None, **kwargs):
         super().__init__(**kwargs)
 
-        self._row=row
+        self._item=item
         self._added_temp={}
         self._removed_temp={}
         self._changes=0
@@ -79,48 +79,52 @@ class STTShortcutDialog(Gtk.Dialog):
 
         self._recognition_id=0
 
-        if row == None:
+        if item == None:
             # It's a new empty shortcut
             self.utterances = []
             self.add_button.set_sensitive(False)
             self.button_stack_end.set_visible_child(self.add_button)
             return
 
-        self.utterances = row.utterances
+        self.utterances = item.utterances
         self.button_stack_end.set_visible_child(self.apply_button)
 
         buffer=self.description_entry.get_buffer()
-        if row.description not in (None, ""):
-            buffer.set_text(row.description,-1)
+        if item.description not in (None, ""):
+            buffer.set_text(item.description,-1)
         buffer.connect("notify::text", self._description_changed)
 
-        if isinstance(row.value, list):
+        if isinstance(item.value, (list, tuple)):
             # For diacritics
-            if len(row.value) == 1:
-                value = row.value[0]
+            if len(item.value) == 1:
+                value = item.value[0]
             else:
-                value = row.value[1]
+                value = item.value[1]
         else:
-            value=row.value
+            value=item.value
 
         if value not in (None, ""):
             buffer=self.text_view.get_buffer()
             buffer.set_text(value,-1)
 
-        if row.editable == False:
+        if item.editable == False:
             # It's a default shortcut
             self.text_view.set_sensitive(False)
             self.button_stack_end.set_visible_child(self.apply_button)
 
             # For these row if there is a description, keep it
-            if row.description not in (None,""):
+            if item.description not in (None,""):
                 self.text_label.set_visible(False)
 
-        unique_utterances=list(set(row.utterances)|set(row._extra_utterances))
+        unique_utterances=list(set(item.utterances)|set(item._extra_utterances))
         for utterance in unique_utterances:
-            utterance_row=STTUtteranceRow(text=utterance, editable=bool(utterance not in row.utterances))
+            utterance_row=STTUtteranceRow(text=utterance, editable=bool(utterance not in item.utterances))
             self._add_utterance_row(utterance_row)
 
+    @property
+    def item(self):
+        return self._item
+
     def _response (self, dialog, response_type):
         # Make sure any recognition is stopped when dialog is about to be closed
         self._stop_recognition()
@@ -173,7 +177,7 @@ class STTShortcutDialog(Gtk.Dialog):
         return False
 
     def _update_focus(self):
-        if self._row == None:
+        if self._item == None:
             button=self.add_button
         else:
             button=self.apply_button
@@ -290,15 +294,15 @@ class STTShortcutDialog(Gtk.Dialog):
             # Value is not known in any other shortcut: it's either new or changed
             sensitive=True
             LOG_MSG.info("new value")
-        elif self._row == None:
+        elif self._item == None:
             # That's a new shortcut, so if value is known it means it exists
             sensitive=False
             LOG_MSG.info("new shortcut")
-        elif value != self._row.value:
+        elif value != self._item.value:
             # It means that it's not the original value and that it is known
             sensitive=False
             LOG_MSG.info("value already exists")
-        elif self._row.description != description:
+        elif self._item.description != description:
             # Same value, same description
             sensitive=True
             LOG_MSG.info("description has changed")
@@ -309,7 +313,7 @@ class STTShortcutDialog(Gtk.Dialog):
             LOG_MSG.info("nothing has changed")
             sensitive=False
 
-        if self._row == None:
+        if self._item == None:
             button=self.add_button
         else:
             button=self.apply_button
@@ -370,33 +374,33 @@ class STTShortcutDialog(Gtk.Dialog):
         self._update_recognize_button()
         self.new_alternative_utterances_button.set_sensitive(self._engine.has_model())
 
-    # Called by STTConfigDialog to update a STTShortcutRow
-    def apply_to_row(self):
+    # Called by STTConfigDialog to update a STTShortcutItem
+    def apply_to_item(self):
         # We don't set value unless it's editable
-        if self._row.editable:
+        if self._item.editable:
             LOG_MSG.debug("row is editable")
             # we don't need to be careful about diacritics here as value
             # won't be changed.
             buffer=self.text_view.get_buffer()
-            self._row.value=buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False)
-            LOG_MSG.debug("row value %s", self._row.value)
+            self._item.value=buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False)
+            LOG_MSG.debug("row value %s", self._item.value)
 
         buffer=self.description_entry.get_buffer()
-        self._row.description=buffer.get_text()
+        self._item.description=buffer.get_text()
 
         extra=[]
         for row in self._rows_list:
             # All utterances cannot be removed nor changed
-            if row.text in self._row.utterances:
+            if row.text in self._item.utterances:
                 continue
 
             extra.append(row.text)
 
-        self._row.set_extra_utterances(extra)
+        self._item.set_extra_utterances(extra)
         return (self._added_temp, self._removed_temp)
 
-    # Called by STTConfigDialog to get a new STTShortcutRow
-    def get_new_row(self):
+    # Called by STTConfigDialog to get a new STTShortcutItem
+    def get_new_item(self):
         buffer=self.text_view.get_buffer()
         value=buffer.get_text(buffer.get_start_iter(), buffer.get_end_iter(), False)
 
@@ -407,7 +411,7 @@ class STTShortcutDialog(Gtk.Dialog):
         for row in self._rows_list:
             extra.append(row.text)
 
-        return STTShortcutRow(value=value,
-                              extra_utterances=extra,
-                              description=description,
-                              editable=True)
+        return STTShortcutItem(value=value,
+                               extra_utterances=extra,
+                               description=description,
+                               editable=True)
@@ -0,0 +1,169 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from gettext import gettext as _
+
+from gi.repository import GObject
+
+class STTShortcutItem(GObject.Object):
+    # A shortcut (value and utterances) as shown by a STTShortcutRow. Custom
+    # shortcuts can be counted in thousands so they are kept as items in a
+    # list model and only the visible ones get a row.
+    __gtype_name__="STTShortcutItem"
+
+    __gsignals__= {
+        "changed": (GObject.SIGNAL_RUN_FIRST, None, ()),
+    }
+
+    def __init__(self, value="", description="", utterances=None, extra_utterances=None, editable=False, pref_group=None):
+        super().__init__()
+
+        self.pref_group=pref_group
+        self._value=value
+        self._description=description
+        self._original_description=description
+        if utterances == None:
+            self.utterances=[]
+        else:
+            self.utterances=utterances
+
+        if extra_utterances == None:
+            self._extra_utterances=[]
+        else:
+            self._extra_utterances=extra_utterances
+
+        self.editable=editable
+
+        # Only set for items that are always shown by a row
+        self.row=None
+
+    @property
+    def value(self):
+        return self._value
+
+    @property
+    def description(self):
+        return self._description
+
+    @value.setter
+    def value(self, value):
+        if self.editable != True:
+            return
+
+        if self._value == value:
+            return
+
+        self._value = value
+        self.emit("changed")
+
+    @description.setter
+    def description(self, description):
+        if self._description == description:
+            return
+
+        self._description = description
+        self.emit("changed")
+
+    def _get_all_unique_utterances(self):
+        touch= list(set(self.utterances)|set(self._extra_utterances))
+        return touch
+
+    @property
+    def modified(self):
+        return bool(self.editable == False and (self._description != self._original_description or self._extra_utterances != []))
+
+    @property
+    def subtitle(self):
+        return "\""+"\", \"".join(self._get_all_unique_utterances())+"\""
+
+    @property
+    def title(self):
+        if self._description not in (None, ""):
+            title=self._description
+        elif isinstance(self._value, (list, tuple)):
+            # This is for diacritics
+            if len(self._value) == 1:
+                title=self._value[0]
+            else:
+                title=self._value[1]
+        else:
+            title=self._value
+
+        title=title.strip()
+        if len(title) == 1:
+            title = _("Character <span weight='heavy'>%s</span>") % title
+        elif title.count("\n") >= 1:
+            title = title.split("\n", 1)[0] + " …"
+
+        return title
+
+    def matches(self, text):
+        # text must be lower case
+        value=self._value if isinstance(self._value, str) else "".join(self._value)
+        if text in value.lower():
+            return True
+
+        if self._description not in (None, "") and text in self._description.lower():
+            return True
+
+        for utterance in self.utterances:
+            if text in utterance:
+                return True
+
+        for utterance in self._extra_utterances:
+            if text in utterance:
+                return True
+
+        return False
+
+    def reset(self):
+        self._description=self._original_description
+        self._extra_utterances=[]
+        self.emit("changed")
+
+    def set_extra_utterances(self, utterances):
+        self._extra_utterances=utterances
+        self.emit("changed")
+
+    def add_extra_utterances(self, utterances):
+        if utterances == None:
+            return
+
+        for utterance in utterances:
+            if utterance not in self._extra_utterances:
+                self._extra_utterances.append(utterance)
+
+        self.emit("changed")
+
+    def get_json_data(self):
+        if self.editable == False and self._description == self._original_description and self._extra_utterances == []:
+            return None
+
+        json_data={}
+
+        # Value cannot be changed (unless it is a custom shortcut
+        json_data["value"]=self._value
+
+        if self.editable == True or \
+           self._description not in("", self._original_description):
+            json_data["description"]=self._description
+
+        if self.editable == True or self._extra_utterances != []:
+            json_data["utterances"]=self._extra_utterances
+
+        return json_data
@@ -16,14 +16,14 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-from gettext import gettext as _
-
 import gi
 
 gi.require_version('Gtk', '4.0')
 
 from gi.repository import Gtk, GObject, Adw
 
+from sttshortcutitem import STTShortcutItem
+
 @Gtk.Template(resource_path="/org/freedesktop/ibus/engine/stt/config/sttshortcutrow.ui")
 class STTShortcutRow(Adw.ActionRow):
     __gtype_name__="STTShortcutRow"
@@ -37,82 +37,42 @@ class STTShortcutRow(Adw.ActionRow):
     remove_button = Gtk.Template.Child()
     revealer = Gtk.Template.Child()
 
-    def __init__(self, value="", description="", utterances=None, extra_utterances=None, editable=False, pref_group=None):
+    def __init__(self, item=None, **kwargs):
+        # Either show an existing item or create one from kwargs (see
+        # STTShortcutItem). Rows of list views are created without item.
         super().__init__()
 
-        self.pref_group=pref_group
-        self._value=value
-        self._description=description
-        self._original_description=description
-        if utterances == None:
-            self.utterances=[]
-        else:
-            self.utterances=utterances
-
-        if extra_utterances == None:
-            self._extra_utterances=[]
-        else:
-            self._extra_utterances=extra_utterances
-
-        self.editable=editable
-        self.update()
-
-    @property
-    def value(self):
-        return self._value
+        self._item=None
+        self._item_changed_id=0
 
-    @property
-    def description(self):
-        return self._description
+        if item is None and kwargs:
+            item=STTShortcutItem(**kwargs)
+            item.row=self
 
-    @value.setter
-    def value(self, value):
-        if self.editable != True:
-            return
+        self.set_item(item)
 
-        if self._value == value:
-            return
+    @property
+    def item(self):
+        return self._item
 
-        self._value = value
-        self.update()
+    def set_item(self, item):
+        if self._item_changed_id != 0:
+            self._item.disconnect(self._item_changed_id)
+            self._item_changed_id=0
 
-    @description.setter
-    def description(self, description):
-        if self._description == description:
-            return
+        self._item=item
+        if item is not None:
+            self._item_changed_id=item.connect("changed", self._item_changed_cb)
+            self.update()
 
-        self._description = description
+    def _item_changed_cb(self, item):
         self.update()
 
-    def _get_all_unique_utterances(self):
-        touch= list(set(self.utterances)|set(self._extra_utterances))
-        return touch
-
     def update(self):
-        visible=bool(self.editable == False and (self._description != self._original_description or self._extra_utterances != []))
-        self.revealer.set_reveal_child(visible)
-        self.remove_button.set_visible(bool(self.editable == True))
-
-        self.set_subtitle("\""+"\", \"".join(self._get_all_unique_utterances())+"\"")
-
-        if self._description not in (None, ""):
-            title=self._description
-        elif isinstance(self._value, list):
-            # This is for diacritics
-            if len(self._value) == 1:
-                title=self._value[0]
-            else:
-                title=self._value[1]
-        else:
-            title=self._value
-
-        title=title.strip()
-        if len(title) == 1:
-            title = _("Character <span weight='heavy'>%s</span>") % title
-        elif title.count("\n") >= 1:
-            title = title.split("\n", 1)[0] + " …"
-
-        self.set_title(title)
+        self.revealer.set_reveal_child(self._item.modified)
+        self.remove_button.set_visible(bool(self._item.editable == True))
+        self.set_subtitle(self._item.subtitle)
+        self.set_title(self._item.title)
 
     @Gtk.Template.Callback()
     def remove_button_clicked_cb(self, button):
@@ -120,42 +80,7 @@ class STTShortcutRow(Adw.ActionRow):
 
     @Gtk.Template.Callback()
     def reset_button_clicked_cb(self, button):
-        self._description=self._original_description
-        # Reset must come before we reset _extra_utterances since the utterances
-        # has to be removed before.
+        # Reset must be emitted before we reset the extra utterances since they
+        # have to be removed before.
         self.emit("reset")
-
-        self._extra_utterances=[]
-        self.update()
-
-    def set_extra_utterances(self, utterances):
-        self._extra_utterances=utterances
-        self.update()
-
-    def add_extra_utterances(self, utterances):
-        if utterances == None:
-            return
-
-        for utterance in utterances:
-            if utterance not in self._extra_utterances:
-                self._extra_utterances.append(utterance)
-
-        self.update()
-
-    def get_json_data(self):
-        if self.editable == False and self._description == self._original_description and self._extra_utterances == []:
-            return None
-
-        json_data={}
-
-        # Value cannot be changed (unless it is a custom shortcut
-        json_data["value"]=self._value
-
-        if self.editable == True or \
-           self._description not in("", self._original_description):
-            json_data["description"]=self._description
-
-        if self.editable == True or self._extra_utterances != []:
-            json_data["utterances"]=self._extra_utterances
-
-        return json_data
+        self._item.reset()
@@ -0,0 +1,229 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import sys
+import time
+import wave
+import logging
+import argparse
+import threading
+
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import vosk
+except ImportError:
+    vosk=None
+
+from sttvoskresult import stt_vosk_result_decode, STTVoskResultType
+
+LOG_MSG=logging.getLogger()
+
+# Long audio is cut where there is silence so that segments can be decoded in
+# parallel. Durations are in milliseconds.
+_FRAME_DURATION = 30
+_MIN_SILENCE_DURATION = 300
+_MIN_SEGMENT_DURATION = 5000
+_MAX_SEGMENT_DURATION = 30000
+
+# Peak amplitude of S16 samples below which a frame is silent (about -40 dBFS)
+_SILENCE_PEAK = 328
+
+# Number of bytes given to the recognizer at once (0.25s at 16kHz)
+_CHUNK_SIZE = 8000
+
+def _helper_split_on_silence(samples, rate):
+    # Returns a list of (start, end) sample indices
+    frame_size=rate*_FRAME_DURATION//1000
+    min_silence_frames=_MIN_SILENCE_DURATION//_FRAME_DURATION
+    min_segment_size=rate*_MIN_SEGMENT_DURATION//1000
+    max_segment_size=rate*_MAX_SEGMENT_DURATION//1000
+
+    segments=[]
+    start=0
+    silent_frames=0
+    for frame_start in range(0, len(samples), frame_size):
+        frame=samples[frame_start:frame_start+frame_size]
+        frame_end=frame_start+len(frame)
+
+        if max(frame) < _SILENCE_PEAK and min(frame) > -_SILENCE_PEAK:
+            silent_frames+=1
+        else:
+            silent_frames=0
+
+        if silent_frames >= min_silence_frames and \
+           frame_end-start >= min_segment_size:
+            # Cut in the middle of the silence
+            end=frame_end-(silent_frames//2)*frame_size
+        elif frame_end-start >= max_segment_size:
+            # No silence long enough, cut anyway
+            end=frame_end
+        else:
+            continue
+
+        segments.append((start, end))
+        start=end
+        silent_frames=0
+
+    if start < len(samples):
+        segments.append((start, len(samples)))
+
+    return segments
+
+class STTTranscriber():
+    # Decodes audio with a pool of recognizers sharing the same model. Each
+    # thread of the pool has its own recognizer. How well this scales with
+    # the number of jobs has not been measured; main() logs the decoding
+    # time to compare.
+
+    def __init__(self, model_path, jobs=None):
+        if vosk is None:
+            raise RuntimeError("the vosk python module is not available")
+
+        self._model=vosk.Model(model_path)
+        self._jobs=jobs if jobs is not None else os.cpu_count()
+        self._local=threading.local()
+
+    def _get_recognizer(self, rate):
+        recognizer=getattr(self._local, "recognizer", None)
+        if recognizer is None or self._local.rate != rate:
+            recognizer=vosk.KaldiRecognizer(self._model, rate)
+            recognizer.SetWords(True)
+            self._local.recognizer=recognizer
+            self._local.rate=rate
+
+        return recognizer
+
+    def _decode_segment(self, data, rate):
+        # Returns the list of results (like the ones the vosk element sends
+        # when dictating) for this segment.
+        recognizer=self._get_recognizer(rate)
+
+        results=[]
+        for chunk_start in range(0, len(data), _CHUNK_SIZE):
+            if recognizer.AcceptWaveform(data[chunk_start:chunk_start+_CHUNK_SIZE]):
+                results.append(stt_vosk_result_decode(recognizer.Result()))
+
+        # This also resets the recognizer for the next segment
+        results.append(stt_vosk_result_decode(recognizer.FinalResult()))
+
+        return [result for result in results
+                if result is not None and
+                   result.type == STTVoskResultType.TEXT and
+                   result.text != ""]
+
+    def decode(self, samples, rate):
+        # Returns results in order
+        segments=_helper_split_on_silence(samples, rate)
+        LOG_MSG.debug("audio split in %i segments", len(segments))
+
+        data=samples.tobytes()
+        if sys.byteorder == "big":
+            swapped=array("h", data)
+            swapped.byteswap()
+            data=swapped.tobytes()
+
+        with ThreadPoolExecutor(max_workers=self._jobs) as executor:
+            futures=[executor.submit(self._decode_segment, data[start*2:end*2], rate)
+                     for start, end in segments]
+            for future in futures:
+                yield from future.result()
+
+def stt_transcriber_read_wav(path):
+    with wave.open(path, "rb") as wav_file:
+        if wav_file.getnchannels() != 1 or wav_file.getsampwidth() != 2 or \
+           wav_file.getcomptype() != "NONE":
+            raise ValueError("only mono 16 bits PCM WAV files are supported")
+
+        rate=wav_file.getframerate()
+        samples=array("h", wav_file.readframes(wav_file.getnframes()))
+
+    # WAV files are little endian
+    if sys.byteorder == "big":
+        samples.byteswap()
+
+    return samples, rate
+
+class _STTTranscriberOutput():
+    # Does with the formatted text what STTEngine does when dictating
+
+    def __init__(self, text_processor):
+        self.text=""
+        text_processor.connect("final-text", self._final_text)
+        text_processor.connect("cancel", self._cancel)
+        text_processor.connect("shortcut", self._shortcut)
+
+    def _final_text(self, processor, text):
+        self.text+=text
+
+    def _cancel(self, processor, size):
+        self.text=self.text[:-size] if size < len(self.text) else ""
+
+    def _shortcut(self, processor, keyval, state):
+        LOG_MSG.info("shortcut ignored (%i, %i)", keyval, state)
+
+def main():
+    parser=argparse.ArgumentParser(description="Transcribe a WAV file (mono, 16 bits) with IBus STT formatting")
+    parser.add_argument("file")
+    parser.add_argument("--model", help="path to the Vosk model (default: model of the current locale)")
+    parser.add_argument("--jobs", type=int, default=None, help="number of recognizers decoding in parallel")
+    parser.add_argument("--raw", action="store_true", help="do not format the text")
+    args=parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+
+    # Loaded here since they need GObject and settings
+    from sttsegmentprocess import STTSegmentProcess
+    from sttcurrentlocale import stt_current_locale
+    from sttvoskmodel import STTVoskModel
+
+    model_path=args.model
+    if model_path is None:
+        model_path=STTVoskModel(locale_str=stt_current_locale().locale).get_path()
+        if model_path is None:
+            LOG_MSG.error("no model for the current locale")
+            return 1
+
+    try:
+        samples, rate=stt_transcriber_read_wav(args.file)
+        transcriber=STTTranscriber(model_path, jobs=args.jobs)
+    except (OSError, ValueError, RuntimeError, wave.Error) as error:
+        LOG_MSG.error("%s", error)
+        return 1
+
+    text_processor=STTSegmentProcess()
+    output=_STTTranscriberOutput(text_processor)
+    start_time=time.monotonic()
+    for result in transcriber.decode(samples, rate):
+        if args.raw == True:
+            output.text+=result.text+"\n"
+        else:
+            text_processor.utterance_process_end(result.text, output.text)
+
+    decoding_time=time.monotonic()-start_time
+    LOG_MSG.info("%.1f s of audio transcribed in %.1f s (real time factor=%.2f, jobs=%s)",
+                 len(samples)/rate, decoding_time, decoding_time*rate/max(len(samples), 1),
+                 args.jobs if args.jobs is not None else os.cpu_count())
+
+    print(output.text)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
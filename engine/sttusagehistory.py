@@ -0,0 +1,166 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import json
+import time
+import logging
+import tempfile
+
+from pathlib import Path
+
+from gi.repository import GLib
+
+from sttutils import stt_utils_get_local_config_path
+
+LOG_MSG=logging.getLogger()
+
+# Remembers in which applications (IBus clients) and locales recognition is
+# started to guess when it is about to be used. The history is a JSON file:
+#   {"clients": {client: {"focus": n, "starts": n, "last-start": seconds}},
+#    "locales": {locale: {"starts": n, "last-start": seconds}}}
+
+_HISTORY_FILE_NAME = "usage-history.json"
+
+# Changes are written at most once in this delay (in seconds)
+_SAVE_DELAY = 60
+
+# An application needs this number of focus events before guessing anything
+_MIN_FOCUS_NUM = 5
+
+# Ratio of focus events followed by recognition above which it is likely
+_MIN_START_RATIO = 0.2
+
+# Older uses (in seconds) are not taken into account
+_MAX_AGE = 14*24*60*60
+
+# Counts are halved past this number of focus events so that recent habits
+# weigh more than old ones
+_MAX_FOCUS_NUM = 1000
+
+class STTUsageHistory():
+    def __init__(self, path=None):
+        if path is None:
+            path=Path(stt_utils_get_local_config_path(), _HISTORY_FILE_NAME)
+
+        self._path=Path(path)
+        self._save_id=0
+        self._clients={}
+        self._locales={}
+        self._load()
+
+    def _load(self):
+        try:
+            with self._path.open() as history_file:
+                history=json.load(history_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as error:
+            LOG_MSG.warning("could not read usage history (%s)", error)
+            return
+
+        if isinstance(history, dict) == False:
+            return
+
+        self._clients=history.get("clients", {})
+        self._locales=history.get("locales", {})
+
+    def _save(self):
+        history={"clients": self._clients, "locales": self._locales}
+        tmp_path=None
+        try:
+            self._path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path=tempfile.mkstemp(dir=str(self._path.parent), prefix="." + self._path.name, suffix=".tmp")
+            with os.fdopen(fd, "w") as tmp_file:
+                json.dump(history, tmp_file)
+
+            os.replace(tmp_path, str(self._path))
+        except OSError as error:
+            LOG_MSG.warning("could not write usage history (%s)", error)
+            if tmp_path is not None and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def _save_timeout(self):
+        self._save_id=0
+        self._save()
+        return False
+
+    def _schedule_save(self):
+        if self._save_id == 0:
+            self._save_id=GLib.timeout_add_seconds(_SAVE_DELAY, self._save_timeout)
+
+    def flush(self):
+        if self._save_id == 0:
+            return
+
+        GLib.source_remove(self._save_id)
+        self._save_timeout()
+
+    def add_focus(self, client):
+        if client in (None, ""):
+            return
+
+        client_history=self._clients.setdefault(client, {"focus": 0, "starts": 0, "last-start": 0})
+        client_history["focus"]+=1
+        if client_history["focus"] > _MAX_FOCUS_NUM:
+            client_history["focus"]//=2
+            client_history["starts"]//=2
+
+        self._schedule_save()
+
+    def add_start(self, client, locale_str):
+        now=int(time.time())
+
+        locale_history=self._locales.setdefault(locale_str, {"starts": 0, "last-start": 0})
+        locale_history["starts"]+=1
+        locale_history["last-start"]=now
+
+        if client not in (None, ""):
+            client_history=self._clients.setdefault(client, {"focus": 1, "starts": 0, "last-start": 0})
+            client_history["starts"]=min(client_history["starts"]+1, client_history["focus"])
+            client_history["last-start"]=now
+
+        self._schedule_save()
+
+    def is_use_likely(self, client, locale_str):
+        # Tells whether recognition is likely to be started in this client
+        # with this locale soon (that is after it was focused).
+        now=time.time()
+
+        locale_history=self._locales.get(locale_str)
+        if locale_history is None or now-locale_history["last-start"] > _MAX_AGE:
+            return False
+
+        client_history=self._clients.get(client)
+        if client_history is None or now-client_history["last-start"] > _MAX_AGE:
+            return False
+
+        if client_history["focus"] < _MIN_FOCUS_NUM:
+            return False
+
+        return bool(client_history["starts"]/client_history["focus"] >= _MIN_START_RATIO)
+
+_USAGE_HISTORY = None
+
+def stt_usage_history():
+    global _USAGE_HISTORY
+
+    if _USAGE_HISTORY == None:
+        _USAGE_HISTORY = STTUsageHistory()
+
+    return _USAGE_HISTORY
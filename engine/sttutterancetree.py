@@ -23,6 +23,7 @@ from enum import IntFlag
 from gi.repository import GObject
 
 from sttcurrentlocale import STTCurrentLocale, stt_current_locale
+from sttprofile import stt_profile_phase
 
 LOG_MSG=logging.getLogger()
 
@@ -96,6 +97,54 @@ class STTWordNode(dict):
             return True
         return False
 
+class STTPhraseDictionary():
+    # Custom replacements can be counted in tens of thousands (imported
+    # vocabularies) so they are not stored in the tree: a flat dictionary of
+    # phrases is much smaller and faster to build.
+    # Entries are (callback, value, modes, number of words).
+    __slots__=("_phrases", "_max_lengths")
+
+    def __init__(self):
+        self._phrases={}
+
+        # First word -> maximum number of words of the phrases starting with it.
+        # Note: this is not updated when phrases are removed.
+        self._max_lengths={}
+
+    def __len__(self):
+        return len(self._phrases)
+
+    def add(self, words, callback, value, modes):
+        phrase=" ".join(words)
+        if phrase in self._phrases:
+            return False
+
+        length=len(words)
+        self._phrases[phrase]=(callback, value, modes, length)
+        if self._max_lengths.get(words[0], 0) < length:
+            self._max_lengths[words[0]]=length
+
+        return True
+
+    def remove(self, phrase):
+        self._phrases.pop(phrase, None)
+
+    def find(self, words, word_i, mode):
+        # Returns the entry for the longest phrase starting at word_i
+        max_length=self._max_lengths.get(words[word_i])
+        if max_length is None:
+            return None
+
+        length=min(max_length, len(words)-word_i)
+        while length > 0:
+            entry=self._phrases.get(" ".join(words[word_i:word_i+length]))
+            if entry is not None and (entry[2] & mode) != 0:
+                return entry
+
+            length-=1
+
+        return None
+
 class STTUtteranceTree(GObject.Object):
     __gtype_name__="STTUtteranceTree"
     __gsignals__= {
@@ -113,8 +162,9 @@ class STTUtteranceTree(GObject.Object):
         self._current_locale.connect("override-file-changed", self._overriding_file_changed_cb)
         self.reset()
 
-        self._load_formatting_file()
-        self._load_overriding_file()
+        with stt_profile_phase("utterance tree load"):
+            self._load_formatting_file()
+            self._load_overriding_file()
 
     def _find_node(self, parser, words, word_i, node):
         word = words[word_i]
@@ -145,23 +195,30 @@ class STTUtteranceTree(GObject.Object):
 
     def parse(self, parser, words, word_i):
         node = self._find_node(parser, words, word_i, self._root)
-        if node == None:
+
+        # The longest match wins (the tree in case of a tie)
+        entry = self._phrases.find(words, word_i, parser.mode)
+        if entry is not None and (node is None or entry[3] > node._depth):
+            callback, value, modes, depth = entry
+        elif node == None:
             return word_i
+        else:
+            callback, value, depth = node._callback, node._value, node._depth
 
-        if node._callback == None:
+        if callback == None:
             LOG_MSG.error("node has no callback")
             return word_i
 
-        if node._value != None:
-            result=node._callback(parser, node._value)
+        if value != None:
+            result=callback(parser, value)
         else:
-            result=node._callback(parser)
+            result=callback(parser)
 
         # In case of an error in the callback, pretend there is nothing
         if result == False:
             return word_i
 
-        return word_i + node._depth
+        return word_i + depth
 
     def _add_to_node(self, word_iter, parent, depth):
         depth += 1
@@ -191,20 +248,31 @@ class STTUtteranceTree(GObject.Object):
             return
 
         for utterance in utterances:
-            node = self._add_to_tree(utterance)
-            if node == None:
-                LOG_MSG.error("no node could be created (%s)", utterance)
-                return
-
-            if node._callback != None:
+            if self._add_entry(utterance, callback, value, node_modes) == False:
                 LOG_MSG.error("node already exists (%s)", utterance)
-                continue
 
-            node._callback = callback
-            node._value = value
-            node._modes = node_modes
+    def _add_entry(self, utterance, callback, value, node_modes):
+        # Returns False if the utterance already has an entry.
+        # Custom replacements are the only entries restricted to dictation.
+        if node_modes == STTParseModes.DICTATION:
+            words=utterance.split()
+            if words == []:
+                return False
+
+            return self._phrases.add(words, callback, value, node_modes)
 
-    def _load_replacements_list(self, item_list):
+        node = self._add_to_tree(utterance)
+        if node._callback != None:
+            return False
+
+        node._callback = callback
+        node._value = value
+        node._modes = node_modes
+        return True
+
+    # The following functions yield (utterances, callback, value, modes) for
+    # each item of a section.
+    def _replacements_list_entries(self, item_list):
         if item_list == None:
             return
 
@@ -220,17 +288,17 @@ class STTUtteranceTree(GObject.Object):
                 if value is None:
                     LOG_MSG.error("Utterance with no value")
                     return
-                self._add_utterances_to_tree(utterances,
-                                             STTParserInterface.add_shortcut,
-                                             value,
-                                             STTParseModes.DICTATION)
+                yield (utterances,
+                       STTParserInterface.add_shortcut,
+                       value,
+                       STTParseModes.DICTATION)
             else:
-                self._add_utterances_to_tree(utterances,
-                                             STTParserInterface.add_words,
-                                             value,
-                                             STTParseModes.DICTATION)
+                yield (utterances,
+                       STTParserInterface.add_words,
+                       value,
+                       STTParseModes.DICTATION)
 
-    def _load_punctuation_list(self, item_list):
+    def _punctuation_list_entries(self, item_list):
         if item_list == None:
             return
 
@@ -245,19 +313,19 @@ class STTUtteranceTree(GObject.Object):
                 LOG_MSG.error("Utterance with no value")
                 return
 
-            self._add_utterances_to_tree(utterances,
-                                         STTParserInterface.add_words,
-                                         value,
-                                         STTParseModes.SPELLING |
-                                         STTParseModes.DICTATION)
+            yield (utterances,
+                   STTParserInterface.add_words,
+                   value,
+                   STTParseModes.SPELLING |
+                   STTParseModes.DICTATION)
 
-    def _load_diacritics_list(self, item_list):
+    def _diacritics_list_entries(self, item_list):
         if item_list == None:
             return
 
         for item in item_list:
             value = item.get("value")
-            if not isinstance(value, list) or len(value) != 2:
+            if not isinstance(value, (list, tuple)) or len(value) != 2:
                 LOG_MSG.error("Malformed diacritic value (type=%s, num=%i)", type(value), len(value))
                 continue
 
@@ -266,9 +334,9 @@ class STTUtteranceTree(GObject.Object):
             if isinstance(utterances,str):
                 utterances = [utterances]
 
-            self._add_utterances_to_tree(utterances, STTParserInterface.add_diacritic, (value[0], value[1]), STTParseModes.SPELLING | STTParseModes.DICTATION)
+            yield (utterances, STTParserInterface.add_diacritic, (value[0], value[1]), STTParseModes.SPELLING | STTParseModes.DICTATION)
 
-    def _load_case_list(self, item_list):
+    def _case_list_entries(self, item_list):
         if item_list == None:
             return
 
@@ -298,9 +366,9 @@ class STTUtteranceTree(GObject.Object):
             else:
                 continue
 
-            self._add_utterances_to_tree(utterances, callback, value, STTParseModes.SPELLING | STTParseModes.DICTATION)
+            yield (utterances, callback, value, STTParseModes.SPELLING | STTParseModes.DICTATION)
 
-    def _load_commands_list(self, item_list):
+    def _commands_list_entries(self, item_list):
         if item_list == None:
             return
 
@@ -336,7 +404,15 @@ class STTUtteranceTree(GObject.Object):
             else:
                 continue
 
-            self._add_utterances_to_tree(utterances, callback, value, modes)
+            yield (utterances, callback, value, modes)
+
+    def _sections_entries(self, json_data):
+        # Sections are always loaded in this order
+        yield from self._commands_list_entries(json_data.get("commands"))
+        yield from self._case_list_entries(json_data.get("case"))
+        yield from self._diacritics_list_entries(json_data.get("diacritics"))
+        yield from self._punctuation_list_entries(json_data.get("punctuation"))
+        yield from self._replacements_list_entries(json_data.get("custom"))
 
     def _load_language(self, json_data):
         json_data = json_data.get("language")
@@ -366,33 +442,98 @@ class STTUtteranceTree(GObject.Object):
         self._load_language(json_data)
 
         # No section is compulsory
-        self._load_commands_list(json_data.get("commands"))
-        self._load_case_list(json_data.get("case"))
-        self._load_diacritics_list(json_data.get("diacritics"))
-        self._load_punctuation_list(json_data.get("punctuation"))
-        self._load_replacements_list(json_data.get("custom"))
+        for utterances, callback, value, modes in self._sections_entries(json_data):
+            self._add_utterances_to_tree(utterances, callback, value, modes)
+
         self.formatting_file_valid=True
 
-    def _load_overriding_file(self):
-        if self.overriding_file_valid == True:
-            # Note: following function will call reset and set
-            # overriding_file_valid to False
-            self._load_formatting_file()
+    def _remove_entry(self, utterance, node_modes):
+        if node_modes == STTParseModes.DICTATION:
+            self._phrases.remove(utterance)
+        else:
+            self._remove_from_tree(utterance)
+
+    def _remove_from_tree(self, utterance):
+        # Removes the value of the node and the nodes that are not needed
+        # anymore
+        path=[self._root]
+        for word in utterance.split():
+            node=path[-1].get(word)
+            if node is None:
+                return
+
+            path.append(node)
+
+        node=path[-1]
+        node._callback=None
+        node._value=None
+        node._modes=STTParseModes.NONE
+
+        for word in reversed(utterance.split()):
+            node=path.pop()
+            if len(node) != 0 or node._callback is not None:
+                break
+
+            del path[-1][word]
 
+    def _override_entries_dict(self, json_data):
+        # utterance -> (callback, value, modes) ; the first one wins
+        entries={}
+        if json_data is None:
+            return entries
+
+        for utterances, callback, value, modes in self._sections_entries(json_data):
+            if utterances in (None, []):
+                LOG_MSG.error("value has not associated utterance(s)")
+                continue
+
+            for utterance in utterances:
+                words=utterance.split()
+                if words != []:
+                    entries.setdefault(" ".join(words), (callback, value, modes))
+
+        return entries
+
+    def _load_overriding_file(self):
+        # Overrides can only add utterances to those of the formatting file.
+        # Only the nodes whose entry changed since the last time are updated.
         LOG_MSG.info("loading overriding file")
         json_data=self._current_locale.overriding
-        if json_data is None:
-            return
 
-        # Note: this is pure override it is not cumulative or additive
-        self._load_language(json_data)
+        language=json_data.get("language") if json_data is not None else None
+        if language != self._override_language:
+            # Note: this is pure override it is not cumulative or additive
+            self._reset_language()
+            if self.formatting_file_valid == True:
+                self._load_language(self._current_locale.formatting)
+            if json_data is not None:
+                self._load_language(json_data)
+
+            self._override_language=language
+
+        entries=self._override_entries_dict(json_data)
+
+        applied_entries={}
+        for utterance, entry in self._override_entries.items():
+            if entries.get(utterance) == entry:
+                applied_entries[utterance]=entry
+            else:
+                self._remove_entry(utterance, entry[2])
+
+        for utterance, entry in entries.items():
+            if utterance in applied_entries:
+                continue
 
-        self._load_commands_list(json_data.get("commands"))
-        self._load_case_list(json_data.get("case"))
-        self._load_diacritics_list(json_data.get("diacritics"))
-        self._load_punctuation_list(json_data.get("punctuation"))
-        self._load_replacements_list(json_data.get("custom"))
-        self.overriding_file_valid=True
+            if self._add_entry(utterance, *entry) == False:
+                LOG_MSG.error("node already exists (%s)", utterance)
+                continue
+
+            applied_entries[utterance]=entry
+
+        LOG_MSG.debug("%i overriding entries applied (%i before)",
+                      len(applied_entries), len(self._override_entries))
+        self._override_entries=applied_entries
+        self.overriding_file_valid=bool(json_data is not None)
 
     def _formatting_file_changed_cb(self, current_locale):
         self._load_formatting_file()
@@ -403,7 +544,7 @@ class STTUtteranceTree(GObject.Object):
         self._load_overriding_file()
         self.emit("changed")
 
-    def reset(self):
+    def _reset_language(self):
         # This dictionary, digits, is used only in spelling mode
         self.digits={}
 
@@ -413,7 +554,15 @@ class STTUtteranceTree(GObject.Object):
         self.no_space_after=" ([{@\n\t-"
         self.capitalize_next=".?!…"
 
+    def reset(self):
+        self._reset_language()
+
         self._root=STTWordNode(0)
+        self._phrases=STTPhraseDictionary()
+
+        # Entries of the overriding file that are in the tree
+        self._override_entries={}
+        self._override_language=None
 
         self.formatting_file_valid=False
         self.overriding_file_valid=False
@@ -16,17 +16,110 @@
 # You should have received a copy of the GNU General Public License
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
-import json
+import os
 import logging
+import threading
 
 from pathlib import Path
 
-from gi.repository import GObject, Gio
+from gi.repository import GLib, GObject
 
-from sttvoskmodelmanagers import stt_vosk_local_model_manager
+from sttvoskmodelmanagers import stt_vosk_local_model_manager, stt_vosk_prefetch_model, MODEL_DIRS, DOWNLOADED_MODEL_SUFFIX
+from sttsettings import stt_settings
 
 LOG_MSG=logging.getLogger()
 
+def _helper_installed_model_path(locale_str):
+    model=stt_settings().get_model(locale_str)
+    if model is None:
+        return None
+
+    if Path(model).is_absolute() == True:
+        return model if Path(model).is_dir() == True else None
+
+    if model.endswith(DOWNLOADED_MODEL_SUFFIX) == True:
+        return None
+
+    for directory in MODEL_DIRS:
+        if directory is not None and Path(directory, model).is_dir() == True:
+            return Path(directory, model)
+
+    return None
+
+def stt_vosk_model_installed(locale_str):
+    # Tells from the settings whether the model chosen for the locale is on
+    # disk. Unlike STTVoskModel it does not need the model directories to be
+    # scanned, so it is cheap enough to be called before any model is loaded.
+    return bool(_helper_installed_model_path(locale_str) is not None)
+
+def stt_vosk_model_prefetch(locale_str):
+    # Like STTVoskModel.prefetch() when there is no STTVoskModel yet
+    if stt_settings().gsettings.get_boolean("model-prefetch") == False:
+        return
+
+    stt_vosk_prefetch_model(_helper_installed_model_path(locale_str))
+
+_MODEL_SIZES={}
+
+def _helper_model_size(model_path):
+    # This is only used to compare models so cache it
+    size=_MODEL_SIZES.get(model_path)
+    if size is not None:
+        return size
+
+    size=0
+    for directory, subdirectories, files in os.walk(model_path):
+        for file in files:
+            try:
+                size+=os.path.getsize(os.path.join(directory, file))
+            except OSError:
+                continue
+
+    _MODEL_SIZES[model_path]=size
+    return size
+
+def _helper_smaller_model(current_path, candidates):
+    # Models are walked to get their size, which takes a while for large ones.
+    # candidates is a list of (path, name or path to pass to use_model()).
+    current_size=_helper_model_size(current_path)
+    best_model=None
+    best_size=0
+    for model_path, model_name in candidates:
+        size=_helper_model_size(model_path)
+        if size >= current_size or size <= best_size:
+            continue
+
+        best_size=size
+        best_model=model_name
+
+    return best_model
+
+# Rate used by most models and when it cannot be found in the model files
+DEFAULT_SAMPLE_RATE = 16000
+
+_SAMPLE_RATES={}
+
+def _helper_model_sample_rate(model_path):
+    # Models give the sample rate of the audio they were trained with in the
+    # options of their feature extraction (conf/mfcc.conf)
+    sample_rate=_SAMPLE_RATES.get(model_path)
+    if sample_rate is not None:
+        return sample_rate
+
+    sample_rate=DEFAULT_SAMPLE_RATE
+    try:
+        with open(os.path.join(model_path, "conf", "mfcc.conf")) as conf_file:
+            for line in conf_file:
+                option, separator, value=line.strip().partition("=")
+                if option == "--sample-frequency" and separator == "=":
+                    sample_rate=int(float(value))
+                    break
+    except (OSError, ValueError) as error:
+        LOG_MSG.debug("no sample rate for model %s (%s)", model_path, error)
+
+    _SAMPLE_RATES[model_path]=sample_rate
+    return sample_rate
+
 class STTVoskModel(GObject.Object):
     __gtype_name__="STTVoskModel"
 
@@ -39,8 +132,7 @@ class STTVoskModel(GObject.Object):
 
         self._locale_str=locale_str
 
-        self._settings=Gio.Settings.new("org.freedesktop.ibus.engine.stt")
-        self._settings_id=self._settings.connect("changed::vosk-models", self._models_changed)
+        self._settings_id=stt_settings().connect("model-changed", self._models_changed)
 
         self._model_name=None
         self._model_path=None
@@ -53,18 +145,14 @@ class STTVoskModel(GObject.Object):
         self._model_path_removed_id = stt_vosk_local_model_manager().connect("removed", self._model_removed_cb)
 
     def __del__(self):
+        stt_settings().disconnect(self._settings_id)
         stt_vosk_local_model_manager().disconnect(self._model_path_added_id)
         stt_vosk_local_model_manager().disconnect(self._model_path_removed_id)
         if self._model_name is None and self._model_path is not None:
             stt_vosk_local_model_manager().unregister_custom_model_path(self._model_path)
 
     def _get_model_from_settings(self):
-        models_json_string = self._settings.get_string("vosk-models")
-        if models_json_string in (None,"None",""):
-            return None
-
-        models_dict=json.loads(models_json_string)
-        return models_dict.get(self._locale_str, None)
+        return stt_settings().get_model(self._locale_str)
 
     def _set_model(self, model):
         LOG_MSG.debug("new model (%s, current path=%s / current name=%s)", model, self._model_path, self._model_name)
@@ -109,7 +197,10 @@ class STTVoskModel(GObject.Object):
         LOG_MSG.debug("model changed (valid=%i, current path=%s - current name=%s)", self._valid_model, self._model_path, self._model_name)
         self.emit("changed")
 
-    def _models_changed(self, settings, key):
+    def _models_changed(self, settings, locale_str):
+        if locale_str != self._locale_str:
+            return
+
         model=self._get_model_from_settings()
         self._set_model(model)
 
@@ -162,18 +253,109 @@ class STTVoskModel(GObject.Object):
     def get_path(self):
         return self._model_path
 
+    def get_sample_rate(self):
+        if self._valid_model == False:
+            return DEFAULT_SAMPLE_RATE
+
+        return _helper_model_sample_rate(self._model_path)
+
+    def find_smaller_model(self, callback):
+        # Look for the largest model available on this computer for our locale
+        # that is smaller than the current one. Sizes are computed in a thread
+        # and callback(self, model) is called from the main loop, with model a
+        # name or a path (for custom models) that can be passed to use_model()
+        # or None.
+        if self._model_path is None:
+            GLib.idle_add(callback, self, None)
+            return
+
+        models=stt_vosk_local_model_manager().get_models_for_locale(self._locale_str)
+        if len(self._locale_str) > 2:
+            models=models+stt_vosk_local_model_manager().get_models_for_locale(self._locale_str[:2])
+
+        candidates=[]
+        for model_desc in models:
+            model_path=model_desc.get_best_path_for_model()
+            if model_path in [None, self._model_path]:
+                continue
+
+            candidates.append((model_path, model_path if model_desc.custom == True else model_desc.name))
+
+        threading.Thread(target=self._find_smaller_model_thread,
+                         args=(self._model_path, candidates, callback),
+                         daemon=True).start()
+
+    def _find_smaller_model_thread(self, current_path, candidates, callback):
+        best_model=_helper_smaller_model(current_path, candidates)
+        LOG_MSG.debug("smaller model for %s: %s", self._locale_str, best_model)
+        GLib.idle_add(callback, self, best_model)
+
+    def use_model(self, model_name):
+        # Unlike set_name(), the change is not saved in settings
+        self._set_model(model_name)
+
+    def prefetch(self):
+        # Reads the model files ahead of time when it is about to be loaded
+        if self._valid_model == False or \
+           stt_settings().gsettings.get_boolean("model-prefetch") == False:
+            return
+
+        stt_vosk_prefetch_model(self._model_path)
+
     def set_name(self, model_name):
         self._set_model(model_name)
+        stt_settings().set_model(self._locale_str, model_name)
 
-        models_json_string = self._settings.get_string("vosk-models")
-        if models_json_string in (None,"None",""):
-            models_dict={}
-        else:
-            models_dict=json.loads(models_json_string)
+        # The engine will load it the next time recognition starts
+        self.prefetch()
+
+class STTVoskModelSnapshot(GObject.Object):
+    # The state of the models chosen for all locales, for those who need to
+    # know about many locales at once (like the list of locales of the setup
+    # tool) instead of a STTVoskModel per locale.
+    __gtype_name__="STTVoskModelSnapshot"
+
+    __gsignals__={
+        "changed": (GObject.SIGNAL_RUN_FIRST, None, ()),
+    }
+
+    def __init__(self):
+        super().__init__()
+
+        stt_settings().connect("model-changed", self._models_changed)
+        stt_vosk_local_model_manager().connect("added", self._local_models_changed)
+        stt_vosk_local_model_manager().connect("removed", self._local_models_changed)
+
+    def _models_changed(self, settings, locale_str):
+        self.emit("changed")
+
+    def _local_models_changed(self, manager, name, path):
+        self.emit("changed")
+
+    def get_name(self, locale_str):
+        # Returns None for custom models (see STTVoskModel.get_name())
+        model=stt_settings().get_model(locale_str)
+        if model is None or Path(model).is_absolute() == True:
+            return None
+
+        return model
+
+    def available(self, locale_str):
+        model=stt_settings().get_model(locale_str)
+        if model is None:
+            return False
+
+        if Path(model).is_absolute() == True:
+            return Path(model).is_dir()
+
+        return bool(stt_vosk_local_model_manager().get_best_path_for_model(model) is not None)
+
+_MODEL_SNAPSHOT = None
+
+def stt_vosk_model_snapshot():
+    global _MODEL_SNAPSHOT
 
-        models_dict[self._locale_str]=model_name
-        models_json_string=json.dumps(models_dict)
+    if _MODEL_SNAPSHOT == None:
+        _MODEL_SNAPSHOT = STTVoskModelSnapshot()
 
-        self._settings.disconnect(self._settings_id)
-        self._settings.set_string("vosk-models", models_json_string)
-        self._settings_id=self._settings.connect("changed::vosk-models", self._models_changed)
+    return _MODEL_SNAPSHOT
@@ -18,17 +18,17 @@
 
 import os
 import json
+import time
 import logging
 from re import search
 from pathlib import Path
-import urllib.request
-from enum import Enum
-import tempfile
 import shutil
-import uuid
 import threading
 
-from gi.repository import GObject, Gio, GLib
+from gi.repository import GObject, Gio
+
+from sttprofile import stt_profile_phase
+from sttdownloadmanager import stt_download_manager, DOWNLOADED_MODEL_SUFFIX
 
 LOG_MSG=logging.getLogger()
 
@@ -39,7 +39,53 @@ MODEL_DIRS = [os.getenv('VOSK_MODEL_PATH'), Path('/usr/share/vosk'), Path.home()
 MODEL_PRE_URL = 'https://alphacephei.com/vosk/models/'
 MODEL_LIST_URL = MODEL_PRE_URL + 'model-list.json'
 
-DOWNLOADED_MODEL_SUFFIX = ".downloaded_model_tmp"
+# Files of a model are not prefetched again before this delay (in seconds)
+_PREFETCH_INTERVAL = 300
+
+# Model path -> when it was last prefetched
+_PREFETCHED_PATHS = {}
+
+def _helper_prefetch_files(model_path):
+    start=time.monotonic()
+    size=0
+    for directory, subdirectories, files in os.walk(model_path):
+        for file in files:
+            try:
+                fd=os.open(os.path.join(directory, file), os.O_RDONLY)
+            except OSError:
+                continue
+
+            try:
+                if hasattr(os, "posix_fadvise") == True:
+                    # The kernel reads the file in the background
+                    os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+                else:
+                    while os.read(fd, 1048576) != b"":
+                        pass
+
+                size+=os.fstat(fd).st_size
+            except OSError as error:
+                LOG_MSG.debug("could not prefetch %s (%s)", file, error)
+            finally:
+                os.close(fd)
+
+    LOG_MSG.debug("prefetched model %s (%i bytes in %.1f ms)", model_path, size, (time.monotonic()-start)*1000)
+
+def stt_vosk_prefetch_model(model_path):
+    # Gets the files of a model in the page cache from a thread, so that vosk
+    # does not read them from disk when the pipeline is started. It is cheap
+    # if they are already there.
+    if model_path is None:
+        return
+
+    model_path=str(model_path)
+    now=time.monotonic()
+    last_prefetch=_PREFETCHED_PATHS.get(model_path)
+    if last_prefetch is not None and now-last_prefetch < _PREFETCH_INTERVAL:
+        return
+
+    _PREFETCHED_PATHS[model_path]=now
+    threading.Thread(target=_helper_prefetch_files, args=(model_path,), daemon=True).start()
 
 def _helper_locale_normalize(locale_str):
     lang=locale_str[0:2].lower()
@@ -49,12 +95,6 @@ def _helper_locale_normalize(locale_str):
     lang2=locale_str[3:5]
     return lang+"_"+lang2.upper()
 
-class STTDownloadState(float, Enum):
-    STOPPED = -1.0
-    UNKNOWN_PROGRESS = -0.5
-    UNPACKING = -0.6
-    ONGOING = 0.0
-
 class STTVoskModelDescription(GObject.Object):
     __gtype_name__="STTVoskModelDescription"
 
@@ -69,111 +109,21 @@ class STTVoskModelDescription(GObject.Object):
         self.locale=init_model.name if init_model is not None else ""
         self.url=init_model.name if init_model is not None else ""
 
-        self._operation=None
-        self.download_progress=STTDownloadState.STOPPED
-
-    def _download_finished(self):
-        # Try not to stop on ongoing operation
-        if self._operation.is_cancelled():
-            self._operation=None
+    @property
+    def progress(self):
+        # Download threads report their progress there
+        return stt_download_manager().get_channel(self.name)
 
-    def _model_downloaded_thread(self, downloaded_file, destination, status):
-        self.download_progress=STTDownloadState.UNPACKING
-
-        # Create a temporary directory
-        with tempfile.TemporaryDirectory() as tmp_dir:
-            # Unpack the archive
-            LOG_MSG.debug("unpacking model %s in, %s", downloaded_file, tmp_dir)
-            shutil.unpack_archive(downloaded_file, tmp_dir, "zip")
-
-            if status.is_cancelled() == True:
-                # Note: the directory is set to be deleted on close()
-                return
-
-            # Move the contents of the temporary directory to the right place
-            model_name=""
-            for file in os.listdir(tmp_dir):
-                if model_name != "":
-                    # This is an error
-                    LOG_MSG.error("model is composed of more than one file")
-                    break
-
-                model_name=file
-
-            model_src=os.path.join(tmp_dir, model_name)
-
-            # Make sure parent path exists
-            destination.parent.mkdir(parents=True, exist_ok=True)
-
-            # Move the unzipped model directory to directory as a temp file
-            copy_id = uuid.uuid4()
-            tmp_dst = Path(str(destination) + str(copy_id) + DOWNLOADED_MODEL_SUFFIX)
-            LOG_MSG.error("tmp model dest %s", tmp_dst)
-
-            shutil.move(model_src, tmp_dst)
-
-            if status.is_cancelled() == True:
-                shutil.rmtree(tmp_dst)
-
-            # Do an atomic rename so that when monitoring triggers a file change
-            # we are sure that directory has been properly moved since it's an
-            # atomic operation.
-            os.rename(tmp_dst, destination)
-
-            if status.is_cancelled() == True:
-                shutil.rmtree(destination)
-
-    def _download_model_thread(self, download_link, destination, status):
-        with urllib.request.urlopen(download_link) as response:
-            length_str = response.getheader('content-length')
-            blocksize = 4096
-            if length_str:
-                length = int(length_str)
-                blocksize = max(blocksize, length // 20)
-            else:
-                length=0
-
-            with tempfile.NamedTemporaryFile(delete=True) as tmp_file:
-                size=0
-                while True:
-                    if status.is_cancelled() == True:
-                        # Note: the file is set to be deleted on close()
-                        return
-
-                    buffer=response.read(blocksize)
-                    if buffer == None or len(buffer) == 0:
-                        break
-
-                    tmp_file.write(buffer)
-                    size+=len(buffer)
-                    if length != 0:
-                        self.download_progress=size/length
-                    else:
-                        self.download_progress=STTDownloadState.UNKNOWN_PROGRESS
-
-                tmp_file.flush()
-                self._model_downloaded_thread(tmp_file.name, destination, status)
-
-        self.download_progress=STTDownloadState.STOPPED
-        GLib.idle_add(self._download_finished)
+    @property
+    def downloading(self):
+        # True when queued or paused too
+        return bool(stt_download_manager().get_download(self.name) is not None)
 
     def stop_downloading(self):
-        if self._operation is not None:
-            # Do not set this to None ourselves.
-            # Let the function finish and do it.
-            self._operation.cancel()
+        stt_download_manager().cancel(self.name)
 
     def start_downloading(self):
-        if self._operation != None:
-            return
-
-        LOG_MSG.debug("start downloading model (%s)", self.url)
-
-        self.download_progress=STTDownloadState.ONGOING
-        self._operation=Gio.Cancellable()
-
-        download_thread = threading.Thread(target=self._download_model_thread, args=(self.url, Path(MODEL_DIRS[3], self.name), self._operation))
-        download_thread.start()
+        stt_download_manager().add(self.name, self.url, Path(MODEL_DIRS[3], self.name))
 
     def get_best_path_for_model(self):
         if self.paths in [None, []]:
@@ -454,7 +404,8 @@ def stt_vosk_local_model_manager():
     global _GLOBAL_LOCAL_MANAGER
 
     if _GLOBAL_LOCAL_MANAGER == None:
-        _GLOBAL_LOCAL_MANAGER = STTVoskLocalModelManager()
+        with stt_profile_phase("model manager scan"):
+            _GLOBAL_LOCAL_MANAGER = STTVoskLocalModelManager()
 
     return _GLOBAL_LOCAL_MANAGER
 
@@ -494,6 +445,8 @@ class STTVoskOnlineModelManager(GObject.Object):
         # Get the file with all models that can be downloaded
         LOG_MSG.debug("getting online list of models")
 
+        import urllib.request
+
         try:
             with urllib.request.urlopen(MODEL_LIST_URL, timeout=3) as response:
                 json_str=response.read()
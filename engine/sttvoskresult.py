@@ -0,0 +1,138 @@
+# vim:set et sts=4 sw=4:
+#
+# ibus-stt - Speech To Text engine for IBus
+# Copyright (C) 2022 Philippe Rouquier <bonfire-app@wanadoo.fr>
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import logging
+
+from array import array
+from enum import Enum
+
+LOG_MSG=logging.getLogger()
+
+# Vosk sends JSON strings: {"partial" : "..."}, {"text" : "..."} or
+# {"alternatives" : [{..., "text" : "..."}, ...]}. When words are enabled,
+# there is also a "result" (or "partial_result") array with one object per
+# word: {"conf" : ..., "end" : ..., "start" : ..., "word" : "..."}.
+# They are decoded into typed results so that callers do not depend on this
+# format.
+
+class STTVoskResultType(Enum):
+    PARTIAL = 1
+    TEXT = 2
+    ALTERNATIVES = 3
+
+# Words whose confidence is below this are considered uncertain
+UNCERTAIN_CONFIDENCE = 0.6
+
+class STTVoskWords():
+    # Word results are stored in arrays rather than in one object per word.
+    # Times are in seconds from the start of the stream.
+    __slots__=("words", "starts", "ends", "confidences")
+
+    def __init__(self):
+        self.words=[]
+        self.starts=array("f")
+        self.ends=array("f")
+        self.confidences=array("f")
+
+    def __len__(self):
+        return len(self.words)
+
+    def append(self, word, start, end, confidence):
+        self.words.append(word)
+        self.starts.append(start)
+        self.ends.append(end)
+        self.confidences.append(confidence)
+
+    @property
+    def duration(self):
+        if not self.words:
+            return 0.0
+
+        return self.ends[-1] - self.starts[0]
+
+    def uncertain_tail(self, threshold=UNCERTAIN_CONFIDENCE):
+        # Returns the index of the first word of the (possibly empty) sequence
+        # of uncertain words that ends the result.
+        word_i=len(self.words)
+        while word_i > 0 and self.confidences[word_i - 1] < threshold:
+            word_i -= 1
+
+        return word_i
+
+class STTVoskResult():
+    __slots__=("type", "text", "alternatives", "words")
+
+    def __init__(self, result_type, text="", alternatives=None, words=None):
+        self.type=result_type
+        self.text=text
+        self.alternatives=alternatives if alternatives is not None else []
+        self.words=words
+
+def _helper_words_from_list(json_words):
+    if json_words is None:
+        return None
+
+    words=STTVoskWords()
+    for json_word in json_words:
+        words.append(json_word.get("word", ""),
+                     json_word.get("start", 0.0),
+                     json_word.get("end", 0.0),
+                     json_word.get("conf", 1.0))
+
+    return words
+
+def stt_vosk_result_decode(json_text):
+    if json_text in [None,""]:
+        LOG_MSG.debug("empty json answer")
+        return None
+
+    LOG_MSG.debug("JSON string %s", json_text)
+
+    try:
+        # Catch ill-formatted strings
+        json_data = json.loads(json_text)
+
+    except json.JSONDecodeError:
+        LOG_MSG.error("the format of the JSON string is not correct")
+        return None
+
+    partial_text = json_data.get("partial")
+    if partial_text is not None:
+        return STTVoskResult(STTVoskResultType.PARTIAL,
+                             text=partial_text,
+                             words=_helper_words_from_list(json_data.get("partial_result")))
+
+    text = json_data.get("text")
+    if text is not None:
+        return STTVoskResult(STTVoskResultType.TEXT,
+                             text=text,
+                             words=_helper_words_from_list(json_data.get("result")))
+
+    json_alternatives = json_data.get("alternatives")
+    if json_alternatives is not None:
+        text_alternatives = []
+        for alternative_iter in json_alternatives:
+            text = alternative_iter.get("text")
+            if text not in [None,""]:
+                text_alternatives.append(text.lstrip())
+
+        return STTVoskResult(STTVoskResultType.ALTERNATIVES, alternatives=text_alternatives)
+
+    LOG_MSG.error("unreadable json answer")
+    return None
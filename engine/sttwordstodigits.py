@@ -20,9 +20,9 @@ import logging
 
 from pathlib import Path
 
-from babel import Locale
-
 from sttcurrentlocale import stt_current_locale
+from sttnumbersgrammar import stt_numbers_grammar_load
+from sttprofile import stt_profile_phase
 
 from sttutils import stt_utils_get_system_data_path
 
@@ -33,6 +33,68 @@ from sttutils import stt_utils_get_system_data_path
 
 LOG_MSG=logging.getLogger()
 
+# Word classes and roles are not enums since getting the members of an enum
+# is slow and they are used for each word that is parsed.
+
+class STTWordClass():
+    # Not a number (it can still be a word to ignore or the decimal separator)
+    NONE    = 0
+    ZERO    = 1
+    # 1 to 9
+    UNIT    = 2
+    # 10 to 99
+    TEN     = 3
+    HUNDRED = 4
+    # thousand, million...
+    MEASURE = 5
+    # Other numbers, like 200 in one word in some languages: they are the
+    # first word of a group of three digits, as hundreds
+    OTHER   = 6
+
+class STTWordRole():
+    # What a word means when it comes after a number
+    NONE     = 0
+    PERCENT  = 1
+    CURRENCY = 2
+    # Cents of a currency
+    SUBUNIT  = 3
+    MONTH    = 4
+    # After a clock time ("p m", "o'clock")
+    TIME     = 5
+    # Between hours and minutes ("heures" in French)
+    HOURS    = 6
+
+class STTNumberWord():
+    # Everything the parser needs to know about a word, computed once when
+    # the grammar is loaded so that parsing only needs one lookup per word.
+    __slots__=("word", "word_class", "value", "ordinal", "ignore_after", "separator",
+               "role", "data", "phrases")
+
+    def __init__(self, word, word_class, value=None, ordinal=False, ignore_after=None, separator=False):
+        # word is the word once replaced (for example "one" for "a")
+        self.word=word
+        self.word_class=word_class
+        self.value=value
+        # An ordinal ends the number it belongs to
+        self.ordinal=ordinal
+        # Words after which this word can be ignored (like "and" in "one
+        # hundred and one")
+        self.ignore_after=ignore_after
+        self.separator=separator
+        # The format (or the number of subunits) that goes with the role
+        self.role=STTWordRole.NONE
+        self.data=None
+        # Replacements and roles made of several words starting with this word
+        self.phrases=None
+
+    def copy(self):
+        number_word=STTNumberWord(self.word, self.word_class, self.value,
+                                  self.ordinal, self.ignore_after, self.separator)
+        number_word.role=self.role
+        number_word.data=self.data
+        number_word.phrases=self.phrases
+        return number_word
+
 class STTWordNode(dict):
     def __init__(self, depth=0):
         super().__init__()
@@ -40,53 +102,190 @@ class STTWordNode(dict):
         self.depth=depth
 
 class STTWordsToDigits():
-    def __init__(self):
-        self._current_locale=stt_current_locale()
+    def __init__(self, current_locale=None, data_path=None):
+        if current_locale == None:
+            self._current_locale=stt_current_locale()
+        else:
+            self._current_locale=current_locale
+
+        if data_path == None:
+            self._data_path=Path(stt_utils_get_system_data_path(), "numbers")
+        else:
+            self._data_path=data_path
+
         self._current_locale.connect("changed", self._current_locale_changed_cb)
         self._init_for_locale()
 
     def _reset(self):
         self._separator_symbol=None
-        self._separator=None
-        self._root=STTWordNode()
-
-        self._measures={}
-        self._ignore={}
-        self._w2n={}
-        self._n2w={}
+        self._words={}
+        self._values=frozenset()
+
+        self._ordinal_suffixes={}
+        self._ordinal_endings=[]
+        self._currency_and=None
+        self._12h_time_first_words=frozenset()
+        self._12h_time_formats=frozenset()
+        self._time_zero_words=frozenset()
+        self._duration_words=frozenset()
+        self._date_format=None
+        self._date_of=None
+        self._date_cardinal_day=False
 
         self.can_use_digits=False
 
+    def _classify(self, word, grammar, measures):
+        value=grammar["numbers"].get(word)
+        ordinal=False
+        if value is None:
+            value=grammar["ordinals"].get(word)
+            ordinal=bool(value is not None)
+
+        if value is None:
+            word_class=STTWordClass.NONE
+        elif value == 0:
+            word_class=STTWordClass.ZERO
+        elif 1 <= value < 10:
+            word_class=STTWordClass.UNIT
+        elif 10 <= value < 100:
+            word_class=STTWordClass.TEN
+        elif value == 100:
+            word_class=STTWordClass.HUNDRED
+        elif value in measures:
+            word_class=STTWordClass.MEASURE
+        else:
+            word_class=STTWordClass.OTHER
+
+        ignore_after=grammar["ignore"].get(word)
+        if ignore_after is not None:
+            ignore_after=frozenset(ignore_after)
+
+        return STTNumberWord(word, word_class, value, ordinal, ignore_after,
+                             bool(word == grammar["point"]))
+
+    def _add_to_phrases(self, words, value, phrases):
+        node=phrases.get(words[0])
+        if node == None:
+            node=STTWordNode(1)
+            phrases[words[0]]=node
+
+        for word in words[1:]:
+            child=node.get(word)
+            if child == None:
+                child=STTWordNode(node.depth+1)
+                node[word]=child
+
+            node=child
+
+        if node.value != None:
+            LOG_MSG.debug("node already exists")
+            return
+
+        node.value=value
+
     def _init_for_locale(self):
         self._reset()
 
-        file_path=Path(stt_utils_get_system_data_path(), "numbers",
-                       "config_"+self._current_locale.locale[:2]+".properties")
-
         LOG_MSG.debug("loading configuration file for locale (%s)",
                       self._current_locale.locale[:2])
         try:
-            with file_path.open() as locale_file:
-                for line in locale_file:
-                    if line == "" or line.startswith("#") == True:
+            with stt_profile_phase("number grammar load"):
+                grammar=stt_numbers_grammar_load(self._data_path,
+                                                 self._current_locale.locale)
+
+            measures=set(int(value) for value in grammar["measures"])
+
+            # Classify all the words the parser may have to deal with
+            canonical_words={}
+            for word in list(grammar["numbers"])+list(grammar["ordinals"])+list(grammar["ignore"])+[grammar["point"]]:
+                if word is not None and word not in canonical_words:
+                    canonical_words[word]=self._classify(word, grammar, measures)
+
+            def get_canonical_word(word):
+                number_word=canonical_words.get(word)
+                if number_word is None:
+                    number_word=self._classify(word, grammar, measures)
+                    canonical_words[word]=number_word
+
+                return number_word
+
+            # Replacements of one word are merged into the table, the (rare)
+            # ones made of several words are kept in trees hanging from their
+            # first word.
+            replaced={}
+            phrases={}
+
+            # Words that give a meaning to the number before them
+            roles=[(grammar["percent"], STTWordRole.PERCENT),
+                   (grammar["currencies"], STTWordRole.CURRENCY),
+                   (grammar["subunits"], STTWordRole.SUBUNIT),
+                   (grammar["months"], STTWordRole.MONTH),
+                   (grammar["time"], STTWordRole.TIME),
+                   (grammar["hours"], STTWordRole.HOURS)]
+            for role_dict, role in roles:
+                for key, data in role_dict.items():
+                    words=key.split()
+                    if len(words) == 1:
+                        number_word=get_canonical_word(words[0]).copy()
+                        canonical_words[words[0]]=number_word
+                    else:
+                        number_word=STTNumberWord(" ".join(words), STTWordClass.NONE)
+                        self._add_to_phrases(words, number_word, phrases)
+
+                    number_word.role=role
+                    number_word.data=data
+
+            for key, value in grammar["replace"]:
+                words=key.split()
+                if words == []:
+                    continue
+
+                if len(words) == 1:
+                    if words[0] in replaced:
+                        LOG_MSG.debug("node already exists")
                         continue
 
-                    (key, value)=line.split("=")
-                    if key.startswith("replace:"):
-                        key=key[len("replace:"):]
-                        self._add_to_replace_tree(key, value.strip())
-                    elif key.startswith("measure:"):
-                        key=key[len("measure"):]
-                        self._measures[int(value.strip())]=key
-                    elif key.startswith("ignore:"):
-                        key=key[len("ignore:"):]
-                        self._ignore[key]=list(value.strip().split(","))
-                    elif key.startswith("point"):
-                        self._separator=value.strip()
-                    else:
-                        value=int(value)
-                        self._w2n[key]=value
-                        self._n2w[value]=key
+                    replaced[words[0]]=get_canonical_word(value)
+                else:
+                    self._add_to_phrases(words, get_canonical_word(value), phrases)
+
+            self._words={word: number_word for word, number_word in canonical_words.items()
+                         if number_word.word_class != STTWordClass.NONE or
+                            number_word.ignore_after is not None or
+                            number_word.separator == True or
+                            number_word.role != STTWordRole.NONE}
+            self._words.update(replaced)
+
+            for word, node in phrases.items():
+                number_word=self._words.get(word)
+                if number_word is None:
+                    number_word=STTNumberWord(word, STTWordClass.NONE)
+                else:
+                    number_word=number_word.copy()
+
+                number_word.phrases=node
+                self._words[word]=number_word
+
+            self._values=frozenset(grammar["numbers"].values())
+            self._separator_symbol=grammar["decimal"]
+
+            for key, suffix in grammar["ordinal-suffixes"].items():
+                if key.startswith("*"):
+                    self._ordinal_endings.append((key[1:], suffix))
+                else:
+                    self._ordinal_suffixes[key]=suffix
+
+            # Longest endings first
+            self._ordinal_endings.sort(key=lambda ending: len(ending[0]), reverse=True)
+
+            self._currency_and=grammar["currency-and"]
+            self._12h_time_first_words=frozenset(key.split()[0] for key in grammar["time-12h"])
+            self._12h_time_formats=frozenset(grammar["time"][key] for key in grammar["time-12h"])
+            self._time_zero_words=frozenset(grammar["time-zero"])
+            self._duration_words=frozenset(grammar["duration-words"])
+            self._date_format=grammar["date-format"]
+            self._date_of=grammar["date-of"]
+            self._date_cardinal_day=grammar["date-cardinal-day"]
 
         except:
             LOG_MSG.debug("could not load configuration file for locale (%s)",
@@ -94,65 +293,44 @@ class STTWordsToDigits():
             self._reset()
             return
 
-
-        self._separator_symbol=Locale(self._current_locale.locale).number_symbols['decimal']
         self.can_use_digits=True
 
     def _current_locale_changed_cb(self, current_locale):
         LOG_MSG.debug("update number parsing module for new locale")
         self._init_for_locale()
 
-    def _add_to_node(self, word_iter, parent, depth):
-        depth += 1
-        word = next(word_iter, None)
-        if word is None:
-            # Reached the end.
-            return parent
-
-        child=parent.get(word)
-        if child == None:
-            child = STTWordNode(depth)
-            parent[word] = child
-
-        return self._add_to_node(word_iter, child, depth)
-
-    def _add_to_replace_tree(self, key, value):
-        words=key.split()
-        if words == None:
-            return
-
-        word_iter=iter(words)
-
-        # Note: node is always created
-        node=self._add_to_node(word_iter, self._root, 0)
-        if node.value != None:
-            LOG_MSG.debug("node already exists")
-            return
-
-        node.value=value
+    def _find_phrase(self, words, word_i, number_word):
+        # Returns the longest phrase starting at word_i or number_word
+        node=number_word.phrases
+        found=None
+        word_i += 1
+        while word_i < len(words):
+            node=node.get(words[word_i])
+            if node == None:
+                break
 
-    def _find_node(self, words, word_i, node):
-        word = words[word_i]
-        node_next = node.get(word)
-        if node_next == None:
             if node.value is not None:
-                return node
+                found=node
 
-            return None
+            word_i += 1
 
-        word_i += 1
-        if word_i < len(words):
-            # We haven't reached the end of the utterance
-            return_node = self._find_node(words, word_i, node_next)
-            if return_node != None:
-                return return_node
+        if found is None:
+            return number_word, 1
 
-        if node_next.value is not None:
-            return node_next
+        return found.value, found.depth
 
-        return None
+    def _lookup(self, words, word_i):
+        number_word=self._words.get(words[word_i])
+        if number_word is None or number_word.phrases is None:
+            return number_word, 1
 
-    def parse(self, parser, words, word_i):
+        return self._find_phrase(words, word_i, number_word)
+
+    def _parse_number(self, words, word_i, number_word, depth):
+        # number_word and depth are what _lookup() returned for word_i.
+        # Returns None or (end, number string, value, ordinal, next word,
+        # depth of next word) where value is None for decimal numbers and the
+        # next word is what _lookup() returns for end.
         max_word_num=len(words)
 
         # What follows is adapted from original function
@@ -160,117 +338,169 @@ class STTWordsToDigits():
         new_word_radix=0
         new_word_ignore=0
 
-        previous_word=""
-        word=""
+        previous_word=None
 
         decimal_prefix=""
         integer_part=-1
         temp_value=0
         result=0
+        last_measure=0
+        leading_zero=False
+        ordinal=False
 
+        lookup_i=word_i
         while new_word_i < max_word_num:
-            previous_word=word
-            node=self._find_node(words, new_word_i, self._root)
-            word=node.value if node != None else words[new_word_i]
+            if new_word_i != lookup_i:
+                # Same as _lookup() without a call for each word
+                number_word=self._words.get(words[new_word_i])
+                depth=1
+                if number_word is not None and number_word.phrases is not None:
+                    number_word, depth=self._find_phrase(words, new_word_i, number_word)
+
+                lookup_i=new_word_i
+
+            if number_word is None:
+                break
 
-            if previous_word != "":
+            if previous_word is not None:
                 # Ignore some words (for example "and" in "one hundred and one")
-                words_before=self._ignore.get(word, None)
-                if new_word_ignore == 0 and words_before != None:
+                if new_word_ignore == 0 and number_word.ignore_after is not None:
                     # See that the previous number matches what should come before
-                    if previous_word not in words_before:
+                    if previous_word.word not in number_word.ignore_after:
                         break
 
                     LOG_MSG.debug("reached word to ignore")
 
                     # Make sure there is a number to parse afterwards
                     new_word_ignore=new_word_i
-                    new_word_i += 1 if node is None else node.depth
+                    new_word_i += depth
+                    previous_word=number_word
                     continue
 
                 # Deal with the decimal separator but only once
-                if new_word_radix == 0 and word == self._separator:
+                if new_word_radix == 0 and number_word.separator == True:
                     LOG_MSG.debug("reached radix")
 
                     # Make sure there is a number to parse afterwards
                     new_word_radix=new_word_i
-                    new_word_i += 1 if node is None else node.depth
+                    new_word_i += depth
+                    previous_word=number_word
 
                     integer_part=result+temp_value
                     temp_value=0
                     result = 0
+                    last_measure=0
+                    leading_zero=False
                     continue
 
-            # Find value
-            word_value=self._w2n.get(word, None)
-            if word_value == None:
+            # Only the decimal separator can follow a zero that starts a number
+            if leading_zero == True:
                 break
 
-            # A few rules to know where to stop
-            if word_value == 0:
-                if integer_part == -1:
-                    # for integer part, only accept 0 if it is the first number
-                    if result == 0 and temp_value == 0:
-                        new_word_i += 1 if node is None else node.depth
+            # No ordinal after the decimal separator
+            if number_word.ordinal == True and integer_part != -1:
+                break
 
-                    break
+            word_class=number_word.word_class
+            word_value=number_word.value
 
-                if result != 0 or temp_value != 0:
-                    break
+            # After the decimal separator, "one four" is 14
+            decimal_digit=bool(integer_part != -1 and
+                               previous_word.word_class in (STTWordClass.ZERO, STTWordClass.UNIT))
 
-                decimal_prefix += "0"
-            elif word_value in range(1,10):
-                # A unit cannot be preceded by a unit except 0 by itself
-                if (temp_value % 10) != 0:
-                    LOG_MSG.debug("number break 1")
-                    break
+            # A few rules to know where to stop
+            if word_class == STTWordClass.UNIT:
+                if decimal_digit == True:
+                    temp_value=temp_value*10+word_value
+                else:
+                    # A unit cannot be preceded by a unit except 0 by itself
+                    if (temp_value % 10) != 0:
+                        LOG_MSG.debug("number break 1")
+                        break
 
-                # For cases like "10 2" which is not 12
-                temp_value_mod100=temp_value % 100
-                if temp_value_mod100 != 0 and \
-                   self._n2w.get(temp_value_mod100+word_value, None) is not None:
-                    LOG_MSG.debug("number break 2")
-                    break
+                    # For cases like "10 2" which is not 12
+                    temp_value_mod100=temp_value % 100
+                    if temp_value_mod100 != 0 and \
+                       (temp_value_mod100+word_value) in self._values:
+                        LOG_MSG.debug("number break 2")
+                        break
 
-                temp_value+=word_value
-            elif word_value in range(10,100):
+                    temp_value+=word_value
+            elif word_class == STTWordClass.TEN:
                 if (temp_value % 100) != 0:
                     LOG_MSG.debug("number break 3")
                     break
 
                 temp_value+=word_value
-            elif word_value == 100:
-                if temp_value not in range(0,10):
+            elif word_class == STTWordClass.HUNDRED:
+                if temp_value >= 10:
                     LOG_MSG.debug("number break 4")
                     break
 
                 temp_value=100 if temp_value == 0 else temp_value*100
-            elif word_value in self._measures:
-                # Check that these words appear in the right sequence and only
-                # once.
-                if (result % (word_value*1000)) != 0:
+            elif word_class == STTWordClass.MEASURE:
+                # Check that these words appear in decreasing order (they are
+                # not always 1000 apart, think of lakh and crore)
+                if last_measure != 0 and word_value >= last_measure:
                     LOG_MSG.debug("number break 5")
                     break
 
+                last_measure=word_value
+
                 if temp_value != 0:
                     result+=temp_value*word_value
                     temp_value=0
                 else:
                     result+=word_value
+            elif word_class == STTWordClass.ZERO:
+                if integer_part == -1:
+                    # for integer part, only accept 0 if it is the first number
+                    if result != 0 or temp_value != 0:
+                        break
+
+                    leading_zero=True
+                elif decimal_digit == True and (result != 0 or temp_value != 0):
+                    temp_value*=10
+                elif result != 0 or temp_value != 0:
+                    break
+                else:
+                    decimal_prefix += "0"
+            elif word_class == STTWordClass.OTHER:
+                if temp_value != 0:
+                    LOG_MSG.debug("number break 6")
+                    break
+
+                temp_value=word_value
+            elif word_class == STTWordClass.NONE:
+                break
 
             new_word_ignore=0
-            new_word_i += 1 if node is None else node.depth
+            if number_word.ordinal == True:
+                # Nothing comes after an ordinal
+                ordinal=True
+                new_word_i += depth
+                break
+
+            previous_word=number_word
+            new_word_i += depth
+
+        # No number after a word to ignore, like "and" in "five hundred and cats"
+        if new_word_ignore != 0:
+            new_word_i=new_word_ignore
 
         if word_i == new_word_i:
-            return word_i
+            return None
 
         result+=temp_value
+        value=result
         if integer_part != -1:
             # if result == 0 then move back before the decimal point
             if result == 0:
                 new_word_i=new_word_radix
                 number_string=str(integer_part)
+                value=integer_part
             else:
+                value=None
                 number_string=str(integer_part) + \
                               self._separator_symbol + \
                               decimal_prefix + \
@@ -280,6 +510,269 @@ class STTWordsToDigits():
         else:
             number_string=str(result)
 
+        # Callers need to know what comes next, avoid looking it up again
+        if new_word_i >= max_word_num:
+            number_word, depth=None, 1
+        elif new_word_i != lookup_i:
+            number_word, depth=self._lookup(words, new_word_i)
+
+        return new_word_i, number_string, value, ordinal, number_word, depth
+
+    def _get_ordinal_string(self, value):
+        value_string=str(value)
+        suffix=self._ordinal_suffixes.get(value_string)
+        if suffix is None:
+            for ending, ending_suffix in self._ordinal_endings:
+                if value_string.endswith(ending):
+                    suffix=ending_suffix
+                    break
+            else:
+                suffix=self._ordinal_suffixes.get("", "")
+
+        return value_string+suffix
+
+    def _parse_subunit(self, words, word_i):
+        # "and twenty cents" after an amount. Returns None or (end, cents,
+        # number of cents in a unit).
+        if word_i < len(words) and words[word_i] == self._currency_and:
+            word_i += 1
+
+        if word_i >= len(words):
+            return None
+
+        number_word, depth=self._lookup(words, word_i)
+        number=self._parse_number(words, word_i, number_word, depth)
+        if number is None:
+            return None
+
+        end, number_string, cents, ordinal, subunit, depth=number
+        # Cents are a whole number ("two point five cents" is not)
+        if cents is None or ordinal == True:
+            return None
+
+        if subunit is None or subunit.role != STTWordRole.SUBUNIT or cents >= subunit.data:
+            return None
+
+        return end+depth, cents, subunit.data
+
+    def _parse_minutes(self, words, word_i):
+        # Minutes before the words of the 12-hour clock: "thirty" or "oh five"
+        # but not "five" (think of "one two three o'clock"). Returns None or
+        # (end, minutes, next word, depth of next word).
+        if word_i >= len(words):
+            return None
+
+        number_word, depth=self._lookup(words, word_i)
+        if words[word_i] in self._time_zero_words or \
+           (number_word is not None and number_word.word_class == STTWordClass.ZERO):
+            word_i += depth
+            if word_i >= len(words):
+                return None
+
+            number_word, depth=self._lookup(words, word_i)
+            if number_word is None or number_word.word_class != STTWordClass.UNIT or \
+               number_word.ordinal == True:
+                return None
+
+            end=word_i+depth
+            next_word, next_depth=self._lookup(words, end) if end < len(words) else (None, 1)
+            return end, number_word.value, next_word, next_depth
+
+        if number_word is None or number_word.word_class == STTWordClass.NONE:
+            return None
+
+        minutes=self._parse_number(words, word_i, number_word, depth)
+        if minutes is None:
+            return None
+
+        end, number_string, value, ordinal, next_word, next_depth=minutes
+        if value is None or ordinal == True or value < 10 or value >= 60:
+            return None
+
+        return end, value, next_word, next_depth
+
+    def _parse_time(self, words, word_i, time_word, depth, hours):
+        # What comes after the hours of a clock time (time_word, None for a
+        # word of time-zero). Returns None or (end, text).
+        if time_word is not None and time_word.role == STTWordRole.TIME:
+            # "three o'clock", "five p m"
+            if self._is_hours(time_word, hours) == False:
+                return None
+
+            return word_i+depth, time_word.data.format(hours=hours, minutes="00")
+
+        if time_word is not None and time_word.role == STTWordRole.HOURS:
+            # "trois heures [trente]"
+            hours_word=time_word
+            word_i += depth
+            if word_i >= len(words):
+                return word_i, hours_word.data.format(hours=hours, minutes="00")
+
+            time_word, depth=self._lookup(words, word_i)
+            if time_word is None or time_word.word_class == STTWordClass.NONE:
+                return word_i, hours_word.data.format(hours=hours, minutes="00")
+
+            minutes=self._parse_number(words, word_i, time_word, depth)
+            if minutes is None:
+                return word_i, hours_word.data.format(hours=hours, minutes="00")
+
+            end, number_string, value, ordinal, time_word, depth=minutes
+            if value is None or ordinal == True or value >= 60:
+                # "trois heures quatre-vingt-dix" is not a time
+                return None
+
+            return end, hours_word.data.format(hours=hours, minutes="%02i" % value)
+
+        # "three thirty" is only a time when followed by "p m" for example
+        minutes=self._parse_minutes(words, word_i)
+        if minutes is None:
+            return None
+
+        end, value, time_word, depth=minutes
+        if time_word is None or time_word.data not in self._12h_time_formats or \
+           self._is_hours(time_word, hours) == False:
+            return None
+
+        return end+depth, time_word.data.format(hours=hours, minutes="%02i" % value)
+
+    def _is_hours(self, time_word, hours):
+        # "thirteen p m" is not a time
+        if time_word.data in self._12h_time_formats:
+            return bool(hours >= 1 and hours <= 12)
+
+        return True
+
+    def _may_be_time(self, words, word_i, hours):
+        # Only the words of the 12-hour clock follow minutes. Minutes are one
+        # or two words, check one of these words comes after them before
+        # parsing them (think of phone numbers).
+        if self._12h_time_first_words == frozenset() or hours is None or hours < 1 or hours > 12:
+            return False
+
+        for word in words[word_i+1:word_i+3]:
+            if word in self._12h_time_first_words:
+                return True
+
+        return False
+
+    def _parse_after_number(self, words, word_i, next_word, depth, number_string, value, ordinal,
+                            duration=False):
+        # Percentages, amounts, dates and clock times (next_word is the word
+        # at word_i). duration is True when the number comes after a word like
+        # "pendant". Returns None or (end, text).
+
+        # "twenty first of march"
+        date_of=0
+        if next_word is None and words[word_i] == self._date_of and word_i+1 < len(words):
+            next_word, depth=self._lookup(words, word_i+1)
+            date_of=1
+            if next_word is None or next_word.role != STTWordRole.MONTH:
+                return None
+
+        if next_word is None:
+            return None
+
+        role=next_word.role
+        if role == STTWordRole.MONTH:
+            if value is None or value < 1 or value > 31 or self._date_format is None or \
+               (ordinal == False and self._date_cardinal_day == False):
+                return None
+
+            day=self._get_ordinal_string(value) if ordinal == True else number_string
+            return word_i+date_of+depth, self._date_format.format(day=day, month=next_word.data)
+
+        if ordinal == True:
+            return None
+
+        if role == STTWordRole.PERCENT:
+            return word_i+depth, next_word.data.format(number=number_string)
+
+        if role == STTWordRole.CURRENCY:
+            end=word_i+depth
+            subunit=self._parse_subunit(words, end) if value is not None else None
+            if subunit is not None:
+                end, cents, ratio=subunit
+                number_string=str(value)+self._separator_symbol+str(cents).zfill(len(str(ratio))-1)
+
+            return end, next_word.data.format(number=number_string)
+
+        if value is None or value > 24 or duration == True:
+            return None
+
+        return self._parse_time(words, word_i, next_word, depth, value)
+
+    def parse(self, parser, words, word_i):
+        number_word=self._words.get(words[word_i])
+        if number_word is None:
+            return word_i
+
+        depth=1
+        if number_word.phrases is not None:
+            number_word, depth=self._find_phrase(words, word_i, number_word)
+
+        if number_word.role == STTWordRole.MONTH:
+            return self._parse_month_first(parser, words, word_i, depth, number_word)
+
+        number=self._parse_number(words, word_i, number_word, depth)
+        if number is None:
+            return word_i
+
+        new_word_i, number_string, value, ordinal, next_word, depth=number
+
+        # "pendant trois heures" is not a clock time
+        duration=bool(word_i > 0 and words[word_i-1] in self._duration_words)
+
+        # Only look further when the next word can follow a number: most of
+        # the time it is another number or a word that is not in the table.
+        after_number=None
+        if next_word is not None:
+            if next_word.role != STTWordRole.NONE or \
+               (next_word.word_class != STTWordClass.NONE and self._may_be_time(words, new_word_i, value) == True):
+                after_number=self._parse_after_number(words, new_word_i, next_word, depth,
+                                                      number_string, value, ordinal, duration)
+        elif new_word_i < len(words):
+            if words[new_word_i] == self._date_of:
+                after_number=self._parse_after_number(words, new_word_i, next_word, depth,
+                                                      number_string, value, ordinal)
+            elif words[new_word_i] in self._time_zero_words and ordinal == False and \
+                 self._may_be_time(words, new_word_i, value) == True:
+                # "twelve oh five p m"
+                after_number=self._parse_time(words, new_word_i, None, 1, value)
+
+        if after_number is not None:
+            new_word_i, number_string=after_number
+        elif ordinal == True:
+            # Like in "at first", leave small ordinals as words
+            if value < 10:
+                return word_i
+
+            number_string=self._get_ordinal_string(value)
+
         LOG_MSG.debug("final number string %s", number_string)
         parser.add_words(number_string)
         return new_word_i
+
+    def _parse_month_first(self, parser, words, word_i, depth, month_word):
+        # "march twenty first": the day must be an ordinal since months can
+        # also be words ("may").
+        day_i=word_i+depth
+        if self._date_format is None or day_i >= len(words):
+            return word_i
+
+        number_word, depth=self._lookup(words, day_i)
+        if number_word is None or number_word.word_class == STTWordClass.NONE:
+            return word_i
+
+        number=self._parse_number(words, day_i, number_word, depth)
+        if number is None:
+            return word_i
+
+        new_word_i, number_string, value, ordinal, next_word, depth=number
+        if ordinal == False or value < 1 or value > 31:
+            return word_i
+
+        date_string=self._date_format.format(day=self._get_ordinal_string(value),
+                                             month=month_word.data)
+        LOG_MSG.debug("final date string %s", date_string)
+        parser.add_words(date_string)
+        return new_word_i